@@ -1,8 +1,15 @@
+import os
 import socket
+import sys
 from threading import Thread
 
 from Car import Car
 
+# the command router and the text parser are shared with the homework2 server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "homework2"))
+from Codec import TextCodec
+from CommandRouter import OWNER, REGISTERED, CommandRouter
+
 
 class Server:
     def __init__(self, host, port):
@@ -16,6 +23,9 @@ class Server:
                      Car("Mercedes", "E200", 2018, 120, 13, 3)]
         self.clients_type = [None] * 1000
         self.client_id_counter = 0
+        self.codec = TextCodec()
+        self.router = CommandRouter()
+        self.register_commands()
 
     def start(self):
         self.server_socket.bind((self.host, self.port))
@@ -28,127 +38,125 @@ class Server:
             client_handler = Thread(target=self.handle_client, args=(client_socket,))
             client_handler.start()
 
+    def register_commands(self):
+        router = self.router
+        router.register("end_Rental", self.end_rental)
+        router.register("register_Renter", self.register_renter)
+        router.register("register_Owner", self.register_owner)
+        router.register("owner_Id", self.login_owner)
+        router.register("change_Price", self.change_price, OWNER)
+        router.register("set_Price", self.set_price, OWNER)
+        router.register("post_Car", self.post_car, REGISTERED)
+        router.register("request_Car", self.request_car, REGISTERED)
+        router.register("start_Engine", self.start_engine, REGISTERED)
+        router.register("unlock_Car", self.unlock_car, REGISTERED)
+        router.register("lock_Car", self.lock_car, REGISTERED)
+        router.register("pay_Rental", self.pay_rental, REGISTERED)
+        router.register("car_Id", self.rent_car, REGISTERED)
+
     def handle_client(self, client_socket):
         client_id = self.client_id_counter + 1
         self.client_id_counter += 1
         self.clients_type[client_id] = None
 
-        if True:
-            try:
-                client_id = self.client_id_counter
-                self.clients_type[client_id] = None
-                while True:
-                    client_message = client_socket.recv(1024).decode()
-                    print(f"[Client]: {client_message}")
-                    print(f"[Client]: {client_id}")
-                    if client_message == "end_Rental":
-                        print("test")
-                        for car in self.cars:
-                            if car.user_id == client_id and car.paid == 1:
-                                print("test2")
-                                print(car.id)
-                                print(car.paid)
-                                car.user_id = None
-                                car.availability = 1
-                                car.paid = 0
-                                print("[Server]: Rental ended.")
-                                server_message = "Rental ended."
-                                client_socket.send(server_message.encode())
-                                break
-                            else:
-                                server_message = "You have to pay the rental first."
-
-                    elif client_message == "register_Renter":
-                        server_message = "You are registered as a renter."
-                        self.clients_type[client_id] = "renter"
-
-                    elif client_message == "register_Owner":
-                        server_message = "Enter the Owner Id like this: 'owner_Id: id' "
-
-                    elif client_message.startswith("owner_Id"):
-                        owner_id = int(client_message.split(":")[1])
-                        server_message = "You are registered as an owner. Your cars are: \n"
-                        for car in self.cars:
-                            if car.owner_id == owner_id:
-                                server_message += f"{car.to_dict()}\n"
-                        if server_message == "You are registered as an owner. Your cars are: \n":
-                            server_message = "No cars found."
-                        else:
-                            self.clients_type[client_id] = "owner"
-
-                    elif client_message == "change_Price" and self.clients_type[client_id] == "owner":
-                        server_message = "Enter the Id of the car and the new price like this: 'owner_Id: car_Id: new_price'"
-
-                    elif client_message[0].isdigit() and self.clients_type[client_id] == "owner":
-                        owner_id, car_id, new_price = client_message.split(":")
-                        car_id = int(car_id)
-                        new_price = int(new_price)
-                        ok=0
-                        for car in self.cars:
-                            if car.id == car_id and car.owner_id == int(owner_id):
-                                car.price = new_price
-                                server_message = "Price changed."
-                                ok=1
-                        if ok == 0:
-                            server_message = "Car not found."
-
-                    elif client_message == "post_Car" and self.clients_type[client_id] is not None:
-                        server_message = ""
-                        for car in self.cars:
-                            if car.availability == 1:
-                                server_message += f"{car.to_dict()}\n"
-
-                    elif client_message == "request_Car" and self.clients_type[client_id] is not None :
-                        server_message = "Enter the Id of requested car like this: 'car_Id: id'"
-
-                    elif client_message == "start_Engine" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.start_engine = 1
-                        server_message = "Engine started."
-
-                    elif client_message == "unlock_Car" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.lock = 0
-                        server_message = "Car unlocked."
-
-                    elif client_message == "lock_Car" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.lock = 1
-                        server_message = "Car locked."
-
-                    elif client_message == "pay_Rental" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.paid = 1
-                        server_message = "Rental paid."
-
-                    elif client_message.startswith("car_Id") and self.clients_type[client_id] is not None:
-                        car_id = int(client_message.split(":")[1])
-                        ok = 0
-                        for Car in self.cars:
-                            if Car.id == car_id:
-                                if Car.availability == 1:
-                                    Car.availability = 0
-                                    Car.user_id = client_id
-                                    ok = 1
-                                    server_message = "Rental started."
-                        if ok == 0:
-                            server_message = "Car not found or not available."
-                    elif self.clients_type[client_id] is None:
-                        server_message = "You have to register first."
-                    else:
-                        server_message = "Invalid command."
-
-                    client_socket.send(server_message.encode())
-
-            except Exception as e:
-                print(f"Error: {e}")
-
-            finally:
-                client_socket.close()
+        try:
+            while True:
+                client_message = client_socket.recv(1024).decode()
+                if not client_message:
+                    break
+                print(f"[Client]: {client_message}")
+                print(f"[Client]: {client_id}")
+                command, args = self.codec.parse(client_message)
+                server_message = self.router.dispatch(client_id, self.clients_type[client_id], command, args)
+                client_socket.send(server_message.encode())
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+        finally:
+            client_socket.close()
+
+    def end_rental(self, client_id):
+        server_message = "You have to pay the rental first."
+        for car in self.cars:
+            if car.user_id == client_id and car.paid == 1:
+                car.user_id = None
+                car.availability = 1
+                car.paid = 0
+                print("[Server]: Rental ended.")
+                server_message = "Rental ended."
+                break
+        return server_message
+
+    def register_renter(self, client_id):
+        self.clients_type[client_id] = "renter"
+        return "You are registered as a renter."
+
+    def register_owner(self, client_id):
+        return "Enter the Owner Id like this: 'owner_Id: id' "
+
+    def login_owner(self, client_id, owner_id):
+        server_message = "You are registered as an owner. Your cars are: \n"
+        for car in self.cars:
+            if car.owner_id == owner_id:
+                server_message += f"{car.to_dict()}\n"
+        if server_message == "You are registered as an owner. Your cars are: \n":
+            return "No cars found."
+        self.clients_type[client_id] = "owner"
+        return server_message
+
+    def change_price(self, client_id):
+        return "Enter the Id of the car and the new price like this: 'owner_Id: car_Id: new_price'"
+
+    def set_price(self, client_id, owner_id, car_id, new_price):
+        server_message = "Car not found."
+        for car in self.cars:
+            if car.id == car_id and car.owner_id == owner_id:
+                car.price = new_price
+                server_message = "Price changed."
+        return server_message
+
+    def post_car(self, client_id):
+        server_message = ""
+        for car in self.cars:
+            if car.availability == 1:
+                server_message += f"{car.to_dict()}\n"
+        return server_message
+
+    def request_car(self, client_id):
+        return "Enter the Id of requested car like this: 'car_Id: id'"
+
+    def start_engine(self, client_id):
+        for car in self.cars:
+            if car.user_id == client_id:
+                car.start_engine = 1
+        return "Engine started."
+
+    def unlock_car(self, client_id):
+        for car in self.cars:
+            if car.user_id == client_id:
+                car.lock = 0
+        return "Car unlocked."
+
+    def lock_car(self, client_id):
+        for car in self.cars:
+            if car.user_id == client_id:
+                car.lock = 1
+        return "Car locked."
+
+    def pay_rental(self, client_id):
+        for car in self.cars:
+            if car.user_id == client_id:
+                car.paid = 1
+        return "Rental paid."
+
+    def rent_car(self, client_id, car_id):
+        for car in self.cars:
+            if car.id == car_id and car.availability == 1:
+                car.availability = 0
+                car.user_id = client_id
+                return "Rental started."
+        return "Car not found or not available."
 
     def stop(self):
         self.server_socket.close()
@@ -1,7 +1,9 @@
-import requests
+from LocationProvider import CachedLocationProvider, IpInfoLocationProvider
 
 
 class Car:
+    location_provider = CachedLocationProvider(IpInfoLocationProvider())
+
     def __init__(self, brand, model, year, price, owner_id, id):
         self.brand = brand
         self.model = model
@@ -17,10 +19,7 @@ class Car:
 
 
     def get_location(self):
-        response = requests.get('https://ipinfo.io%27')
-        data = response.json()
-        location = data.get('loc')
-        return location
+        return Car.location_provider.get(self.id)
 
     def to_dict(self):
         return {
@@ -39,6 +38,51 @@ class Car:
             return "rental_failure"
 
 
+class CompactCar:
+    """
+    A Car with the same attributes and methods but no per-instance __dict__.
+
+    The four 0/1 flags share one int of packed bits and are read and written
+    through properties, so code written against Car works unchanged.
+    """
+    __slots__ = ("brand", "model", "year", "price", "owner_id", "id", "user_id", "flags")
+    AVAILABLE = 0x1
+    PAID = 0x2
+    LOCKED = 0x4
+    ENGINE_STARTED = 0x8
+    FLAG_BITS = {"availability": AVAILABLE, "paid": PAID, "lock": LOCKED, "start_engine": ENGINE_STARTED}
+    """Bit of every flag attribute."""
+
+    def __init__(self, brand, model, year, price, owner_id, id):
+        self.brand = brand
+        self.model = model
+        self.year = year
+        self.price = price
+        self.owner_id = owner_id
+        self.id = id
+        self.user_id = None
+        self.flags = self.AVAILABLE | self.LOCKED
+
+    def _flag(bit):
+        def get(self):
+            return 1 if self.flags & bit else 0
+
+        def set(self, value):
+            self.flags = self.flags | bit if value else self.flags & ~bit
+
+        return property(get, set)
+
+    availability = _flag(AVAILABLE)
+    paid = _flag(PAID)
+    lock = _flag(LOCKED)
+    start_engine = _flag(ENGINE_STARTED)
+    del _flag
+
+    get_location = Car.get_location
+    to_dict = Car.to_dict
+    send_confirmation_message = Car.send_confirmation_message
+
+
 def main():
     car = Car("Audi", "A3", 2019, 100, "Owner1")
     print(car.to_dict())
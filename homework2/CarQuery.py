@@ -0,0 +1,131 @@
+import math
+
+
+class QueryParams:
+    """Parameters of filtered car listings."""
+    DEFAULT_PAGE_SIZE = 100
+    """Cars per page when a query does not give a limit."""
+    MAX_PAGE_SIZE = 1000
+    EARTH_RADIUS_KM = 6371.0
+
+
+def parse_location(location):
+    """
+    Parse a "lat,lon" string.
+
+    Returns:
+        A (lat, lon) tuple of floats, or None if the location is missing or malformed.
+    """
+    try:
+        lat, lon = location.split(",")
+        return float(lat), float(lon)
+    except (AttributeError, ValueError):
+        return None
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * QueryParams.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CarQuery:
+    """
+    Filters and cursor of one page of the available-car listing.
+
+    Its text form, used after 'post_Car:', is a ';'-separated list of
+    key=value pairs, for example
+    'post_Car: brand=Audi; max_price=150; year=2018-2020; near=45.75,21.21,10; after=42; limit=50'.
+    Every key is optional. `after` is the cursor: the id of the last car of the
+    previous page, as given in that page's 'next_Cursor' line.
+    """
+    __slots__ = ("brand", "max_price", "min_year", "max_year", "near", "after", "limit")
+
+    def __init__(self, brand=None, max_price=None, min_year=None, max_year=None, near=None, after=None,
+                 limit=QueryParams.DEFAULT_PAGE_SIZE):
+        """
+        Initialize CarQuery.
+
+        Args:
+            brand: Only cars of this brand.
+            max_price: Only cars costing at most this much.
+            min_year: Only cars made in this year or later.
+            max_year: Only cars made in this year or earlier.
+            near: A (lat, lon, radius_km) tuple; only cars within the radius.
+            after: Only cars with a larger id; None starts from the first car.
+            limit: Page size, capped at QueryParams.MAX_PAGE_SIZE.
+        """
+        self.brand = brand
+        self.max_price = max_price
+        self.min_year = min_year
+        self.max_year = max_year
+        self.near = near
+        self.after = after
+        self.limit = max(1, min(limit, QueryParams.MAX_PAGE_SIZE))
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse the text form of a query.
+
+        Args:
+            text: The part of the command after 'post_Car:'.
+
+        Returns:
+            The CarQuery.
+
+        Raises:
+            ValueError: If a key is unknown or a value malformed.
+        """
+        fields = {}
+        for item in text.split(";"):
+            if not item.strip():
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key == "brand":
+                fields["brand"] = value
+            elif key in ("max_price", "after", "limit"):
+                fields[key] = int(value)
+            elif key == "year":
+                low, _, high = value.partition("-")
+                fields["min_year"] = int(low) if low else None
+                fields["max_year"] = int(high) if high else None
+            elif key == "near":
+                lat, lon, radius_km = map(float, value.split(","))
+                fields["near"] = (lat, lon, radius_km)
+            else:
+                raise ValueError(f"Unknown filter: {key}")
+        return cls(**fields)
+
+    def __str__(self):
+        items = []
+        if self.brand is not None:
+            items.append(f"brand={self.brand}")
+        if self.max_price is not None:
+            items.append(f"max_price={self.max_price}")
+        if self.min_year is not None or self.max_year is not None:
+            items.append(f"year={'' if self.min_year is None else self.min_year}-"
+                         f"{'' if self.max_year is None else self.max_year}")
+        if self.near is not None:
+            items.append("near={},{},{}".format(*self.near))
+        if self.after is not None:
+            items.append(f"after={self.after}")
+        items.append(f"limit={self.limit}")
+        return "; ".join(items)
+
+    def matches(self, car):
+        """Whether an available car passes every filter; the cursor is not checked."""
+        if self.brand is not None and car.brand != self.brand:
+            return False
+        if self.max_price is not None and car.price > self.max_price:
+            return False
+        if self.min_year is not None and car.year < self.min_year:
+            return False
+        if self.max_year is not None and car.year > self.max_year:
+            return False
+        if self.near is not None:
+            location = parse_location(car.get_location())
+            if location is None or distance_km(*location, self.near[0], self.near[1]) > self.near[2]:
+                return False
+        return True
@@ -0,0 +1,305 @@
+import bisect
+import contextlib
+import threading
+
+
+class CarRegistry:
+    """
+    In-memory fleet with hash indexes by car id, owner id and current renter id.
+
+    Every rental state change goes through the registry so the indexes and the
+    availability set always agree with the Car objects they point to.
+
+    Rental transitions are compare-and-set operations under a per-car lock,
+    taken from a fixed pool of lock stripes so memory does not grow with the
+    fleet. Owner and renter index entries are guarded by a second pool of
+    stripes keyed by owner or renter id, so threads working on different cars
+    rarely wait for each other.
+
+    Car ids are also kept in a sorted list, so listings can be paged with the
+    id of the last car seen as the cursor.
+    """
+    LOCK_STRIPES = 1024
+    """Number of locks shared by the cars (and, separately, by the index keys)."""
+
+    def __init__(self, cars=()):
+        """
+        Initialize CarRegistry.
+
+        Args:
+            cars: Cars to register up front.
+        """
+        self.cars_by_id = {}
+        self.cars_by_owner = {}
+        self.cars_by_renter = {}
+        self.available_cars = {}  # insertion-ordered set of car ids
+        self.sorted_ids = []
+        self.sorted_ids_lock = threading.Lock()
+        self.car_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.index_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.listeners = []
+        for car in cars:
+            self.add(car)
+
+    def __len__(self):
+        return len(self.cars_by_id)
+
+    def __iter__(self):
+        return iter(list(self.cars_by_id.values()))
+
+    def add_listener(self, listener):
+        """
+        Subscribe to state changes.
+
+        Args:
+            listener: Called as listener(event, cars) after every transition, while
+                the locks of the cars involved are still held, so it must be quick.
+        """
+        self.listeners.append(listener)
+
+    def car_lock(self, car_id):
+        return self.car_locks[hash(car_id) % self.LOCK_STRIPES]
+
+    @contextlib.contextmanager
+    def car_locks_for(self, car_ids):
+        """Hold the locks of several cars at once; they are taken in stripe order, so batches cannot deadlock."""
+        with contextlib.ExitStack() as stack:
+            for stripe in sorted({hash(car_id) % self.LOCK_STRIPES for car_id in car_ids}):
+                stack.enter_context(self.car_locks[stripe])
+            yield
+
+    def index_lock(self, key):
+        return self.index_locks[hash(key) % self.LOCK_STRIPES]
+
+    def add(self, car):
+        """Register a car, replacing any car that already has the same id."""
+        with self.car_lock(car.id):
+            self._remove(car.id)
+            self.cars_by_id[car.id] = car
+            with self.sorted_ids_lock:
+                bisect.insort(self.sorted_ids, car.id)
+            self._index(self.cars_by_owner, car.owner_id, car)
+            if car.user_id is not None:
+                self._index(self.cars_by_renter, car.user_id, car)
+            if car.availability == 1:
+                self.available_cars[car.id] = car
+            self._notify("add", [car])
+
+    def remove(self, car_id):
+        with self.car_lock(car_id):
+            car = self._remove(car_id)
+            if car is not None:
+                self._notify("remove", [car])
+            return car
+
+    def get(self, car_id):
+        return self.cars_by_id.get(car_id)
+
+    def owned_by(self, owner_id):
+        with self.index_lock(owner_id):
+            return list(self.cars_by_owner.get(owner_id, {}).values())
+
+    def rented_by(self, renter_id):
+        with self.index_lock(renter_id):
+            return list(self.cars_by_renter.get(renter_id, {}).values())
+
+    def rented(self):
+        """Return every car that currently has a renter."""
+        return [car for cars in list(self.cars_by_renter.values()) for car in list(cars.values())]
+
+    def available(self):
+        return list(self.available_cars.copy().values())
+
+    def search(self, query):
+        """
+        Yield the available cars matching a query, in id order, starting after its cursor.
+
+        Cars are looked up one at a time, so taking the first page costs the
+        same however large the fleet is.
+
+        Args:
+            query: A CarQuery.
+        """
+        last_id = query.after
+        while True:
+            ids = self.sorted_ids
+            # re-locate the cursor every step: the list may shift under concurrent adds
+            position = 0 if last_id is None else bisect.bisect_right(ids, last_id)
+            if position >= len(ids):
+                return
+            last_id = ids[position]
+            car = self.cars_by_id.get(last_id)
+            if car is not None and car.availability == 1 and query.matches(car):
+                yield car
+
+    def rent(self, car_id, renter_id):
+        """
+        Hand an available car to a renter.
+
+        Args:
+            car_id: The id of the requested car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the rental started, False if the car does not exist or is taken.
+        """
+        with self.car_lock(car_id):
+            car = self.cars_by_id.get(car_id)
+            if car is None or car.availability != 1:
+                return False
+            car.availability = 0
+            car.user_id = renter_id
+            self.available_cars.pop(car_id, None)
+            self._index(self.cars_by_renter, renter_id, car)
+            self._notify("rent", [car])
+            return True
+
+    def end_rental(self, car_id, renter_id):
+        """
+        Return a paid car, if it is still rented by the given renter.
+
+        Args:
+            car_id: The id of the rented car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the car was released, False if it is not rented by this renter or not paid.
+        """
+        with self.car_lock(car_id):
+            car = self.cars_by_id.get(car_id)
+            if car is None or car.user_id != renter_id or car.paid != 1:
+                return False
+            self._release(car)
+            self._notify("release", [car])
+            return True
+
+    def cancel_rental(self, car_id, renter_id):
+        """
+        Release a car, paid or not, if it is still rented by the given renter.
+
+        Returns:
+            True if the car was released, False if it is not rented by this renter.
+        """
+        with self.car_lock(car_id):
+            car = self.cars_by_id.get(car_id)
+            if car is None or car.user_id != renter_id:
+                return False
+            self._release(car)
+            self._notify("release", [car])
+            return True
+
+    def release(self, car):
+        """End the rental of a car and make it available again."""
+        with self.car_lock(car.id):
+            self._release(car)
+            self._notify("release", [car])
+
+    def update_rented(self, renter_id, **fields):
+        """Set the given attributes on every car currently rented by a renter."""
+        for car in self.rented_by(renter_id):
+            with self.car_lock(car.id):
+                if car.user_id == renter_id:
+                    for name, value in fields.items():
+                        setattr(car, name, value)
+                    self._notify("update", [car])
+
+    def set_price(self, owner_id, car_id, price):
+        with self.car_lock(car_id):
+            car = self.cars_by_id.get(car_id)
+            if car is None or car.owner_id != owner_id:
+                return False
+            car.price = price
+            self._notify("set_price", [car])
+            return True
+
+    def set_prices(self, owner_id, prices):
+        """
+        Change the prices of many cars of one owner as a single transition.
+
+        Args:
+            owner_id: The owner; every car must be theirs.
+            prices: A dict or (car_id, price) pairs; the last price given for a car wins.
+
+        Returns:
+            The number of cars repriced, or None, with nothing changed, if a car does
+            not exist or belongs to someone else.
+        """
+        prices = dict(prices)
+        with self.car_locks_for(prices):
+            cars = self._owned(owner_id, prices)
+            if cars is None:
+                return None
+            for car in cars:
+                car.price = prices[car.id]
+            if cars:
+                self._notify("set_prices", cars)
+            return len(cars)
+
+    def set_locks(self, owner_id, car_ids, lock):
+        """
+        Lock or unlock many cars of one owner as a single transition.
+
+        Rented cars are left as they are: their renter controls the lock.
+
+        Args:
+            owner_id: The owner; every car must be theirs.
+            car_ids: The cars to change.
+            lock: 1 to lock, 0 to unlock.
+
+        Returns:
+            The number of available cars changed, or None, with nothing changed, if a
+            car does not exist or belongs to someone else.
+        """
+        car_ids = set(car_ids)
+        with self.car_locks_for(car_ids):
+            cars = self._owned(owner_id, car_ids)
+            if cars is None:
+                return None
+            cars = [car for car in cars if car.availability == 1]
+            for car in cars:
+                car.lock = lock
+            if cars:
+                self._notify("set_locks", cars)
+            return len(cars)
+
+    def _owned(self, owner_id, car_ids):
+        cars = [self.cars_by_id.get(car_id) for car_id in car_ids]
+        if any(car is None or car.owner_id != owner_id for car in cars):
+            return None
+        return cars
+
+    def _notify(self, event, cars):
+        for listener in self.listeners:
+            listener(event, cars)
+
+    def _release(self, car):
+        if car.user_id is not None:
+            self._unindex(self.cars_by_renter, car.user_id, car.id)
+        car.user_id = None
+        car.availability = 1
+        car.paid = 0
+        self.available_cars[car.id] = car
+
+    def _remove(self, car_id):
+        car = self.cars_by_id.pop(car_id, None)
+        if car is None:
+            return None
+        with self.sorted_ids_lock:
+            del self.sorted_ids[bisect.bisect_left(self.sorted_ids, car_id)]
+        self._unindex(self.cars_by_owner, car.owner_id, car_id)
+        if car.user_id is not None:
+            self._unindex(self.cars_by_renter, car.user_id, car_id)
+        self.available_cars.pop(car_id, None)
+        return car
+
+    def _index(self, index, key, car):
+        with self.index_lock(key):
+            index.setdefault(key, {})[car.id] = car
+
+    def _unindex(self, index, key, car_id):
+        with self.index_lock(key):
+            cars = index.get(key)
+            if cars is not None:
+                cars.pop(car_id, None)
+                if not cars:
+                    del index[key]
@@ -0,0 +1,746 @@
+import ast
+import asyncio
+import contextlib
+import queue
+import socket
+import time
+
+from CarQuery import CarQuery, QueryParams
+from Codec import CarEvents, CarListing
+from EventHub import EventFilter, EventParams
+from Protocol import BINARY_CODEC, HANDSHAKES, FrameDecoder, ProtocolParams, encode_frame
+
+
+class ClientParams:
+    """Parameters of the client library."""
+    TIMEOUT_S = 10.0
+    """How long to wait for connecting, the handshake and each reply."""
+    RECONNECT_ATTEMPTS = 3
+    """Connection attempts before a request gives up."""
+    RECONNECT_DELAY_S = 0.1
+    """Pause before the second connection attempt; it doubles for every further attempt."""
+    POOL_SIZE = 16
+    """Connections a pool keeps open at most."""
+    RETRYABLE_COMMANDS = frozenset(["post_Car", "search_Cars", "nearby_Cars", "register_Renter", "owner_Id"])
+    """Commands resent on a new connection when the connection breaks before the reply; the rest change
+    state the server may or may not have applied, so their callers get the ConnectionError."""
+    LOGIN_COMMANDS = frozenset(["register_Renter", "owner_Id"])
+    """Commands that give the connection a role; the last successful one is replayed after a reconnect."""
+    EVENT_QUEUE_SIZE = 64
+    """Pushed event batches an asyncio client holds; when they are not taken, it stops reading the
+    connection, and the server coalesces the events meanwhile."""
+
+
+class CommandRejected(Exception):
+    """Raised when the server answers a command with an error or an unexpected reply."""
+
+    def __init__(self, command, reply):
+        super().__init__(f"{command}: {reply}")
+        self.command = command
+        self.reply = reply
+
+
+class CarInfo:
+    """One car of a listing, as the server describes it."""
+    __slots__ = ("id", "brand", "model", "year", "price", "location")
+
+    def __init__(self, id, brand, model, year, price, location):
+        self.id = id
+        self.brand = brand
+        self.model = model
+        self.year = year
+        self.price = price
+        self.location = location
+
+    def __repr__(self):
+        return (f"CarInfo(id={self.id}, brand={self.brand!r}, model={self.model!r}, year={self.year}, "
+                f"price={self.price}, location={self.location!r})")
+
+
+class CarPage:
+    """One page of a filtered listing."""
+    __slots__ = ("cars", "next_cursor")
+
+    def __init__(self, cars, next_cursor):
+        """
+        Initialize CarPage.
+
+        Args:
+            cars: The CarInfo records of the page.
+            next_cursor: The `after` value of the next page, or None on the last page.
+        """
+        self.cars = cars
+        self.next_cursor = next_cursor
+
+
+class CarEvent:
+    """One pushed car state change: kind is available, rented, removed or price, with the car's
+    new state; or resync, without a car, when events of the subscription were dropped."""
+    __slots__ = ("subscription_id", "kind", "car")
+
+    def __init__(self, subscription_id, kind, car):
+        self.subscription_id = subscription_id
+        self.kind = kind
+        self.car = car
+
+    def __repr__(self):
+        return f"CarEvent({self.subscription_id}, {self.kind!r}, {self.car!r})"
+
+
+def parse_events(reply):
+    """Turn a pushed events payload of either codec into a list of CarEvent."""
+    if isinstance(reply, CarEvents):
+        events = [CarEvent(reply.subscription_id, kind, CarInfo(**car)) for kind, car in reply.events]
+        if reply.overflowed:
+            events.append(CarEvent(reply.subscription_id, "resync", None))
+        return events
+    events = []
+    subscription_id = None
+    for line in reply.splitlines():
+        kind, _, value = line.partition(": ")
+        if kind == "events":
+            subscription_id = int(value)
+        elif kind == "resync":
+            events.append(CarEvent(int(value), "resync", None))
+        else:
+            events.append(CarEvent(subscription_id, kind, CarInfo(**ast.literal_eval(value))))
+    return events
+
+
+def parse_listing(reply):
+    """
+    Turn a listing reply of either codec into records.
+
+    Returns:
+        A (list of CarInfo, next cursor or None) tuple.
+    """
+    if isinstance(reply, CarListing):
+        return [CarInfo(**car) for car in reply.cars], reply.next_cursor
+    cars = []
+    next_cursor = None
+    for line in reply.splitlines():
+        if line.startswith("{"):
+            cars.append(CarInfo(**ast.literal_eval(line)))
+        elif line.startswith("next_Cursor:"):
+            next_cursor = int(line.split(":", 1)[1])
+    return cars, next_cursor
+
+
+def expect(*accepted):
+    """A result parser that returns None for one of the accepted replies and rejects anything else."""
+    def result(command, reply):
+        if reply not in accepted:
+            raise CommandRejected(command, reply)
+    return result
+
+
+def outcome(succeeded, failed):
+    """A result parser that returns True for the `succeeded` reply, False for the `failed` one."""
+    def result(command, reply):
+        if reply == succeeded:
+            return True
+        if reply == failed:
+            return False
+        raise CommandRejected(command, reply)
+    return result
+
+
+def is_listing(reply):
+    # an empty listing is an empty text reply
+    return isinstance(reply, CarListing) or not reply or reply.startswith(("{", "next_Cursor:",
+                                                                            CarListing.HEADERS["owner"]))
+
+
+def cars(command, reply):
+    if reply == "No cars found.":
+        return []
+    if not is_listing(reply):
+        raise CommandRejected(command, reply)
+    return parse_listing(reply)[0]
+
+
+def page(command, reply):
+    if not is_listing(reply):
+        raise CommandRejected(command, reply)
+    return CarPage(*parse_listing(reply))
+
+
+def subscription(command, reply):
+    if not reply.startswith("Subscribed: "):
+        raise CommandRejected(command, reply)
+    return int(reply[len("Subscribed: "):].rstrip("."))
+
+
+def count(prefix):
+    """A result parser for batch replies like 'Prices changed: 12.': the count, or None if a car was not found."""
+    def result(command, reply):
+        if reply == "Car not found.":
+            return None
+        if not reply.startswith(prefix):
+            raise CommandRejected(command, reply)
+        return int(reply[len(prefix):].rstrip("."))
+    return result
+
+
+class CarsharingCommands:
+    """
+    Typed methods for every server command.
+
+    Each one goes through self.call(command, args, result), which sends the
+    command and returns result(command, reply). A blocking client's call
+    returns the value; an asyncio client's call is a coroutine, so its
+    methods are awaited.
+    """
+
+    def register_renter(self):
+        return self.call("register_Renter", (), expect("You are registered as a renter."))
+
+    def login_owner(self, owner_id):
+        """Log in as an owner; returns the owner's cars, or [] (and no owner role) if there are none."""
+        return self.call("owner_Id", (owner_id,), cars)
+
+    def list_cars(self):
+        """Every available car."""
+        return self.call("post_Car", (), cars)
+
+    def search_cars(self, brand=None, max_price=None, min_year=None, max_year=None, near=None, after=None,
+                    limit=QueryParams.DEFAULT_PAGE_SIZE):
+        """
+        One page of the available cars matching the filters, in id order.
+
+        Args:
+            brand: Only cars of this brand.
+            max_price: Only cars costing at most this much.
+            min_year: Only cars made in this year or later.
+            max_year: Only cars made in this year or earlier.
+            near: A (lat, lon, radius_km) tuple; only cars within the radius.
+            after: The next_cursor of the previous page; None for the first page.
+            limit: Page size.
+
+        Returns:
+            A CarPage.
+        """
+        query = CarQuery(brand, max_price, min_year, max_year, near, after, limit)
+        return self.call("search_Cars", (query,), page)
+
+    def nearby_cars(self, lat, lon, k):
+        """The k available cars closest to a point, nearest first."""
+        return self.call("nearby_Cars", (lat, lon, k), cars)
+
+    def rent(self, car_id):
+        """Start renting a car; returns False if it does not exist or is taken."""
+        return self.call("car_Id", (car_id,), outcome("Rental started.", "Car not found or not available."))
+
+    def unlock(self):
+        return self.call("unlock_Car", (), expect("Car unlocked."))
+
+    def lock(self):
+        return self.call("lock_Car", (), expect("Car locked."))
+
+    def start_engine(self):
+        return self.call("start_Engine", (), expect("Engine started."))
+
+    def pay(self):
+        return self.call("pay_Rental", (), expect("Rental paid."))
+
+    def end_rental(self):
+        """End the paid rental; returns False if it has not been paid."""
+        return self.call("end_Rental", (), outcome("Rental ended.", "You have to pay the rental first."))
+
+    def set_price(self, owner_id, car_id, price):
+        """Change the price of an owned car; returns False if the owner has no such car."""
+        return self.call("set_Price", (owner_id, car_id, price), outcome("Price changed.", "Car not found."))
+
+    def set_prices(self, owner_id, prices):
+        """
+        Change the prices of many owned cars in one request.
+
+        Args:
+            owner_id: The owner; every car must be theirs.
+            prices: A dict or (car_id, price) pairs.
+
+        Returns:
+            The number of cars repriced, or None, with nothing changed, if a car is not the owner's.
+        """
+        return self.call("set_Prices", (owner_id, list(dict(prices).items())), count("Prices changed: "))
+
+    def lock_cars(self, owner_id, car_ids):
+        """Lock many owned cars in one request; returns how many (rented cars are skipped), or None."""
+        return self.call("lock_Cars", (owner_id, list(car_ids)), count("Cars locked: "))
+
+    def unlock_cars(self, owner_id, car_ids):
+        """Unlock many owned cars in one request; returns how many (rented cars are skipped), or None."""
+        return self.call("unlock_Cars", (owner_id, list(car_ids)), count("Cars unlocked: "))
+
+    def subscribe(self, owner_id=None, brand=None, near=None, availability=True, price=True):
+        """
+        Ask to be sent car state changes instead of polling the listings.
+
+        Args:
+            owner_id: Only cars of this owner.
+            brand: Only cars of this brand.
+            near: A (lat, lon, radius_km) tuple; only cars within the radius.
+            availability: Send cars becoming available, rented or removed.
+            price: Send price changes.
+
+        Returns:
+            The subscription id, found again in the CarEvent objects.
+        """
+        kinds = (EventParams.AVAILABILITY_KINDS if availability else frozenset()) | \
+            (EventParams.PRICE_KINDS if price else frozenset())
+        return self.call("subscribe_Cars", (EventFilter(owner_id, brand, near, kinds),), subscription)
+
+    def unsubscribe(self, subscription_id):
+        return self.call("unsubscribe_Cars", (subscription_id,), outcome("Unsubscribed.", "Subscription not found."))
+
+
+class Pipeline(CarsharingCommands):
+    """
+    Commands queued on a blocking client and sent together.
+
+    The typed methods queue their command instead of sending it; execute()
+    writes all of them at once and returns their results in order.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None and self.calls:
+            self.results = self.execute()
+
+    def call(self, command, args, result):
+        self.calls.append((command, args, result))
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        replies = self.client.request_many([(command, args) for command, args, result in calls])
+        return [result(command, reply) for (command, args, result), reply in zip(calls, replies)]
+
+
+class CarsharingClient(CarsharingCommands):
+    """
+    A blocking client of the framed protocol, for use by one thread at a time.
+
+    The server keeps the role of a client per connection, so the client
+    remembers its last successful register_Renter or owner_Id and sends it
+    again after reconnecting. Rentals belong to the old connection's client id
+    and do not carry over.
+    """
+
+    def __init__(self, host, port, codec=BINARY_CODEC, timeout_s=ClientParams.TIMEOUT_S,
+                 reconnect_attempts=ClientParams.RECONNECT_ATTEMPTS):
+        """
+        Initialize CarsharingClient; it connects on the first command.
+
+        Args:
+            host: The server address.
+            port: The server port.
+            codec: TEXT_CODEC or BINARY_CODEC, the payload encoding to negotiate.
+            timeout_s: How long to wait for connecting and for each reply.
+            reconnect_attempts: Connection attempts before a request gives up.
+        """
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.timeout_s = timeout_s
+        self.reconnect_attempts = reconnect_attempts
+        self.client_socket = None
+        self.decoder = None
+        self.next_request_id = 1
+        self.replies = {}
+        self.pushed = []
+        self.login = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def connect(self):
+        """Open the connection, retrying with backoff, and restore the role of the previous connection."""
+        delay_s = ClientParams.RECONNECT_DELAY_S
+        for attempt in range(1, self.reconnect_attempts + 1):
+            try:
+                self._open()
+                break
+            except OSError:
+                self.close()
+                if attempt == self.reconnect_attempts:
+                    raise
+                time.sleep(delay_s)
+                delay_s *= 2
+        if self.login is not None:
+            self.call(*self.login)
+
+    def close(self):
+        if self.client_socket is not None:
+            self.client_socket.close()
+            self.client_socket = None
+
+    def pipeline(self):
+        """Return a Pipeline; used as a context manager, its results are in .results after the block."""
+        return Pipeline(self)
+
+    def request_many(self, calls):
+        """
+        Send commands back to back and wait for all their replies.
+
+        Args:
+            calls: (command, args) tuples.
+
+        Returns:
+            The decoded replies, in order: strings, or CarListing for listings.
+
+        Raises:
+            ConnectionError: If the connection broke; the commands may or may not have been executed.
+            TimeoutError: If a reply took longer than the timeout.
+        """
+        if self.client_socket is None:
+            self.connect()
+        request_ids = []
+        frames = []
+        for command, args in calls:
+            request_ids.append(self.next_request_id)
+            frames.append(encode_frame(self.next_request_id, self.codec.encode_command(command, args)))
+            self.next_request_id = self.next_request_id % 0xFFFFFFFF + 1
+        try:
+            self.client_socket.sendall(b"".join(frames))
+            return [self._receive(request_id) for request_id in request_ids]
+        except OSError as e:
+            # a late reply would be taken for the answer to a later request
+            self.close()
+            if isinstance(e, TimeoutError):
+                raise
+            raise ConnectionError(f"Connection to {self.host}:{self.port} lost: {e}") from e
+
+    def call(self, command, args, result):
+        for attempt in range(self.reconnect_attempts):
+            try:
+                reply = self.request_many([(command, args)])[0]
+                break
+            except ConnectionError:
+                if command not in ClientParams.RETRYABLE_COMMANDS or attempt == self.reconnect_attempts - 1:
+                    raise
+        value = result(command, reply)
+        if command in ClientParams.LOGIN_COMMANDS and (command != "owner_Id" or value):
+            self.login = (command, args, result)
+        return value
+
+    def _open(self):
+        self.client_socket = socket.create_connection((self.host, self.port), self.timeout_s)
+        self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handshake, ack = next((handshake, ack) for handshake, (ack, codec) in HANDSHAKES.items()
+                              if codec is self.codec)
+        self.client_socket.sendall(handshake)
+        received = b""
+        while len(received) < len(ack):
+            chunk = self.client_socket.recv(len(ack) - len(received))
+            if not chunk:
+                raise ConnectionError("Server closed the connection during the handshake.")
+            received += chunk
+        if received != ack:
+            raise ConnectionError(f"Server refused the handshake: {received.decode(errors='replace')}")
+        self.decoder = FrameDecoder()
+        self.replies = {}
+
+    def _receive(self, request_id):
+        while True:
+            frames = self.replies.get(request_id)
+            if frames is not None and not frames[-1][0] & ProtocolParams.FLAG_MORE:
+                return decode_reply(self.codec, [payload for flags, payload in self.replies.pop(request_id)])
+            data = self.client_socket.recv(ProtocolParams.CHUNK_SIZE_BYTES)
+            if not data:
+                raise ConnectionError("Server closed the connection.")
+            self._feed(data)
+
+    def wait_events(self, timeout_s=None):
+        """
+        Return the pushed events received so far, waiting for some if there are none.
+
+        Args:
+            timeout_s: How long to wait; None uses the client timeout.
+
+        Returns:
+            A list of CarEvent, empty if none arrived in time.
+        """
+        if self.client_socket is None:
+            self.connect()
+        if not self.pushed:
+            self.client_socket.settimeout(self.timeout_s if timeout_s is None else timeout_s)
+            try:
+                data = self.client_socket.recv(ProtocolParams.CHUNK_SIZE_BYTES)
+            except TimeoutError:
+                data = None
+            finally:
+                self.client_socket.settimeout(self.timeout_s)
+            if data == b"":
+                self.close()
+                raise ConnectionError("Server closed the connection.")
+            if data:
+                self._feed(data)
+        pushed, self.pushed = self.pushed, []
+        return [event for payload in pushed for event in parse_events(self.codec.decode_reply(payload))]
+
+    def _feed(self, data):
+        for reply_id, flags, payload in self.decoder.feed(data):
+            if reply_id == ProtocolParams.PUSH_REQUEST_ID:
+                self.pushed.append(payload)
+            else:
+                self.replies.setdefault(reply_id, []).append((flags, payload))
+
+
+class ClientPool:
+    """
+    Blocking clients shared by threads, at most `size` of them connected at a time.
+
+    Each client is a separate server session, so a role or a rental belongs
+    to the client a thread leased: lease one for a whole rental.
+    """
+
+    def __init__(self, host, port, size=ClientParams.POOL_SIZE, **client_options):
+        """
+        Initialize ClientPool.
+
+        Args:
+            host: The server address.
+            port: The server port.
+            size: Clients created at most.
+            client_options: Passed to CarsharingClient.
+        """
+        self.clients = [CarsharingClient(host, port, **client_options) for _ in range(size)]
+        self.idle = queue.LifoQueue()
+        for client in self.clients:
+            self.idle.put(client)
+
+    @contextlib.contextmanager
+    def session(self, timeout_s=None):
+        """
+        Lease a client, waiting until one is free.
+
+        Args:
+            timeout_s: How long to wait for a free client; None waits forever.
+        """
+        client = self.idle.get(timeout=timeout_s)
+        try:
+            yield client
+        finally:
+            self.idle.put(client)
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+
+class AsyncCarsharingClient(CarsharingCommands):
+    """
+    An asyncio client of the framed protocol.
+
+    Any number of tasks may send commands concurrently over the one
+    connection; the replies are matched to them by request id. The tasks
+    share the connection's role. Reconnecting works as in CarsharingClient.
+    """
+
+    def __init__(self, host, port, codec=BINARY_CODEC, timeout_s=ClientParams.TIMEOUT_S,
+                 reconnect_attempts=ClientParams.RECONNECT_ATTEMPTS):
+        """
+        Initialize AsyncCarsharingClient; it connects on the first command.
+
+        Args:
+            host: The server address.
+            port: The server port.
+            codec: TEXT_CODEC or BINARY_CODEC, the payload encoding to negotiate.
+            timeout_s: How long to wait for connecting and for each reply.
+            reconnect_attempts: Connection attempts before a request gives up.
+        """
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.timeout_s = timeout_s
+        self.reconnect_attempts = reconnect_attempts
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}
+        self.next_request_id = 1
+        self.login = None
+        self.connect_lock = asyncio.Lock()
+        self.events = asyncio.Queue(ClientParams.EVENT_QUEUE_SIZE)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def connect(self):
+        """Open the connection, retrying with backoff, and restore the role of the previous connection."""
+        async with self.connect_lock:
+            if self.writer is not None:
+                return
+            delay_s = ClientParams.RECONNECT_DELAY_S
+            for attempt in range(1, self.reconnect_attempts + 1):
+                try:
+                    await asyncio.wait_for(self._open(), self.timeout_s)
+                    break
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    await self.close()
+                    if attempt == self.reconnect_attempts:
+                        raise ConnectionError(f"Cannot connect to {self.host}:{self.port}")
+                    await asyncio.sleep(delay_s)
+                    delay_s *= 2
+        if self.login is not None:
+            await self.call(*self.login)
+
+    async def close(self):
+        writer, self.writer = self.writer, None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if writer is not None:
+            writer.close()
+            with contextlib.suppress(OSError):
+                await writer.wait_closed()
+        self._fail_pending()
+
+    async def call(self, command, args, result):
+        for attempt in range(self.reconnect_attempts):
+            try:
+                reply = await self.request(command, args)
+                break
+            except ConnectionError:
+                if command not in ClientParams.RETRYABLE_COMMANDS or attempt == self.reconnect_attempts - 1:
+                    raise
+        value = result(command, reply)
+        if command in ClientParams.LOGIN_COMMANDS and (command != "owner_Id" or value):
+            self.login = (command, args, result)
+        return value
+
+    async def request(self, command, args):
+        """
+        Send one command and wait for its reply.
+
+        Returns:
+            The decoded reply: a string, or a CarListing for listings.
+
+        Raises:
+            ConnectionError: If the connection broke; the command may or may not have been executed.
+            TimeoutError: If the reply took longer than the timeout.
+        """
+        if self.writer is None:
+            await self.connect()
+        request_id = self.next_request_id
+        self.next_request_id = self.next_request_id % 0xFFFFFFFF + 1
+        reply = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (reply, [])
+        try:
+            self.writer.write(encode_frame(request_id, self.codec.encode_command(command, args)))
+            payloads = await asyncio.wait_for(reply, self.timeout_s)
+        finally:
+            self.pending.pop(request_id, None)
+        return decode_reply(self.codec, payloads)
+
+    async def next_events(self):
+        """Wait for the next batch of pushed events; returns a list of CarEvent."""
+        return parse_events(self.codec.decode_reply(await self.events.get()))
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        handshake, ack = next((handshake, ack) for handshake, (ack, codec) in HANDSHAKES.items()
+                              if codec is self.codec)
+        writer.write(handshake)
+        try:
+            received = await reader.readexactly(len(ack))
+        except BaseException:
+            writer.close()
+            raise
+        if received != ack:
+            writer.close()
+            raise ConnectionError(f"Server refused the handshake: {received.decode(errors='replace')}")
+        self.writer = writer
+        self.reader_task = asyncio.create_task(self._read_replies(reader, writer))
+
+    async def _read_replies(self, reader, writer):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(ProtocolParams.CHUNK_SIZE_BYTES)
+                if not data:
+                    break
+                for reply_id, flags, payload in decoder.feed(data):
+                    if reply_id == ProtocolParams.PUSH_REQUEST_ID:
+                        await self.events.put(payload)
+                        continue
+                    entry = self.pending.get(reply_id)
+                    if entry is None:
+                        continue  # the request timed out
+                    reply, payloads = entry
+                    payloads.append(payload)
+                    if not flags & ProtocolParams.FLAG_MORE and not reply.done():
+                        reply.set_result(payloads)
+        except OSError:
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+                self.reader_task = None
+                writer.close()
+                self._fail_pending()
+
+    def _fail_pending(self):
+        for reply, payloads in self.pending.values():
+            if not reply.done():
+                reply.set_exception(ConnectionError(f"Connection to {self.host}:{self.port} lost."))
+        self.pending.clear()
+
+
+class AsyncClientPool:
+    """
+    Asyncio clients shared by tasks, at most `size` of them connected at a time.
+
+    Each client is a separate server session, so a role or a rental belongs
+    to the client a task leased: lease one for a whole rental.
+    """
+
+    def __init__(self, host, port, size=ClientParams.POOL_SIZE, **client_options):
+        """
+        Initialize AsyncClientPool.
+
+        Args:
+            host: The server address.
+            port: The server port.
+            size: Clients created at most.
+            client_options: Passed to AsyncCarsharingClient.
+        """
+        self.clients = [AsyncCarsharingClient(host, port, **client_options) for _ in range(size)]
+        self.idle = asyncio.LifoQueue()
+        for client in self.clients:
+            self.idle.put_nowait(client)
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """Lease a client, waiting until one is free."""
+        client = await self.idle.get()
+        try:
+            yield client
+        finally:
+            self.idle.put_nowait(client)
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients))
+
+
+def decode_reply(codec, payloads):
+    """Decode the payloads of one reply, joining the chunks of a streamed listing."""
+    reply = codec.decode_reply(payloads[0])
+    for payload in payloads[1:]:
+        chunk = codec.decode_reply(payload)
+        if isinstance(reply, str):
+            reply += chunk
+        else:
+            reply.extend(chunk)
+    return reply
@@ -1,5 +1,7 @@
 import socket
 
+from Protocol import BINARY_CODEC, TEXT_CODEC, FrameDecoder, ProtocolParams, encode_frame
+
 
 class Client:
     def __init__(self, host, port):
@@ -9,22 +11,135 @@ class Client:
         self.type = None
         self.valid_commands = ["register_Renter", "register_Owner", "post_Car", "request_Car",
                                "end_Rental", "pay_Rental", "start_Engine", "unlock_Car", "lock_Car", "owner_Id", "change_Price"]
+        self.decoder = None
+        self.codec = TEXT_CODEC
+        self.next_request_id = 1
+        self.early_replies = {}
 
     def connect(self):
         self.client_socket.connect((self.host, self.port))
         print(f"[+] Conectat la {self.host}: {self.port}")
 
-    def send_message(self, message):
-        self.client_socket.send(message.encode())
-        server_message = self.client_socket.recv(1024).decode()
-        print(f"[Server]: {server_message}")
+    def enable_framing(self):
+        """Switch the connection to the framed protocol, which supports pipelining."""
+        self.negotiate(ProtocolParams.FRAMED_HANDSHAKE, ProtocolParams.FRAMED_ACK, TEXT_CODEC)
+
+    def enable_binary(self):
+        """Switch the connection to the framed protocol with compact binary payloads."""
+        self.negotiate(ProtocolParams.BINARY_HANDSHAKE, ProtocolParams.BINARY_ACK, BINARY_CODEC)
+
+    def negotiate(self, handshake, ack, codec):
+        self.client_socket.sendall(handshake.encode())
+        ack = ack.encode()
+        received = b""
+        while len(received) < len(ack):
+            chunk = self.client_socket.recv(len(ack) - len(received))
+            if not chunk:
+                raise ConnectionError("Server closed the connection during the handshake.")
+            received += chunk
+        if received != ack:
+            raise ConnectionError(f"Server refused {handshake}: {received.decode(errors='replace')}")
+        self.decoder = FrameDecoder()
+        self.codec = codec
+
+    def request(self, message):
+        """
+        Send one command and wait for its reply.
+
+        Args:
+            message: The command text.
+
+        Returns:
+            The reply text.
+        """
+        if self.decoder is None:
+            self.client_socket.send(message.encode())
+            server_message = self.client_socket.recv(1024).decode()
+        else:
+            server_message = self.pipeline([message])[0]
+        self.update_type(server_message)
+        return server_message
+
+    def pipeline(self, messages):
+        """
+        Send several commands at once and collect their replies.
+
+        Requires framing. Every command gets its own request id and the replies
+        are matched back to the commands by that id. With the binary codec the
+        commands are parsed here and sent as opcodes; replies are returned as
+        the same text the text protocol would have produced.
+
+        Args:
+            messages: The command texts, in order.
+
+        Returns:
+            The reply texts, in the order of `messages`.
+        """
+        if self.decoder is None:
+            raise RuntimeError("Pipelining requires enable_framing() first.")
+        request_ids = []
+        frames = []
+        for message in messages:
+            request_ids.append(self.next_request_id)
+            if self.codec is TEXT_CODEC:
+                payload = message.encode()
+            else:
+                payload = self.codec.encode_command(*TEXT_CODEC.parse(message))
+            frames.append(encode_frame(self.next_request_id, payload))
+            self.next_request_id = self.next_request_id % 0xFFFFFFFF + 1
+        self.client_socket.sendall(b"".join(frames))
+
+        replies = [str(self.decode_reply(self.receive_reply(request_id))) for request_id in request_ids]
+        for server_message in replies:
+            self.update_type(server_message)
+        return replies
+
+    def receive_reply(self, request_id):
+        """
+        Wait for the reply to a request.
+
+        Args:
+            request_id: The id the request was sent with.
+
+        Returns:
+            The payloads of the reply: one, or one per chunk of a streamed listing.
+        """
+        while not self._reply_complete(request_id):
+            data = self.client_socket.recv(ProtocolParams.CHUNK_SIZE_BYTES)
+            if not data:
+                raise ConnectionError("Server closed the connection.")
+            for reply_id, flags, payload in self.decoder.feed(data):
+                self.early_replies.setdefault(reply_id, []).append((flags, payload))
+        return [payload for flags, payload in self.early_replies.pop(request_id)]
+
+    def _reply_complete(self, request_id):
+        frames = self.early_replies.get(request_id)
+        return frames is not None and not frames[-1][0] & ProtocolParams.FLAG_MORE
+
+    def decode_reply(self, payloads):
+        """Decode the payloads of one reply, joining the chunks of a streamed listing."""
+        reply = self.codec.decode_reply(payloads[0])
+        for payload in payloads[1:]:
+            chunk = self.codec.decode_reply(payload)
+            if isinstance(reply, str):
+                reply += chunk
+            else:
+                reply.extend(chunk)
+        return reply
+
+    def update_type(self, server_message):
         if server_message == "You are registered as a renter.":
             self.type = "renter"
         elif server_message.startswith("You are registered as an owner. Your cars are:"):
             self.type = "owner"
-        elif server_message.startswith("Rental ended."):
+
+    def send_message(self, message):
+        server_message = self.request(message)
+        print(f"[Server]: {server_message}")
+        if server_message.startswith("Rental ended."):
             print("[Client]: Rental ended.")
             return
+
     def disconnect(self):
         self.client_socket.close()
 
@@ -37,8 +152,16 @@ if __name__ == "__main__":
 
     while True:
         message = input("Enter your command:")
+        if message == ProtocolParams.FRAMED_HANDSHAKE:
+            client.enable_framing()
+            print(f"[Server]: {ProtocolParams.FRAMED_ACK}")
+            continue
+        if message == ProtocolParams.BINARY_HANDSHAKE:
+            client.enable_binary()
+            print(f"[Server]: {ProtocolParams.BINARY_ACK}")
+            continue
         client.send_message(message)
         if message == "end_Rental":
             break
 
-    client.disconnect()
\ No newline at end of file
+    client.disconnect()
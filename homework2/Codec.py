@@ -0,0 +1,339 @@
+import itertools
+import struct
+
+from CarQuery import CarQuery
+from EventHub import EventFilter
+
+
+class CarListing:
+    """A reply made of car records, such as the post_Car and owner_Id listings."""
+    HEADERS = {"available": "", "owner": "You are registered as an owner. Your cars are: \n"}
+    """Text printed before the records of each kind of listing."""
+
+    def __init__(self, kind, cars, next_cursor=None, continued=False):
+        """
+        Initialize CarListing.
+
+        Args:
+            kind: "available" for post_Car, "owner" for owner_Id.
+            cars: The records, as returned by Car.to_dict; any iterable, consumed once.
+            next_cursor: For a page of a filtered listing, the cursor of the next page, if there is one.
+            continued: True for every chunk but the first of a streamed listing; these have no header.
+        """
+        self.kind = kind
+        self.cars = cars
+        self.next_cursor = next_cursor
+        self.continued = continued
+
+    def __str__(self):
+        text = ("" if self.continued else self.HEADERS[self.kind]) + "".join(f"{car}\n" for car in self.cars)
+        if self.next_cursor is not None:
+            text += f"next_Cursor: {self.next_cursor}\n"
+        return text
+
+    def split(self, size):
+        """
+        Cut the listing into chunks as its records are produced.
+
+        Args:
+            size: Maximum number of records per chunk.
+
+        Returns:
+            An iterator of CarListing chunks whose texts concatenate to the text
+            of the whole listing; the cursor is on the last chunk.
+        """
+        records = iter(self.cars)
+        chunk = list(itertools.islice(records, size))
+        continued = False
+        while True:
+            following = list(itertools.islice(records, size))
+            if not following:
+                yield CarListing(self.kind, chunk, self.next_cursor, continued)
+                return
+            yield CarListing(self.kind, chunk, None, continued)
+            chunk, continued = following, True
+
+    def extend(self, chunk):
+        """Append the records of a later chunk of the same listing."""
+        self.cars = list(self.cars) + list(chunk.cars)
+        self.next_cursor = chunk.next_cursor
+
+
+class CarEvents:
+    """Car state changes pushed to one subscription."""
+    KINDS = ("available", "rented", "removed", "price")
+
+    def __init__(self, subscription_id, events, overflowed=False):
+        """
+        Initialize CarEvents.
+
+        Args:
+            subscription_id: The subscription the events are for.
+            events: (kind, record) tuples; records are as returned by Car.to_dict.
+            overflowed: True if events were dropped because the subscriber fell behind;
+                it should list the cars again.
+        """
+        self.subscription_id = subscription_id
+        self.events = events
+        self.overflowed = overflowed
+
+    def __str__(self):
+        text = f"events: {self.subscription_id}\n" + "".join(f"{kind}: {record}\n" for kind, record in self.events)
+        if self.overflowed:
+            text += f"resync: {self.subscription_id}\n"
+        return text
+
+
+class TextCodec:
+    """The original human-readable protocol: commands like 'car_Id: 3', replies as plain text."""
+    name = "text"
+    PLAIN_COMMANDS = frozenset(["register_Renter", "register_Owner", "post_Car", "request_Car", "end_Rental",
+                                "pay_Rental", "start_Engine", "unlock_Car", "lock_Car", "change_Price"])
+    SEARCH_PREFIX = "post_Car:"
+    """A post_Car followed by filters asks for one page of matching cars (see CarQuery)."""
+    BATCH_COMMANDS = frozenset(["set_Prices", "lock_Cars", "unlock_Cars"])
+    """Owner commands applied to many cars at once: 'set_Prices: owner_id: car_id=price, ...' and
+    'lock_Cars: owner_id: car_id, ...' (likewise unlock_Cars)."""
+
+    def parse(self, message):
+        """
+        Parse a text command.
+
+        Args:
+            message: The command text.
+
+        Returns:
+            A (command, args) tuple; command is None if the text is not a valid command.
+        """
+        if message in self.PLAIN_COMMANDS:
+            return message, ()
+        try:
+            if message.startswith(self.SEARCH_PREFIX):
+                return "search_Cars", (CarQuery.parse(message[len(self.SEARCH_PREFIX):]),)
+            if message == "subscribe_Cars" or message.startswith("subscribe_Cars:"):
+                return "subscribe_Cars", (EventFilter.parse(message[len("subscribe_Cars:"):]),)
+            if message.startswith("unsubscribe_Cars"):
+                return "unsubscribe_Cars", (int(message.split(":")[1]),)
+            if message.startswith("nearby_Cars"):
+                lat, lon, k = message.split(":", 1)[1].split(",")
+                return "nearby_Cars", (float(lat), float(lon), int(k))
+            command = message.split(":", 1)[0]
+            if command in self.BATCH_COMMANDS:
+                owner_id, items = message.split(":", 2)[1:]
+                items = [item.strip() for item in items.split(",") if item.strip()]
+                if command == "set_Prices":
+                    items = [tuple(map(int, item.split("="))) for item in items]
+                    if any(len(item) != 2 for item in items):
+                        return None, ()
+                else:
+                    items = [int(item) for item in items]
+                return command, (int(owner_id), items)
+            if message.startswith("owner_Id"):
+                return "owner_Id", (int(message.split(":")[1]),)
+            if message.startswith("car_Id"):
+                return "car_Id", (int(message.split(":")[1]),)
+            if message[:1].isdigit():
+                owner_id, car_id, new_price = message.split(":")
+                return "set_Price", (int(owner_id), int(car_id), int(new_price))
+        except (IndexError, ValueError):
+            pass
+        return None, ()
+
+    def decode_command(self, payload):
+        return self.parse(payload.decode())
+
+    def encode_command(self, command, args):
+        if command in ("owner_Id", "car_Id", "unsubscribe_Cars"):
+            return f"{command}: {args[0]}".encode()
+        if command == "set_Price":
+            return ":".join(map(str, args)).encode()
+        if command == "nearby_Cars":
+            return f"{command}: {args[0]},{args[1]},{args[2]}".encode()
+        if command == "search_Cars":
+            return f"{self.SEARCH_PREFIX} {args[0]}".encode()
+        if command == "subscribe_Cars":
+            return f"{command}: {args[0]}".encode()
+        if command == "set_Prices":
+            return f"{command}: {args[0]}: {', '.join(f'{car_id}={price}' for car_id, price in args[1])}".encode()
+        if command in self.BATCH_COMMANDS:
+            return f"{command}: {args[0]}: {', '.join(map(str, args[1]))}".encode()
+        return (command or "").encode()
+
+    def encode_reply(self, reply):
+        return str(reply).encode()
+
+    def decode_reply(self, payload):
+        return payload.decode()
+
+
+class BinaryCodec:
+    """
+    Compact encoding: a one-byte opcode followed by struct-packed arguments.
+
+    Fixed replies shrink to a one-byte code and listings to packed records.
+    """
+    name = "binary"
+    COMMANDS = ("register_Renter", "register_Owner", "post_Car", "request_Car", "end_Rental", "pay_Rental",
+                "start_Engine", "unlock_Car", "lock_Car", "owner_Id", "change_Price", "car_Id", "set_Price",
+                "search_Cars", "nearby_Cars", "set_Prices", "lock_Cars", "unlock_Cars", "subscribe_Cars",
+                "unsubscribe_Cars")
+    """Opcode n + 1 is COMMANDS[n]; opcode 0 is an invalid command."""
+    TEXT_ARGUMENTS = {"search_Cars": CarQuery, "subscribe_Cars": EventFilter}
+    """Commands whose single argument is sent in its UTF-8 text form, with the class that parses it."""
+    ARGUMENTS = {"owner_Id": struct.Struct('<i'), "car_Id": struct.Struct('<i'), "set_Price": struct.Struct('<iii'),
+                 "nearby_Cars": struct.Struct('<ddi'), "unsubscribe_Cars": struct.Struct('<i')}
+    BATCH_ARGUMENTS = {"set_Prices": struct.Struct('<ii'), "lock_Cars": struct.Struct('<i'),
+                       "unlock_Cars": struct.Struct('<i')}
+    """Commands taking an owner id ('<i') followed by any number of items of this format."""
+    OWNER = struct.Struct('<i')
+    REPLIES = ("You are registered as a renter.", "Enter the Owner Id like this: 'owner_Id: id' ", "No cars found.",
+               "Enter the Id of the car and the new price like this: 'owner_Id: car_Id: new_price'",
+               "Price changed.", "Car not found.", "Enter the Id of requested car like this: 'car_Id: id'",
+               "Engine started.", "Car unlocked.", "Car locked.", "Rental paid.", "Rental started.",
+               "Car not found or not available.", "Rental ended.", "You have to pay the rental first.",
+               "You have to register first.", "Invalid command.")
+    """Reply code n + 1 is REPLIES[n]; code 0 is followed by free UTF-8 text."""
+    LISTING_CODES = {"available": 0xFE, "owner": 0xFF}
+    EVENTS_CODE = 0xFD
+    EVENTS = struct.Struct('<iIB')
+    """Events header after the code: subscription id, event count, overflowed; every record is
+    preceded by the index of its kind in CarEvents.KINDS."""
+    RECORD = struct.Struct('<iHi')
+    """Record fields: id, year, price; brand, model and location follow as short strings."""
+    CURSOR = struct.Struct('<i')
+    """Optional trailer of a listing: the cursor of the next page."""
+    NO_STRING = 0xFF
+
+    def __init__(self):
+        self.opcodes = {command: opcode for opcode, command in enumerate(self.COMMANDS, 1)}
+        self.reply_codes = {reply: code for code, reply in enumerate(self.REPLIES, 1)}
+        self.listing_kinds = {code: kind for kind, code in self.LISTING_CODES.items()}
+
+    def encode_command(self, command, args):
+        opcode = self.opcodes.get(command, 0)
+        if command in self.TEXT_ARGUMENTS:
+            return bytes((opcode,)) + str(args[0]).encode()
+        item = self.BATCH_ARGUMENTS.get(command)
+        if item is not None:
+            owner_id, items = args
+            if item.size == self.OWNER.size:
+                items = [(car_id,) for car_id in items]
+            return b"".join([bytes((opcode,)), self.OWNER.pack(owner_id), *(item.pack(*values) for values in items)])
+        arguments = self.ARGUMENTS.get(command)
+        if arguments is None:
+            return bytes((opcode,))
+        return bytes((opcode,)) + arguments.pack(*args)
+
+    def decode_command(self, payload):
+        """
+        Decode a binary command.
+
+        Args:
+            payload: The frame payload.
+
+        Returns:
+            A (command, args) tuple; command is None for an unknown opcode or malformed arguments.
+        """
+        opcode = payload[0] if payload else 0
+        if not 0 < opcode <= len(self.COMMANDS):
+            return None, ()
+        command = self.COMMANDS[opcode - 1]
+        if command in self.TEXT_ARGUMENTS:
+            try:
+                return command, (self.TEXT_ARGUMENTS[command].parse(payload[1:].decode()),)
+            except (UnicodeDecodeError, ValueError):
+                return None, ()
+        item = self.BATCH_ARGUMENTS.get(command)
+        if item is not None:
+            if len(payload) < 1 + self.OWNER.size or (len(payload) - 1 - self.OWNER.size) % item.size:
+                return None, ()
+            items = list(item.iter_unpack(payload[1 + self.OWNER.size:]))
+            if item.size == self.OWNER.size:
+                items = [car_id for car_id, in items]
+            return command, (self.OWNER.unpack_from(payload, 1)[0], items)
+        arguments = self.ARGUMENTS.get(command)
+        if arguments is None:
+            return command, ()
+        if len(payload) != 1 + arguments.size:
+            return None, ()
+        return command, arguments.unpack_from(payload, 1)
+
+    def encode_reply(self, reply):
+        if isinstance(reply, CarEvents):
+            parts = [bytes((self.EVENTS_CODE,)),
+                     self.EVENTS.pack(reply.subscription_id, len(reply.events), reply.overflowed)]
+            for kind, car in reply.events:
+                parts.append(bytes((CarEvents.KINDS.index(kind),)))
+                parts.append(self._encode_record(car))
+            return b"".join(parts)
+        if isinstance(reply, CarListing):
+            parts = [bytes((self.LISTING_CODES[reply.kind],)), len(reply.cars).to_bytes(4, 'little')]
+            parts.extend(map(self._encode_record, reply.cars))
+            if reply.next_cursor is not None:
+                parts.append(self.CURSOR.pack(reply.next_cursor))
+            return b"".join(parts)
+        code = self.reply_codes.get(reply)
+        if code is None:
+            return b"\x00" + reply.encode()
+        return bytes((code,))
+
+    def decode_reply(self, payload):
+        """
+        Decode a binary reply.
+
+        Args:
+            payload: The frame payload.
+
+        Returns:
+            The reply text, a CarListing for listings or CarEvents for pushed events.
+        """
+        code = payload[0]
+        if code == 0:
+            return payload[1:].decode()
+        if code == self.EVENTS_CODE:
+            subscription_id, count, overflowed = self.EVENTS.unpack_from(payload, 1)
+            offset = 1 + self.EVENTS.size
+            events = []
+            for _ in range(count):
+                kind = CarEvents.KINDS[payload[offset]]
+                car, offset = self._decode_record(payload, offset + 1)
+                events.append((kind, car))
+            return CarEvents(subscription_id, events, bool(overflowed))
+        if code not in self.listing_kinds:
+            return self.REPLIES[code - 1]
+        count = int.from_bytes(payload[1:5], 'little')
+        offset = 5
+        cars = []
+        for _ in range(count):
+            car, offset = self._decode_record(payload, offset)
+            cars.append(car)
+        next_cursor = self.CURSOR.unpack_from(payload, offset)[0] if len(payload) > offset else None
+        return CarListing(self.listing_kinds[code], cars, next_cursor)
+
+    def _encode_record(self, car):
+        return b"".join((self.RECORD.pack(car["id"], car["year"], car["price"]), self._encode_string(car["brand"]),
+                         self._encode_string(car["model"]), self._encode_string(car["location"])))
+
+    def _decode_record(self, payload, offset):
+        car_id, year, price = self.RECORD.unpack_from(payload, offset)
+        offset += self.RECORD.size
+        brand, offset = self._decode_string(payload, offset)
+        model, offset = self._decode_string(payload, offset)
+        location, offset = self._decode_string(payload, offset)
+        return {"id": car_id, "brand": brand, "model": model, "year": year, "price": price,
+                "location": location}, offset
+
+    def _encode_string(self, value):
+        if value is None:
+            return bytes((self.NO_STRING,))
+        data = str(value).encode()
+        if len(data) >= self.NO_STRING:
+            raise ValueError(f"String too long for the binary protocol: {value!r}")
+        return bytes((len(data),)) + data
+
+    def _decode_string(self, payload, offset):
+        size = payload[offset]
+        if size == self.NO_STRING:
+            return None, offset + 1
+        end = offset + 1 + size
+        return payload[offset + 1:end].decode(), end
@@ -0,0 +1,416 @@
+import bisect
+import operator
+import threading
+from array import array
+from functools import partial, reduce
+from itertools import compress, islice
+
+from Car import CompactCar
+
+try:
+    import numpy
+except ImportError:  # bulk queries fall back to C-level iterators over the columns
+    numpy = None
+
+
+class ColumnarParams:
+    """Parameters of the columnar fleet store."""
+    NO_RENTER = -1
+    """Value of the renter column for cars nobody is renting."""
+    SCAN_BLOCK_ROWS = 4096
+    """Rows a lazy search filters per step while holding the lock."""
+    UPDATABLE_FIELDS = frozenset(["paid", "lock", "start_engine"])
+    """Fields update_rented may set."""
+
+
+class ColumnarFleet:
+    """
+    A CarRegistry look-alike that stores the fleet column by column in typed arrays.
+
+    One car costs about 50 bytes instead of a few hundred for a Car object.
+    Rows are kept sorted by car id, so a car is found by binary search and
+    listings page through the rows in id order. Brands and models are stored
+    as codes into a table of distinct strings; the flags use the bits of
+    CompactCar. Bulk queries filter whole columns at once: with numpy
+    installed, through zero-copy views of the arrays, otherwise with
+    C-level iterators instead of a Python loop per car.
+
+    Owner and renter ids map to sorted arrays of the ids of their cars in two
+    dicts, as in CarRegistry, so owner and renter commands do not scan the
+    columns.
+
+    Ids, owner ids and renter ids must be ints. Car objects returned are
+    CompactCar snapshots of a row: change cars through the store.
+    Mutations are serialized by one lock, which queries also hold from
+    choosing their rows until the cars are built.
+    """
+
+    def __init__(self, cars=()):
+        """
+        Initialize ColumnarFleet.
+
+        Args:
+            cars: Cars to register up front.
+        """
+        self.ids = array('q')
+        self.years = array('H')
+        self.prices = array('i')
+        self.owner_ids = array('q')
+        self.renter_ids = array('q')
+        self.flags = array('B')
+        self.brands = array('I')
+        self.models = array('I')
+        self.columns = (self.ids, self.years, self.prices, self.owner_ids, self.renter_ids, self.flags,
+                        self.brands, self.models)
+        self.strings = []
+        self.string_codes = {}
+        self.ids_by_owner = {}
+        self.ids_by_renter = {}
+        self.lock = threading.Lock()
+        self.add_many(cars)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        with self.lock:
+            return iter([self._car(row) for row in range(len(self.ids))])
+
+    def add(self, car):
+        """Register a car, replacing any car that already has the same id."""
+        values = self._values(car)
+        with self.lock:
+            row = bisect.bisect_left(self.ids, car.id)
+            if row < len(self.ids) and self.ids[row] == car.id:
+                self._unindex(row)
+                for column, value in zip(self.columns, values):
+                    column[row] = value
+            elif row == len(self.ids):
+                for column, value in zip(self.columns, values):
+                    column.append(value)
+            else:
+                for column, value in zip(self.columns, values):
+                    column.insert(row, value)
+            self._index(car.id, car.owner_id, car.user_id)
+
+    def add_many(self, cars):
+        """Register many cars; a run of cars in increasing id order after the last id is appended in bulk."""
+        cars = list(cars)
+        with self.lock:
+            last_id = self.ids[-1] if self.ids else None
+        ids = [car.id for car in cars]
+        if any(b <= a for a, b in zip(ids, ids[1:])) or (last_id is not None and ids and ids[0] <= last_id):
+            for car in cars:
+                self.add(car)
+            return
+        values = [self._values(car) for car in cars]
+        with self.lock:
+            for column, column_values in zip(self.columns, zip(*values)):
+                column.extend(column_values)
+            for car in cars:
+                self._index(car.id, car.owner_id, car.user_id)
+
+    def remove(self, car_id):
+        with self.lock:
+            row = self._row(car_id)
+            if row is None:
+                return None
+            car = self._car(row)
+            self._unindex(row)
+            for column in self.columns:
+                del column[row]
+            return car
+
+    def get(self, car_id):
+        with self.lock:
+            row = self._row(car_id)
+            return None if row is None else self._car(row)
+
+    def owned_by(self, owner_id):
+        with self.lock:
+            return [self._car(row) for row in self._indexed_rows(self.ids_by_owner, owner_id)]
+
+    def rented_by(self, renter_id):
+        with self.lock:
+            return [self._car(row) for row in self._indexed_rows(self.ids_by_renter, renter_id)]
+
+    def available(self):
+        with self.lock:
+            return [self._car(row) for row in self._select_rows(None, None, None, None, True, 0, None)]
+
+    def select_rows(self, max_price=None, min_year=None, max_year=None, brand=None, available=True,
+                    start=0, stop=None):
+        """
+        Filter rows a whole column at a time.
+
+        Args:
+            max_price: Only cars costing at most this much.
+            min_year: Only cars made in this year or later.
+            max_year: Only cars made in this year or earlier.
+            brand: Only cars of this brand.
+            available: Only available cars.
+            start: First row to consider.
+            stop: Row to stop before; None for the end.
+
+        Returns:
+            The matching row numbers, in id order.
+        """
+        with self.lock:
+            return self._select_rows(max_price, min_year, max_year, brand, available, start, stop)
+
+    def _select_rows(self, max_price, min_year, max_year, brand, available, start, stop):
+        stop = len(self.ids) if stop is None else min(stop, len(self.ids))
+        if numpy is not None:
+            return self._select_rows_numpy(max_price, min_year, max_year, brand, available, start, stop).tolist()
+        masks = []
+        if available:
+            masks.append(map(CompactCar.AVAILABLE.__and__, islice(self.flags, start, stop)))
+        if max_price is not None:
+            masks.append(map(max_price.__ge__, islice(self.prices, start, stop)))
+        if min_year is not None:
+            masks.append(map(min_year.__le__, islice(self.years, start, stop)))
+        if max_year is not None:
+            masks.append(map(max_year.__ge__, islice(self.years, start, stop)))
+        if brand is not None:
+            code = self.string_codes.get(brand)
+            if code is None:
+                return []
+            masks.append(map(code.__eq__, islice(self.brands, start, stop)))
+        if not masks:
+            return list(range(start, stop))
+        return list(compress(range(start, stop), reduce(partial(map, operator.and_), masks)))
+
+    def available_ids(self, max_price=None):
+        """
+        Ids of the available cars, optionally only those costing at most max_price.
+
+        Returns:
+            An array of car ids, in id order.
+        """
+        with self.lock:
+            if numpy is None:
+                rows = self._select_rows(max_price, None, None, None, True, 0, None)
+                return array('q', map(self.ids.__getitem__, rows))
+            rows = self._select_rows_numpy(max_price, None, None, None, True, 0, len(self.ids))
+            return array('q', numpy.frombuffer(self.ids, numpy.int64)[rows].tobytes())
+
+    def search(self, query):
+        """
+        Yield the available cars matching a query, in id order, starting after its cursor.
+
+        Columns are filtered a block of rows at a time, so a page only reads
+        the rows it needs.
+
+        Args:
+            query: A CarQuery.
+        """
+        last_id = query.after
+        while True:
+            with self.lock:
+                start = 0 if last_id is None else bisect.bisect_right(self.ids, last_id)
+                if start >= len(self.ids):
+                    return
+                stop = start + ColumnarParams.SCAN_BLOCK_ROWS
+                last_id = self.ids[min(stop, len(self.ids)) - 1]
+                rows = self._select_rows(query.max_price, query.min_year, query.max_year, query.brand, True,
+                                         start, stop)
+                cars = [self._car(row) for row in rows]
+            for car in cars:
+                if query.near is None or query.matches(car):
+                    yield car
+
+    def rent(self, car_id, renter_id):
+        """
+        Hand an available car to a renter.
+
+        Args:
+            car_id: The id of the requested car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the rental started, False if the car does not exist or is taken.
+        """
+        with self.lock:
+            row = self._row(car_id)
+            if row is None or not self.flags[row] & CompactCar.AVAILABLE:
+                return False
+            self.flags[row] &= ~CompactCar.AVAILABLE
+            self.renter_ids[row] = renter_id
+            bisect.insort(self.ids_by_renter.setdefault(renter_id, array('q')), car_id)
+            return True
+
+    def end_rental(self, car_id, renter_id):
+        """
+        Return a paid car, if it is still rented by the given renter.
+
+        Args:
+            car_id: The id of the rented car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the car was released, False if it is not rented by this renter or not paid.
+        """
+        with self.lock:
+            row = self._row(car_id)
+            if row is None or self.renter_ids[row] != renter_id or not self.flags[row] & CompactCar.PAID:
+                return False
+            self._release(row)
+            return True
+
+    def cancel_rental(self, car_id, renter_id):
+        """Release a car, paid or not, if it is still rented by the given renter; returns whether it was."""
+        with self.lock:
+            row = self._row(car_id)
+            if row is None or self.renter_ids[row] != renter_id:
+                return False
+            self._release(row)
+            return True
+
+    def release(self, car):
+        """End the rental of a car and make it available again."""
+        with self.lock:
+            row = self._row(car.id)
+            if row is not None:
+                self._release(row)
+
+    def update_rented(self, renter_id, **fields):
+        """Set the given attributes on every car currently rented by a renter."""
+        for name in fields:
+            if name not in ColumnarParams.UPDATABLE_FIELDS:
+                raise AttributeError(f"{name} cannot be updated")
+        with self.lock:
+            for row in self._indexed_rows(self.ids_by_renter, renter_id):
+                for name, value in fields.items():
+                    bit = CompactCar.FLAG_BITS[name]
+                    self.flags[row] = self.flags[row] | bit if value else self.flags[row] & ~bit
+
+    def set_price(self, owner_id, car_id, price):
+        with self.lock:
+            row = self._row(car_id)
+            if row is None or self.owner_ids[row] != owner_id:
+                return False
+            self.prices[row] = price
+            return True
+
+    def set_prices(self, owner_id, prices):
+        """
+        Change the prices of many cars of one owner as a single transition.
+
+        Args:
+            owner_id: The owner; every car must be theirs.
+            prices: A dict or (car_id, price) pairs; the last price given for a car wins.
+
+        Returns:
+            The number of cars repriced, or None, with nothing changed, if a car does
+            not exist or belongs to someone else.
+        """
+        prices = dict(prices)
+        with self.lock:
+            rows = self._owned_rows(owner_id, prices)
+            if rows is None:
+                return None
+            for row, price in zip(rows, prices.values()):
+                self.prices[row] = price
+            return len(rows)
+
+    def set_locks(self, owner_id, car_ids, lock):
+        """
+        Lock or unlock many cars of one owner as a single transition; rented cars are left to their renters.
+
+        Returns:
+            The number of available cars changed, or None, with nothing changed, if a
+            car does not exist or belongs to someone else.
+        """
+        with self.lock:
+            rows = self._owned_rows(owner_id, set(car_ids))
+            if rows is None:
+                return None
+            rows = [row for row in rows if self.flags[row] & CompactCar.AVAILABLE]
+            for row in rows:
+                flags = self.flags[row]
+                self.flags[row] = flags | CompactCar.LOCKED if lock else flags & ~CompactCar.LOCKED
+            return len(rows)
+
+    def _owned_rows(self, owner_id, car_ids):
+        rows = [self._row(car_id) for car_id in car_ids]
+        if any(row is None or self.owner_ids[row] != owner_id for row in rows):
+            return None
+        return rows
+
+    def _select_rows_numpy(self, max_price, min_year, max_year, brand, available, start, stop):
+        # the views must not outlive the call: an array exporting its buffer cannot grow
+        mask = numpy.ones(stop - start, dtype=bool)
+        if available:
+            mask &= (numpy.frombuffer(self.flags, numpy.uint8)[start:stop] & CompactCar.AVAILABLE) != 0
+        if max_price is not None:
+            mask &= numpy.frombuffer(self.prices, numpy.int32)[start:stop] <= max_price
+        if min_year is not None or max_year is not None:
+            years = numpy.frombuffer(self.years, numpy.uint16)[start:stop]
+            if min_year is not None:
+                mask &= years >= min_year
+            if max_year is not None:
+                mask &= years <= max_year
+        if brand is not None:
+            code = self.string_codes.get(brand)
+            if code is None:
+                return numpy.zeros(0, dtype=numpy.intp)
+            mask &= numpy.frombuffer(self.brands, numpy.uint32)[start:stop] == code
+        return numpy.flatnonzero(mask) + start
+
+    def _values(self, car):
+        return (car.id, car.year, car.price, car.owner_id,
+                ColumnarParams.NO_RENTER if car.user_id is None else car.user_id,
+                (car.availability and CompactCar.AVAILABLE) | (car.paid and CompactCar.PAID)
+                | (car.lock and CompactCar.LOCKED) | (car.start_engine and CompactCar.ENGINE_STARTED),
+                self._code(car.brand), self._code(car.model))
+
+    def _release(self, row):
+        self._discard(self.ids_by_renter, self.renter_ids[row], self.ids[row])
+        self.flags[row] = (self.flags[row] | CompactCar.AVAILABLE) & ~CompactCar.PAID
+        self.renter_ids[row] = ColumnarParams.NO_RENTER
+
+    def _row(self, car_id):
+        row = bisect.bisect_left(self.ids, car_id)
+        return row if row < len(self.ids) and self.ids[row] == car_id else None
+
+    def _indexed_rows(self, index, key):
+        """The rows of the car ids an index holds under a key, in id order; the lock must be held."""
+        return [self._row(car_id) for car_id in index.get(key, ())]
+
+    def _index(self, car_id, owner_id, renter_id):
+        bisect.insort(self.ids_by_owner.setdefault(owner_id, array('q')), car_id)
+        if renter_id is not None:
+            bisect.insort(self.ids_by_renter.setdefault(renter_id, array('q')), car_id)
+
+    def _unindex(self, row):
+        car_id = self.ids[row]
+        self._discard(self.ids_by_owner, self.owner_ids[row], car_id)
+        self._discard(self.ids_by_renter, self.renter_ids[row], car_id)
+
+    @staticmethod
+    def _discard(index, key, car_id):
+        car_ids = index.get(key)
+        if car_ids is None:
+            return
+        position = bisect.bisect_left(car_ids, car_id)
+        if position < len(car_ids) and car_ids[position] == car_id:
+            del car_ids[position]
+            if not car_ids:
+                del index[key]
+
+    def _car(self, row):
+        car = CompactCar(self.strings[self.brands[row]], self.strings[self.models[row]], self.years[row],
+                         self.prices[row], self.owner_ids[row], self.ids[row])
+        renter_id = self.renter_ids[row]
+        car.user_id = None if renter_id == ColumnarParams.NO_RENTER else renter_id
+        car.flags = self.flags[row]
+        return car
+
+    def _code(self, string):
+        code = self.string_codes.get(string)
+        if code is None:
+            with self.lock:
+                code = self.string_codes.setdefault(string, len(self.strings))
+                if code == len(self.strings):
+                    self.strings.append(string)
+        return code
@@ -0,0 +1,283 @@
+import itertools
+import threading
+
+from CarQuery import distance_km, parse_location
+
+
+class EventParams:
+    """Parameters of car event subscriptions."""
+    AVAILABILITY_KINDS = frozenset(["available", "rented", "removed"])
+    PRICE_KINDS = frozenset(["price"])
+    KIND_GROUPS = {"available": "availability", "rented": "availability", "removed": "availability",
+                   "price": "price"}
+    """Group of each event kind; a pending event is only replaced by a newer one of the same group."""
+    REGISTRY_EVENTS = {"add": "available", "release": "available", "rent": "rented", "remove": "removed",
+                       "set_price": "price", "set_prices": "price"}
+    """Event kind sent for each registry transition; other transitions are not published."""
+    COALESCE_WINDOW_S = 0.05
+    """How long a sender waits after the first new event before sending, so a burst goes out coalesced."""
+    MAX_PENDING_EVENTS = 10000
+    """Undelivered events a connection may have; past it, a subscription is told to resync instead."""
+
+
+class EventFilter:
+    """
+    Which car events a subscription receives.
+
+    Its text form, used after 'subscribe_Cars:', is a ';'-separated list of
+    key=value pairs, for example
+    'subscribe_Cars: owner=11; brand=Audi; near=45.75,21.21,10; events=availability,price'.
+    Every key is optional; `events` is availability, price or both (the default).
+    """
+    __slots__ = ("owner_id", "brand", "near", "kinds")
+
+    def __init__(self, owner_id=None, brand=None, near=None, kinds=None):
+        """
+        Initialize EventFilter.
+
+        Args:
+            owner_id: Only cars of this owner.
+            brand: Only cars of this brand.
+            near: A (lat, lon, radius_km) tuple; only cars within the radius.
+            kinds: The event kinds wanted; None for all of them.
+        """
+        self.owner_id = owner_id
+        self.brand = brand
+        self.near = near
+        self.kinds = kinds if kinds is not None else EventParams.AVAILABILITY_KINDS | EventParams.PRICE_KINDS
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse the text form of a filter.
+
+        Args:
+            text: The part of the command after 'subscribe_Cars:'.
+
+        Returns:
+            The EventFilter.
+
+        Raises:
+            ValueError: If a key is unknown or a value malformed.
+        """
+        fields = {}
+        for item in text.split(";"):
+            if not item.strip():
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key == "owner":
+                fields["owner_id"] = int(value)
+            elif key == "brand":
+                fields["brand"] = value
+            elif key == "near":
+                lat, lon, radius_km = map(float, value.split(","))
+                fields["near"] = (lat, lon, radius_km)
+            elif key == "events":
+                kinds = set()
+                for group in value.split(","):
+                    if group.strip() == "availability":
+                        kinds |= EventParams.AVAILABILITY_KINDS
+                    elif group.strip() == "price":
+                        kinds |= EventParams.PRICE_KINDS
+                    else:
+                        raise ValueError(f"Unknown event group: {group}")
+                fields["kinds"] = frozenset(kinds)
+            else:
+                raise ValueError(f"Unknown filter: {key}")
+        return cls(**fields)
+
+    def __str__(self):
+        items = []
+        if self.owner_id is not None:
+            items.append(f"owner={self.owner_id}")
+        if self.brand is not None:
+            items.append(f"brand={self.brand}")
+        if self.near is not None:
+            items.append("near={},{},{}".format(*self.near))
+        groups = [group for group, kinds in (("availability", EventParams.AVAILABILITY_KINDS),
+                                             ("price", EventParams.PRICE_KINDS)) if kinds <= self.kinds]
+        items.append(f"events={','.join(groups)}")
+        return "; ".join(items)
+
+    def matches(self, kind, car, location):
+        if kind not in self.kinds:
+            return False
+        if self.owner_id is not None and car.owner_id != self.owner_id:
+            return False
+        if self.brand is not None and car.brand != self.brand:
+            return False
+        if self.near is not None:
+            position = parse_location(location)
+            if position is None or distance_km(*position, self.near[0], self.near[1]) > self.near[2]:
+                return False
+        return True
+
+
+class ClientEvents:
+    """
+    The undelivered events of one connection.
+
+    Events are coalesced per subscription, car and kind group: a car whose
+    availability or price changes again before the last change was sent has
+    only its latest availability and latest price sent, so a price change
+    never hides that the car was rented or removed meanwhile. A
+    connection that falls more than `max_pending` events behind loses the
+    events of the subscription that overflowed it and gets a resync marker
+    for that subscription instead, so a slow reader costs bounded memory.
+    """
+
+    def __init__(self, client_id, max_pending=EventParams.MAX_PENDING_EVENTS):
+        self.client_id = client_id
+        self.max_pending = max_pending
+        self.subscriptions = {}
+        self.pending = {}
+        self.overflowed = set()
+        self.lock = threading.Lock()
+        self.waker = None
+        self.signalled = False
+        self.closed = False
+
+    def set_waker(self, waker):
+        """
+        Register the function that tells the sender of this connection there is something to send.
+
+        Args:
+            waker: Called without arguments, from any thread, once per batch of new events.
+        """
+        with self.lock:
+            self.waker = waker
+            self.signalled = bool(self.pending or self.overflowed or self.closed)
+        if self.signalled:
+            waker()
+
+    def offer(self, subscription_id, kind, record):
+        with self.lock:
+            if self.closed or subscription_id in self.overflowed:
+                return
+            key = (subscription_id, record["id"], EventParams.KIND_GROUPS[kind])
+            self.pending.pop(key, None)
+            self.pending[key] = (kind, record)
+            if len(self.pending) > self.max_pending:
+                self.pending = {key: event for key, event in self.pending.items() if key[0] != subscription_id}
+                self.overflowed.add(subscription_id)
+            waker = self.waker if not self.signalled else None
+            self.signalled = True
+        if waker is not None:
+            waker()
+
+    def drain(self):
+        """
+        Take every undelivered event.
+
+        Returns:
+            A dict mapping subscription id to a (list of (kind, record), overflowed) tuple.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            overflowed, self.overflowed = self.overflowed, set()
+            self.signalled = False
+        batches = {subscription_id: ([], True) for subscription_id in overflowed}
+        for (subscription_id, car_id, group), event in pending.items():
+            batches.setdefault(subscription_id, ([], False))[0].append(event)
+        return batches
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            waker = self.waker
+        if waker is not None:
+            waker()
+
+
+class EventHub:
+    """
+    Publishes car state changes of a registry to filtered subscriptions.
+
+    Subscriptions are indexed by owner and by brand, so a transition is only
+    matched against the subscriptions that can possibly want it. The index is
+    replaced, never changed in place, so the registry listener reads it
+    without taking a lock.
+    """
+
+    def __init__(self, max_pending=EventParams.MAX_PENDING_EVENTS):
+        self.max_pending = max_pending
+        self.clients = {}
+        self.filters = {}
+        self.by_owner = {}
+        self.by_brand = {}
+        self.unindexed = ()
+        self.lock = threading.Lock()
+        self.next_subscription_id = itertools.count(1)
+
+    def attach(self, registry):
+        registry.add_listener(self.on_car_event)
+
+    def open_client(self, client_id):
+        """Let a connection subscribe; returns its ClientEvents."""
+        with self.lock:
+            return self.clients.setdefault(client_id, ClientEvents(client_id, self.max_pending))
+
+    def close_client(self, client_id):
+        """Drop every subscription of a connection and stop its sender."""
+        with self.lock:
+            events = self.clients.pop(client_id, None)
+            if events is None:
+                return
+            for subscription_id in events.subscriptions:
+                del self.filters[subscription_id]
+            self._reindex()
+        events.close()
+
+    def subscribe(self, client_id, event_filter):
+        """
+        Start sending a connection the events that pass a filter.
+
+        Returns:
+            The subscription id, or None if the connection cannot receive events.
+        """
+        with self.lock:
+            events = self.clients.get(client_id)
+            if events is None:
+                return None
+            subscription_id = next(self.next_subscription_id)
+            events.subscriptions[subscription_id] = event_filter
+            self.filters[subscription_id] = (event_filter, events)
+            self._reindex()
+            return subscription_id
+
+    def unsubscribe(self, client_id, subscription_id):
+        """Stop a subscription of a connection; returns False if it has no such subscription."""
+        with self.lock:
+            events = self.clients.get(client_id)
+            if events is None or events.subscriptions.pop(subscription_id, None) is None:
+                return False
+            del self.filters[subscription_id]
+            self._reindex()
+            return True
+
+    def on_car_event(self, event, cars):
+        """Registry listener: queue the transition for every subscription it passes."""
+        kind = EventParams.REGISTRY_EVENTS.get(event)
+        if kind is None or not self.filters:
+            return
+        by_owner, by_brand, unindexed = self.by_owner, self.by_brand, self.unindexed
+        for car in cars:
+            candidates = by_owner.get(car.owner_id, ()) + by_brand.get(car.brand, ()) + unindexed
+            if not candidates:
+                continue
+            record = car.to_dict()
+            for subscription_id, event_filter, events in candidates:
+                if event_filter.matches(kind, car, record["location"]):
+                    events.offer(subscription_id, kind, record)
+
+    def _reindex(self):
+        by_owner, by_brand, unindexed = {}, {}, []
+        for subscription_id, (event_filter, events) in self.filters.items():
+            entry = (subscription_id, event_filter, events)
+            if event_filter.owner_id is not None:
+                by_owner[event_filter.owner_id] = by_owner.get(event_filter.owner_id, ()) + (entry,)
+            elif event_filter.brand is not None:
+                by_brand[event_filter.brand] = by_brand.get(event_filter.brand, ()) + (entry,)
+            else:
+                unindexed.append(entry)
+        self.by_owner, self.by_brand, self.unindexed = by_owner, by_brand, tuple(unindexed)
@@ -0,0 +1,201 @@
+import heapq
+import math
+import threading
+
+from CarQuery import parse_location
+
+
+class GeoParams:
+    """Parameters of the spatial index."""
+    CELL_DEG = 0.005
+    """Grid cell size in degrees of latitude and longitude (about 550 m north-south)."""
+    MAX_NEARBY = 100
+    """Most cars one nearby_Cars query returns."""
+
+
+def nearest_linear(cars, lat, lon, k):
+    """
+    Find the k nearest cars by looking at every car; the baseline for GeoIndex.nearest.
+
+    Args:
+        cars: Iterable of Car objects.
+        lat: Latitude of the query point.
+        lon: Longitude of the query point.
+        k: Number of cars to return.
+
+    Returns:
+        Up to k cars, nearest first, with the same distance as GeoIndex.
+    """
+    lon_scale = math.cos(math.radians(lat))
+    located = []
+    for car in cars:
+        location = parse_location(car.get_location())
+        if location is not None:
+            located.append(((location[0] - lat) ** 2 + ((location[1] - lon) * lon_scale) ** 2, car.id, car))
+    return [car for _, _, car in heapq.nsmallest(k, located, key=lambda entry: entry[:2])]
+
+
+class GeoIndex:
+    """
+    A uniform lat/lon grid over the located, available cars.
+
+    A nearest-cars query looks at the cell of the query point, then at rings
+    of cells around it, and stops as soon as no unvisited cell can hold a car
+    closer than the k-th best found. Cars are ranked by the equirectangular
+    distance at the query latitude, which matches the great-circle distance
+    to well under 1% at city scale.
+
+    The index follows the registry (cars are added, rented, released or
+    removed) and the location cache (cars move), so it never has to be rebuilt.
+    """
+
+    def __init__(self, cell_deg=GeoParams.CELL_DEG):
+        """
+        Initialize GeoIndex.
+
+        Args:
+            cell_deg: Grid cell size in degrees.
+        """
+        self.cell_deg = cell_deg
+        self.cells = {}  # (row, col) -> {car_id: (lat, lon)}
+        self.positions = {}  # car_id -> (lat, lon) of every located car
+        self.available = set()
+        self.min_row = self.max_row = self.min_col = self.max_col = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(cell) for cell in self.cells.values())
+
+    def attach(self, registry, location_provider):
+        """
+        Index a registry's available cars and follow their changes.
+
+        Args:
+            registry: A CarRegistry.
+            location_provider: The CachedLocationProvider the cars are located with.
+        """
+        registry.add_listener(self.on_car_event)
+        location_provider.add_listener(self.on_location)
+        for car in registry:
+            self.on_location(car.id, location_provider.peek(car.id))
+            self.on_car_event("add", [car])
+
+    def on_car_event(self, event, cars):
+        """Registry listener: keep the set of available cars in the grid."""
+        if event == "remove":
+            with self.lock:
+                for car in cars:
+                    self._unplace(car.id)
+                    self.available.discard(car.id)
+                    self.positions.pop(car.id, None)
+        elif event in ("add", "rent", "release"):
+            with self.lock:
+                for car in cars:
+                    if car.availability == 1:
+                        self.available.add(car.id)
+                        self._place(car.id)
+                    else:
+                        self.available.discard(car.id)
+                        self._unplace(car.id)
+
+    def on_location(self, car_id, location):
+        """Location cache listener: move a car to its new cell."""
+        position = parse_location(location)
+        if position is None:
+            return
+        with self.lock:
+            if self.positions.get(car_id) == position:
+                return
+            self._unplace(car_id)
+            self.positions[car_id] = position
+            if car_id in self.available:
+                self._place(car_id)
+
+    def nearest(self, lat, lon, k):
+        """
+        Find the k available cars nearest to a point.
+
+        Args:
+            lat: Latitude of the query point.
+            lon: Longitude of the query point.
+            k: Number of cars to return.
+
+        Returns:
+            Up to k car ids, nearest first.
+        """
+        if k <= 0:
+            return []
+        row, col = self._cell(lat, lon)
+        lon_scale = math.cos(math.radians(lat))
+        best = []  # max-heap of (-squared distance, -car id), at most k entries
+
+        def visit(cars):
+            for car_id, (car_lat, car_lon) in cars.items():
+                entry = (-((car_lat - lat) ** 2 + ((car_lon - lon) * lon_scale) ** 2), -car_id)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        with self.lock:
+            max_ring = max(row - self.min_row, self.max_row - row, col - self.min_col, self.max_col - col)
+            ring = 0
+            while ring <= max_ring and self.cells:
+                if 8 * ring > len(self.cells):
+                    # sparse grid: visiting the remaining occupied cells is cheaper than walking rings
+                    for (cell_row, cell_col), cars in self.cells.items():
+                        if max(abs(cell_row - row), abs(cell_col - col)) >= ring:
+                            visit(cars)
+                    break
+                for cell in self._ring(row, col, ring):
+                    cars = self.cells.get(cell)
+                    if cars is not None:
+                        visit(cars)
+                # every car in the next rings is at least `ring` whole cells away in one direction
+                reach = ring * self.cell_deg * lon_scale
+                if len(best) == k and -best[0][0] <= reach * reach:
+                    break
+                ring += 1
+        return [-car_id for _, car_id in sorted(best, reverse=True)]
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+    def _place(self, car_id):
+        position = self.positions.get(car_id)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        cars = self.cells.get(cell)
+        if cars is None:
+            if not self.cells:
+                self.min_row = self.max_row = cell[0]
+                self.min_col = self.max_col = cell[1]
+            cars = self.cells[cell] = {}
+            # the bounds only grow until the grid empties; they just cap how far a query searches
+            self.min_row, self.max_row = min(self.min_row, cell[0]), max(self.max_row, cell[0])
+            self.min_col, self.max_col = min(self.min_col, cell[1]), max(self.max_col, cell[1])
+        cars[car_id] = position
+
+    def _unplace(self, car_id):
+        position = self.positions.get(car_id)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        cars = self.cells.get(cell)
+        if cars is not None:
+            cars.pop(car_id, None)
+            if not cars:
+                del self.cells[cell]
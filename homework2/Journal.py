@@ -0,0 +1,212 @@
+import glob
+import json
+import os
+import threading
+
+from Car import Car
+
+
+class JournalParams:
+    """Parameters of the fleet journal."""
+    SNAPSHOT_FILE = "fleet.snapshot"
+    SEGMENT_PREFIX = "fleet.journal."
+    """Journal segment files are named with this prefix and the sequence number of their first entry."""
+    FSYNC_INTERVAL_S = 0.05
+    """Group-commit window: entries are written and fsynced together at most this often."""
+    SNAPSHOT_EVERY = 500000
+    """Take a snapshot after this many journal entries."""
+
+
+def car_state(car):
+    """Return the persistent fields of a car as a list, in the order car_from_state expects."""
+    return [car.id, car.brand, car.model, car.year, car.price, car.owner_id,
+            car.availability, car.paid, car.user_id, car.lock, car.start_engine]
+
+
+def car_from_state(state):
+    car_id, brand, model, year, price, owner_id, availability, paid, user_id, lock, start_engine = state
+    car = Car(brand, model, year, price, owner_id, car_id)
+    car.availability = availability
+    car.paid = paid
+    car.user_id = user_id
+    car.lock = lock
+    car.start_engine = start_engine
+    return car
+
+
+class Journal:
+    """
+    Append-only journal of fleet state changes, with periodic compact snapshots.
+
+    Every entry stores the full resulting state of the cars a transition
+    touched, so replaying is idempotent and a snapshot taken while rentals
+    continue is repaired by the entries that follow it. Entries are buffered
+    and written with one fsync per group-commit window instead of one per
+    operation; a crash can lose at most the last window.
+    """
+
+    def __init__(self, directory, fsync_interval_s=JournalParams.FSYNC_INTERVAL_S,
+                 snapshot_every=JournalParams.SNAPSHOT_EVERY):
+        """
+        Initialize Journal.
+
+        Args:
+            directory: Where the snapshot and journal segments live; created if missing.
+            fsync_interval_s: The group-commit window in seconds.
+            snapshot_every: Number of entries between automatic snapshots.
+        """
+        self.directory = directory
+        self.fsync_interval_s = fsync_interval_s
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.pending = []
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.segment = None
+        self.registry = None
+        self.stopped = threading.Event()
+        self.flusher = None
+
+    def recover(self):
+        """
+        Rebuild the fleet from the last snapshot and the journal entries after it.
+
+        Returns:
+            The recovered Car objects, or an empty list for a fresh directory.
+        """
+        states = {}
+        snapshot_path = os.path.join(self.directory, JournalParams.SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as snapshot:
+                self.snapshot_seq = json.loads(snapshot.readline())["seq"]
+                for line in snapshot:
+                    state = json.loads(line)
+                    states[state[0]] = state
+        self.seq = self.snapshot_seq
+        for path in self._segments():
+            with open(path, "rb") as segment:
+                offset = 0
+                for line in segment:
+                    if not line.endswith(b"\n"):
+                        # a torn write at the end of the last segment; cut it off, or the entries
+                        # appended after recovery would be glued to it
+                        os.truncate(path, offset)
+                        break
+                    offset += len(line)
+                    seq, event, records = json.loads(line)
+                    if seq <= self.snapshot_seq:
+                        continue
+                    self.seq = seq
+                    if event == "remove":
+                        for car_id in records:
+                            states.pop(car_id, None)
+                    else:
+                        for state in records:
+                            states[state[0]] = state
+        return [car_from_state(state) for state in states.values()]
+
+    def attach(self, registry):
+        """
+        Start journaling the transitions of a registry.
+
+        Args:
+            registry: The CarRegistry to follow; it is also what snapshots are taken of.
+        """
+        self.registry = registry
+        self._open_segment(self.seq + 1)
+        registry.add_listener(self.record)
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def record(self, event, cars):
+        """
+        Append one entry. Called by the registry under the lock of the cars involved.
+
+        Args:
+            event: The name of the transition.
+            cars: The cars it changed.
+        """
+        if event == "remove":
+            records = [car.id for car in cars]
+        else:
+            records = [car_state(car) for car in cars]
+        with self.lock:
+            self.seq += 1
+            self.pending.append((self.seq, event, records))
+
+    def sync(self):
+        """Write and fsync every buffered entry now."""
+        with self.write_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            self._write(pending)
+
+    def snapshot(self):
+        """
+        Write a compact snapshot of the whole fleet and drop the journal segments it covers.
+
+        Returns:
+            The sequence number the snapshot is consistent with.
+        """
+        with self.write_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+                seq = self.seq
+            self._write(pending)
+            current = self._open_segment(seq + 1)
+            # with no entries since the last segment was opened, the new segment reuses its name
+            covered_segments = [path for path in self._segments() if path != current]
+        # cars keep changing while they are copied; every such change has a
+        # sequence number above `seq` and is replayed on top of the snapshot
+        cars = list(self.registry)
+        path = os.path.join(self.directory, JournalParams.SNAPSHOT_FILE)
+        with open(path + ".tmp", "w") as snapshot:
+            snapshot.write(json.dumps({"seq": seq}) + "\n")
+            snapshot.writelines(json.dumps(car_state(car)) + "\n" for car in cars)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(path + ".tmp", path)
+        self._fsync_directory()
+        for segment in covered_segments:
+            os.remove(segment)
+        self.snapshot_seq = seq
+        return seq
+
+    def close(self):
+        self.stopped.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.sync()
+        if self.segment is not None:
+            self.segment.close()
+
+    def _flush_loop(self):
+        while not self.stopped.wait(self.fsync_interval_s):
+            self.sync()
+            if self.seq - self.snapshot_seq >= self.snapshot_every:
+                self.snapshot()
+
+    def _write(self, entries):
+        if entries:
+            self.segment.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+
+    def _open_segment(self, first_seq):
+        if self.segment is not None:
+            self.segment.close()
+        path = os.path.join(self.directory, f"{JournalParams.SEGMENT_PREFIX}{first_seq:012d}")
+        self.segment = open(path, "a")
+        return path
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, JournalParams.SEGMENT_PREFIX + "*")))
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
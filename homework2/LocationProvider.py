@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import threading
+import time
+
+from ServerLog import get_logger, log
+
+logger = get_logger("locations")
+
+
+class IpInfoLocationProvider:
+    """Looks car locations up on ipinfo.io."""
+    URL = 'https://ipinfo.io/json'
+
+    def __init__(self, timeout_s=2):
+        """
+        Initialize IpInfoLocationProvider.
+
+        Args:
+            timeout_s: HTTP timeout in seconds for one lookup.
+        """
+        self.timeout_s = timeout_s
+
+    def lookup(self, car_ids):
+        """
+        Look up the locations of several cars.
+
+        ipinfo.io locates the machine that makes the request, so the whole
+        batch is answered with a single HTTP round-trip.
+
+        Args:
+            car_ids: The ids of the cars to locate.
+
+        Returns:
+            A dict mapping car id to a "lat,lon" string.
+        """
+        import requests
+
+        response = requests.get(self.URL, timeout=self.timeout_s)
+        location = response.json().get('loc')
+        return {car_id: location for car_id in car_ids}
+
+
+class StaticLocationProvider:
+    """A provider that answers from a fixed table, without any network access."""
+
+    def __init__(self, locations=None, default="45.7489,21.2087"):
+        """
+        Initialize StaticLocationProvider.
+
+        Args:
+            locations: Optional dict mapping car id to a "lat,lon" string.
+            default: The location of cars missing from `locations`.
+        """
+        self.locations = dict(locations or {})
+        self.default = default
+        self.lookup_calls = 0
+
+    def lookup(self, car_ids):
+        self.lookup_calls += 1
+        return {car_id: self.locations.get(car_id, self.default) for car_id in car_ids}
+
+
+class CachedLocationProvider:
+    """
+    A TTL cache in front of a location provider.
+
+    `get` only reads the cache and never blocks on the network; missing and
+    expired entries are queued and fetched in batches by `refresh`, which runs
+    on a background thread once `start_refresh` is called.
+    """
+
+    def __init__(self, provider, ttl_s=300, batch_size=500):
+        """
+        Initialize CachedLocationProvider.
+
+        Args:
+            provider: Any object with a `lookup(car_ids) -> dict` method.
+            ttl_s: How long a cached location stays fresh, in seconds.
+            batch_size: Maximum number of cars per provider lookup.
+        """
+        self.provider = provider
+        self.ttl_s = ttl_s
+        self.batch_size = batch_size
+        self.locations = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.refresh_thread = None
+        self.stopped = False
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Subscribe to location updates.
+
+        Args:
+            listener: Called as listener(car_id, location) whenever a location is stored.
+        """
+        self.listeners.append(listener)
+
+    def get(self, car_id):
+        """
+        Return the cached location of a car.
+
+        Args:
+            car_id: The id of the car.
+
+        Returns:
+            The last known "lat,lon" string, or None if the car was never located.
+        """
+        entry = self.locations.get(car_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_s:
+            with self.lock:
+                self.pending.add(car_id)
+            self.wakeup.set()
+        return entry[0] if entry is not None else None
+
+    def peek(self, car_id):
+        """Return the cached location of a car, fresh or not, without queuing a refresh."""
+        entry = self.locations.get(car_id)
+        return entry[0] if entry is not None else None
+
+    def prefetch(self, car_ids):
+        """Queue cars for the next background refresh without waiting for it."""
+        with self.lock:
+            self.pending.update(car_ids)
+        self.wakeup.set()
+
+    def put(self, car_id, location):
+        self.locations[car_id] = (location, time.monotonic())
+        self._notify(car_id, location)
+
+    def refresh(self, car_ids=None):
+        """
+        Fetch locations for the given cars, or for every queued car, in batches.
+
+        Args:
+            car_ids: The cars to refresh. Defaults to the cars queued by `get`.
+
+        Returns:
+            The number of cars refreshed.
+        """
+        if car_ids is None:
+            with self.lock:
+                car_ids, self.pending = self.pending, set()
+        car_ids = list(car_ids)
+        for start in range(0, len(car_ids), self.batch_size):
+            batch = car_ids[start:start + self.batch_size]
+            try:
+                found = self.provider.lookup(batch)
+            except Exception:
+                log(logger, logging.WARNING, "location lookup failed", cars=len(batch), exc_info=True)
+                with self.lock:
+                    self.pending.update(car_ids[start:])
+                return start
+            now = time.monotonic()
+            for car_id, location in found.items():
+                self.locations[car_id] = (location, now)
+                self._notify(car_id, location)
+        return len(car_ids)
+
+    async def refresh_async(self, car_ids=None):
+        """Run `refresh` in the default executor so an event loop is never blocked."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh, car_ids)
+
+    def start_refresh(self, interval_s=5.0):
+        """Start the background thread that refreshes queued locations."""
+        if self.refresh_thread is not None:
+            return
+        self.stopped = False
+        self.refresh_thread = threading.Thread(target=self._refresh_loop, args=(interval_s,), daemon=True)
+        self.refresh_thread.start()
+
+    def stop_refresh(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def _refresh_loop(self, interval_s):
+        while not self.stopped:
+            self.wakeup.wait(interval_s)
+            self.wakeup.clear()
+            if not self.stopped:
+                queued = len(self.pending)
+                if self.refresh() < queued:
+                    # back off instead of retrying a failing provider on every cache miss
+                    time.sleep(interval_s)
+
+    def _notify(self, car_id, location):
+        for listener in self.listeners:
+            listener(car_id, location)
@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MetricsParams:
+    """Parameters of the metrics registry."""
+    LATENCY_BUCKETS_S = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 2.5)
+    """Upper bounds of the latency histogram buckets; a last bucket catches everything slower."""
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+    """The Prometheus text exposition format, which the scrape port serves."""
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their count and sum."""
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=MetricsParams.LATENCY_BUCKETS_S):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in; None without observations."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    """A monotonically increasing count, safe to increment from any thread."""
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """
+    Named metrics of one process, rendered in the Prometheus text format.
+
+    Counters and histograms are updated where things happen; gauges and
+    collectors are functions called only when the metrics are scraped, so
+    values that already exist elsewhere (open sessions, per-command counters
+    of the router) cost nothing on the hot path.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.collectors = []
+        self.descriptions = {}
+        self.http_server = None
+
+    def counter(self, name, description, labels=None):
+        """
+        Return the counter of a name and label set, creating it on first use.
+
+        Args:
+            name: The metric name.
+            description: One line describing it.
+            labels: Optional dict of label values.
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        counter = self.counters.get(key)
+        if counter is None:
+            self.descriptions[name] = ("counter", description)
+            counter = self.counters.setdefault(key, Counter())
+        return counter
+
+    def gauge(self, name, description, function):
+        """
+        Register a gauge read at scrape time.
+
+        Args:
+            name: The metric name.
+            description: One line describing it.
+            function: Called without arguments; returns the current value.
+        """
+        self.descriptions[name] = ("gauge", description)
+        self.gauges[name] = function
+
+    def collector(self, function):
+        """
+        Register a function adding metrics at scrape time.
+
+        Args:
+            function: Called without arguments; returns (name, type, description, samples) tuples,
+                where samples is a list of (labels dict, value) or, for histograms, (labels dict, Histogram).
+        """
+        self.collectors.append(function)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        families = {}
+        for (name, labels), counter in self.counters.items():
+            families.setdefault(name, []).append((dict(labels), counter.value))
+        for name, function in self.gauges.items():
+            families[name] = [({}, function())]
+        lines = []
+        for name, samples in families.items():
+            kind, description = self.descriptions[name]
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{self._labels(labels)} {value}" for labels, value in samples)
+        for function in self.collectors:
+            for name, kind, description, samples in function():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if kind == "histogram":
+                        lines.extend(self._histogram_lines(name, labels, value))
+                    else:
+                        lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host, port):
+        """
+        Serve the metrics over HTTP from a background thread.
+
+        Args:
+            host: The address to listen on; keep it local.
+            port: The port to listen on.
+
+        Returns:
+            The HTTP server; its server_address holds the actual port when 0 was asked for.
+        """
+        registry = self
+
+        class ScrapeHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", MetricsParams.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((host, port), ScrapeHandler)
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        return self.http_server
+
+    def stop(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    def _histogram_lines(self, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{name}_bucket{self._labels({**labels, 'le': le})} {cumulative}"
+        yield f"{name}_sum{self._labels(labels)} {histogram.sum}"
+        yield f"{name}_count{self._labels(labels)} {histogram.count}"
+
+
+class RateMeter:
+    """Turns a growing total into a per-second rate, averaged since the previous reading."""
+
+    def __init__(self, total):
+        """
+        Initialize RateMeter.
+
+        Args:
+            total: Called without arguments; returns the current total.
+        """
+        self.total = total
+        self.last_time = time.monotonic()
+        self.last_total = total()
+        self.lock = threading.Lock()
+
+    def rate(self):
+        with self.lock:
+            now, total = time.monotonic(), self.total()
+            elapsed = now - self.last_time
+            rate = (total - self.last_total) / elapsed if elapsed > 0 else 0.0
+            self.last_time, self.last_total = now, total
+            return rate
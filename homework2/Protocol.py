@@ -0,0 +1,102 @@
+import struct
+
+from Codec import BinaryCodec, TextCodec
+
+
+class ProtocolParams:
+    """Parameters of the framed carsharing protocol."""
+    FRAME_HEADER = struct.Struct('<IIB')
+    """Frame header: payload size in bytes, request id, flags."""
+    MAX_FRAME_SIZE_BYTES = 16 * 1024 * 1024
+    """Frames announcing a larger payload are rejected."""
+    CHUNK_SIZE_BYTES = 64 * 1024
+    """Size of the data chunks for receiving."""
+    FLAG_MORE = 0x01
+    """Frame flag set on every frame of a streamed reply but the last."""
+    LISTING_CHUNK_RECORDS = 256
+    """Car records per chunk when a listing is streamed."""
+    PUSH_REQUEST_ID = 0
+    """Request id of frames the server sends unasked, such as subscribed car events; clients never use it."""
+    FRAMED_HANDSHAKE = "framed_Protocol"
+    """Text command a client sends to switch its connection to framed mode."""
+    FRAMED_ACK = "Framed protocol enabled."
+    """Text reply confirming the switch; every later message on the connection is framed."""
+    BINARY_HANDSHAKE = "binary_Protocol"
+    """Text command a client sends to switch its connection to framed mode with binary payloads."""
+    BINARY_ACK = "Binary protocol enabled."
+    """Text reply confirming the switch to framed binary mode."""
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends bytes that are not a valid frame."""
+
+
+def encode_frame(request_id, payload, flags=0):
+    """
+    Build one frame.
+
+    Args:
+        request_id: The id that pairs a reply with its request.
+        payload: The message bytes.
+        flags: Frame flags.
+
+    Returns:
+        The header followed by the payload.
+    """
+    return ProtocolParams.FRAME_HEADER.pack(len(payload), request_id, flags) + payload
+
+
+class FrameDecoder:
+    """Splits a byte stream into frames, however the stream was chunked by the socket."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received bytes and return every frame they complete.
+
+        Args:
+            data: Bytes read from the socket.
+
+        Returns:
+            A list of (request_id, flags, payload) tuples, possibly empty.
+        """
+        self.buffer += data
+        header = ProtocolParams.FRAME_HEADER
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= header.size:
+            size, request_id, flags = header.unpack_from(self.buffer, offset)
+            if size > ProtocolParams.MAX_FRAME_SIZE_BYTES:
+                raise ProtocolError(f"Frame of {size} bytes exceeds the limit.")
+            end = offset + header.size + size
+            if len(self.buffer) < end:
+                break
+            frames.append((request_id, flags, bytes(self.buffer[offset + header.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+
+
+class ProtocolState:
+    """Per-connection protocol state: unframed text until the client negotiates another mode."""
+
+    def __init__(self):
+        self.decoder = None
+        self.codec = TEXT_CODEC
+
+    @property
+    def framed(self):
+        return self.decoder is not None
+
+    def enable_framing(self, codec=None):
+        self.decoder = FrameDecoder()
+        self.codec = codec or TEXT_CODEC
+
+
+TEXT_CODEC = TextCodec()
+BINARY_CODEC = BinaryCodec()
+HANDSHAKES = {ProtocolParams.FRAMED_HANDSHAKE.encode(): (ProtocolParams.FRAMED_ACK.encode(), TEXT_CODEC),
+              ProtocolParams.BINARY_HANDSHAKE.encode(): (ProtocolParams.BINARY_ACK.encode(), BINARY_CODEC)}
+"""Maps each handshake to its acknowledgement and the payload codec it selects."""
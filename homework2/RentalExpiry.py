@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+from ServerLog import get_logger, log
+from TimingWheel import TimingWheel
+
+logger = get_logger("rentals")
+
+
+class RentalParams:
+    """Parameters of rental expiry."""
+    RESERVATION_TIMEOUT_S = 900
+    """A rented car its renter has not unlocked or started within this long is released."""
+    RENTAL_TIMEOUT_S = 24 * 3600
+    """A rental still open this long after the car was picked up is released."""
+    DISCONNECT_GRACE_S = 60
+    """The cars of a renter whose connection closed are released this long after."""
+
+
+class RentalExpiry:
+    """
+    Deadlines of open rentals, kept in a timing wheel.
+
+    Every rental has one deadline at a time: the reservation timeout once the
+    car is rented, the rental timeout once it is picked up, and the disconnect
+    grace once its renter's connection is gone. Moving a deadline cancels the
+    old timer in O(1) instead of looking it up. Expiry is lazy: a rental that
+    ends normally leaves its timer behind, and when the timer fires the car is
+    only released if the same renter still holds it, as a compare-and-set in
+    the store, so a stale timer never touches a newer rental.
+    """
+
+    def __init__(self, cancel_rental, reservation_timeout_s=RentalParams.RESERVATION_TIMEOUT_S,
+                 rental_timeout_s=RentalParams.RENTAL_TIMEOUT_S, disconnect_grace_s=RentalParams.DISCONNECT_GRACE_S,
+                 wheel=None):
+        """
+        Initialize RentalExpiry.
+
+        Args:
+            cancel_rental: Called as cancel_rental(car_id, renter_id) when a deadline passes; releases the
+                car if that renter still holds it and returns whether it did.
+            reservation_timeout_s: Seconds a renter has to pick a rented car up; None disables the deadline.
+            rental_timeout_s: Seconds a picked up car may stay rented; None disables the deadline.
+            disconnect_grace_s: Seconds after a disconnect before the renter's cars are released.
+            wheel: The TimingWheel to keep deadlines in; a new one by default.
+        """
+        self.cancel_rental = cancel_rental
+        self.reservation_timeout_s = reservation_timeout_s
+        self.rental_timeout_s = rental_timeout_s
+        self.disconnect_grace_s = disconnect_grace_s
+        self.wheel = wheel if wheel is not None else TimingWheel()
+        self.timers = {}  # car id -> the Timer of its current deadline
+        self.lock = threading.Lock()
+        self.expired = {"reservation": 0, "rental": 0, "disconnect": 0}
+
+    def __len__(self):
+        return len(self.timers)
+
+    def rented(self, car_id, renter_id, now=None):
+        """Start the reservation deadline of a car just rented."""
+        self._set_deadline(car_id, renter_id, "reservation", self.reservation_timeout_s, now)
+
+    def picked_up(self, car_ids, renter_id, now=None):
+        """Replace the reservation deadline of cars their renter unlocked or started by the rental deadline."""
+        for car_id in car_ids:
+            timer = self.timers.get(car_id)
+            if timer is not None and timer.payload[2] == "reservation":
+                self._set_deadline(car_id, renter_id, "rental", self.rental_timeout_s, now)
+
+    def disconnected(self, car_ids, renter_id, now=None):
+        """Give the cars of a renter whose connection closed the disconnect grace deadline."""
+        for car_id in car_ids:
+            self._set_deadline(car_id, renter_id, "disconnect", self.disconnect_grace_s, now)
+
+    def expire(self, now=None):
+        """
+        Release the cars whose deadline has passed.
+
+        Args:
+            now: The current time.monotonic() value; defaults to the real clock.
+
+        Returns:
+            The number of cars released.
+        """
+        released = 0
+        for deadline in self.wheel.advance(now):
+            car_id, renter_id, reason = deadline
+            with self.lock:
+                timer = self.timers.get(car_id)
+                if timer is not None and timer.payload is deadline:
+                    del self.timers[car_id]
+            try:
+                if not self.cancel_rental(car_id, renter_id):
+                    continue
+            except Exception:
+                log(logger, logging.WARNING, "expiring rental failed", car_id=car_id, client_id=renter_id,
+                    exc_info=True)
+                continue
+            released += 1
+            self.expired[reason] += 1
+            log(logger, logging.INFO, "rental expired", car_id=car_id, client_id=renter_id, reason=reason)
+        return released
+
+    def metrics(self):
+        """Collect the expiry counters for a MetricsRegistry."""
+        return [("carsharing_rentals_expired_total", "counter", "Rentals released because a deadline passed.",
+                 [({"reason": reason}, count) for reason, count in self.expired.items()]),
+                ("carsharing_rental_deadlines", "gauge", "Rentals with a pending deadline.", [({}, len(self))])]
+
+    def start_expiry(self):
+        """Expire rentals on a background thread, once per tick of the wheel."""
+
+        def expiry_loop():
+            while True:
+                time.sleep(self.wheel.tick_s)
+                self.expire()
+
+        threading.Thread(target=expiry_loop, daemon=True).start()
+
+    def _set_deadline(self, car_id, renter_id, reason, delay_s, now):
+        with self.lock:
+            old = self.timers.pop(car_id, None)
+            if old is not None:
+                old.cancel()
+            if delay_s is None:
+                return
+            self.timers[car_id] = self.wheel.schedule(delay_s, (car_id, renter_id, reason), now)
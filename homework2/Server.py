@@ -1,167 +1,671 @@
+import argparse
+import asyncio
+import itertools
+import logging
 import socket
-from threading import Thread
+import time
+from threading import Event, Lock, Semaphore, Thread
 
 from Car import Car
+from CarQuery import CarQuery
+from CarRegistry import CarRegistry
+from Codec import CarEvents, CarListing
+from ColumnarFleet import ColumnarFleet
+from CommandRouter import OWNER, REGISTERED, CommandRouter
+from EventHub import EventHub, EventParams
+from GeoIndex import GeoIndex, GeoParams, nearest_linear
+from Journal import Journal
+from Metrics import MetricsRegistry, RateMeter
+from Protocol import HANDSHAKES, TEXT_CODEC, ProtocolParams, ProtocolState, encode_frame
+from RentalExpiry import RentalExpiry, RentalParams
+from SessionManager import SessionManager
+from SqliteCarStore import SqliteCarStore
+import ServerLog
+from ServerLog import get_logger, log
+
+logger = get_logger("server")
 
 
 class Server:
-    def __init__(self, host, port):
+    def __init__(self, host, port, backlog=10, max_connections=10000, reuse_port=False, idle_timeout_s=600,
+                 data_dir=None, db_path=None, columnar=False,
+                 reservation_timeout_s=RentalParams.RESERVATION_TIMEOUT_S,
+                 rental_timeout_s=RentalParams.RENTAL_TIMEOUT_S, cars=None, journal=None, first_client_id=1,
+                 client_id_step=1, offload_commands=False):
         self.host = host
         self.port = port
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.reuse_port = reuse_port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client_commands = ["register_Renter", "register_Owner", "post_Car", "request_Car",
-                               "end_Rental", "pay_Rental", "start_Engine", "unlock_Car", "lock_Car", "owner_Id", "change_Price"]
-        self.cars = [Car("Audi", "A4", 2019, 100, 11, 1),
-                     Car("BMW", "X5", 2020, 150, 12, 2),
-                     Car("Mercedes", "E200", 2018, 120, 13, 3)]
-        self.clients_type = [None] * 1000
-        self.client_id_counter = 0
+                               "end_Rental", "pay_Rental", "start_Engine", "unlock_Car", "lock_Car", "owner_Id", "change_Price",
+                                ProtocolParams.FRAMED_HANDSHAKE, ProtocolParams.BINARY_HANDSHAKE]
+        self.journal = journal
+        if cars is not None:
+            self.cars = cars
+        elif db_path is not None:
+            self.cars = self.open_database(db_path)
+        elif columnar:
+            self.cars = ColumnarFleet(self.default_fleet())
+        else:
+            self.cars, self.journal = self.open_fleet(data_dir)
+        self.geo_index = None
+        self.event_hub = None
+        if isinstance(self.cars, CarRegistry):
+            self.geo_index = GeoIndex()
+            self.geo_index.attach(self.cars, Car.location_provider)
+            self.event_hub = EventHub()
+            self.event_hub.attach(self.cars)
+        self.sessions = SessionManager(idle_timeout_s, first_client_id, client_id_step)
+        self.rentals = RentalExpiry(self.cars.cancel_rental, reservation_timeout_s, rental_timeout_s)
+        # commands on a store that calls other processes must not run on the event loop
+        self.offload_commands = offload_commands
+        self.connection_slots = Semaphore(max_connections)
+        self.connection_count = 0
+        self.router = CommandRouter()
+        self.register_commands()
+        self.metrics = MetricsRegistry()
+        self.register_metrics()
+
+    @staticmethod
+    def default_fleet():
+        return [Car("Audi", "A4", 2019, 100, 11, 1),
+                Car("BMW", "X5", 2020, 150, 12, 2),
+                Car("Mercedes", "E200", 2018, 120, 13, 3)]
+
+    def add_generated_cars(self, count):
+        """
+        Add generated cars after the highest car id, for load tests.
+
+        Args:
+            count: Number of cars to add; they belong to owners 1000 to 1999.
+        """
+        first_id = max((car.id for car in self.cars), default=0) + 1
+        for car_id in range(first_id, first_id + count):
+            self.cars.add(self.generated_car(car_id))
+
+    @staticmethod
+    def generated_car(car_id):
+        """The generated car with an id; the same id always gives the same car."""
+        brands = ("Dacia", "Renault", "Skoda", "Audi", "BMW")
+        return Car(brands[car_id % len(brands)], "Generated", 2010 + car_id % 15, 40 + car_id % 200,
+                   1000 + car_id % 1000, car_id)
+
+    @staticmethod
+    def open_fleet(data_dir, fleet_filter=None):
+        """
+        Build the car registry, recovering it from a data directory if one is given.
+
+        Args:
+            data_dir: Directory of the fleet journal, or None to keep the fleet in memory only.
+            fleet_filter: Predicate selecting the default cars to start with when the directory is new.
+
+        Returns:
+            The CarRegistry, and the Journal it is journaled to, or None without data_dir. Rentals
+            recovered from the journal are released.
+        """
+        if data_dir is None:
+            return CarRegistry(filter(fleet_filter, Server.default_fleet())), None
+        journal = Journal(data_dir)
+        cars = journal.recover()
+        fresh = not cars and journal.seq == 0
+        if fresh:
+            cars = filter(fleet_filter, Server.default_fleet())
+        registry = CarRegistry(cars)
+        journal.attach(registry)
+        if fresh:
+            journal.snapshot()
+        else:
+            Server.release_recovered_rentals(registry)
+        return registry, journal
+
+    @staticmethod
+    def release_recovered_rentals(cars):
+        """
+        Release every rented car of a fleet recovered from disk.
+
+        Renter ids are connection ids, and a restarted server numbers its
+        connections from the start again, so a recovered rental would belong
+        to whichever new client got its renter's id.
+
+        Returns:
+            The number of cars released.
+        """
+        released = sum(cars.cancel_rental(car.id, car.user_id) for car in cars.rented())
+        if released:
+            log(logger, logging.INFO, "recovered rentals released", cars=released)
+        return released
+
+    def open_database(self, db_path):
+        """Open the SQLite car store, starting it with the default fleet if it is empty; its rentals are released."""
+        store = SqliteCarStore(db_path)
+        if not len(store):
+            store.add_many(self.default_fleet())
+        else:
+            self.release_recovered_rentals(store)
+        return store
+
+    def start_location_refresh(self):
+        Car.location_provider.prefetch(car.id for car in self.cars)
+        Car.location_provider.start_refresh()
+
+    def register_metrics(self):
+        metrics = self.metrics
+        self.connections_accepted = metrics.counter("carsharing_connections_total", "Connections accepted.")
+        self.connections_rejected = metrics.counter("carsharing_connections_rejected_total",
+                                                    "Connections turned away because the server was full.")
+        self.connection_errors = metrics.counter("carsharing_connection_errors_total",
+                                                 "Connections closed by an unexpected error.")
+        metrics.gauge("carsharing_sessions", "Open client sessions.", lambda: len(self.sessions))
+        metrics.gauge("carsharing_commands_per_second", "Commands executed per second since the previous scrape.",
+                      RateMeter(self.router.total_calls).rate)
+        metrics.collector(self.router.metrics)
+        metrics.collector(self.rentals.metrics)
+
+    def serve_metrics(self, port, host="127.0.0.1"):
+        """Expose the metrics of this process in the Prometheus text format at http://host:port/metrics."""
+        http_server = self.metrics.serve(host, port)
+        log(logger, logging.INFO, "metrics endpoint listening", host=host, port=http_server.server_address[1])
+        return http_server
 
     def start(self):
+        self.start_location_refresh()
+        self.sessions.start_expiry()
+        self.rentals.start_expiry()
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(10)
-        print(f"[*] Listening as {self.host}: {self.port}")
+        self.server_socket.listen(self.backlog)
+        log(logger, logging.INFO, "listening", host=self.host, port=self.port, mode="threaded")
 
         while True:
             client_socket, client_address = self.server_socket.accept()
-            print(f"[*] {client_address[0]}:{client_address[1]} connected.")
-            client_handler = Thread(target=self.handle_client, args=(client_socket,))
+            if not self.connection_slots.acquire(blocking=False):
+                self.connections_rejected.inc()
+                client_socket.send("Server is full.".encode())
+                client_socket.close()
+                continue
+            self.connections_accepted.inc()
+            log(logger, logging.DEBUG, "connected", peer=f"{client_address[0]}:{client_address[1]}")
+            client_handler = Thread(target=self.handle_client, args=(client_socket,), daemon=True)
             client_handler.start()
 
+    def start_async(self):
+        """Serve every client from a single asyncio event loop instead of one thread per connection."""
+        asyncio.run(self.serve_async())
+
+    async def serve_async(self):
+        self.start_location_refresh()
+        asyncio.create_task(self.expire_sessions_async())
+        asyncio.create_task(self.expire_rentals_async())
+        server = await asyncio.start_server(self.handle_client_async, self.host, self.port,
+                                            backlog=self.backlog, reuse_address=True,
+                                            reuse_port=self.reuse_port or None)
+        log(logger, logging.INFO, "listening", host=self.host, port=self.port, mode="async")
+        async with server:
+            await server.serve_forever()
+
+    async def expire_sessions_async(self):
+        while True:
+            await asyncio.sleep(self.sessions.expiry_interval_s)
+            self.sessions.expire_idle()
+
+    async def expire_rentals_async(self):
+        while True:
+            await asyncio.sleep(self.rentals.wheel.tick_s)
+            await self.run_store_call(self.rentals.expire)
+
+    async def run_store_call(self, function, *args):
+        """Call something that uses the store, on an executor thread if the store calls other processes."""
+        if self.offload_commands:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+        return function(*args)
+
+    def register_client(self, on_expire=None):
+        return self.sessions.open(on_expire).client_id
+
+    def close_client(self, client_id):
+        """Forget a closed connection; its rentals get the disconnect grace deadline."""
+        self.sessions.close(client_id)
+        if self.event_hub is not None:
+            self.event_hub.close_client(client_id)
+        rented = self.cars.rented_by(client_id)
+        if rented:
+            self.rentals.disconnected([car.id for car in rented], client_id)
+
+    def client_type(self, client_id):
+        session = self.sessions.get(client_id)
+        return session.client_type if session is not None else None
+
+    def set_client_type(self, client_id, client_type):
+        session = self.sessions.get(client_id)
+        if session is not None:
+            session.client_type = client_type
+
     def handle_client(self, client_socket):
-        client_id = self.client_id_counter + 1
-        self.client_id_counter += 1
-        self.clients_type[client_id] = None
+        client_id = self.register_client(lambda: client_socket.shutdown(socket.SHUT_RDWR))
+        state = ProtocolState()
+        send_lock = Lock()
+        pusher = None
+        try:
+            while True:
+                data = client_socket.recv(ProtocolParams.CHUNK_SIZE_BYTES)
+                if not data:
+                    break
+                for chunk in self.handle_data(client_id, state, data):
+                    with send_lock:
+                        client_socket.sendall(chunk)
+                if pusher is None and self.subscribed_events(client_id) is not None:
+                    pusher = Thread(target=self.push_events, daemon=True,
+                                    args=(self.subscribed_events(client_id), client_socket, send_lock, state.codec))
+                    pusher.start()
 
-        if True:
-            try:
-                client_id = self.client_id_counter
-                self.clients_type[client_id] = None
+        except Exception:
+            self.connection_errors.inc()
+            log(logger, logging.WARNING, "connection failed", client_id=client_id, exc_info=True)
+
+        finally:
+            self.close_client(client_id)
+            client_socket.close()
+            self.connection_slots.release()
+
+    async def handle_client_async(self, reader, writer):
+        if self.connection_count >= self.max_connections:
+            self.connections_rejected.inc()
+            writer.write("Server is full.".encode())
+            writer.close()
+            return
+        self.connection_count += 1
+        self.connections_accepted.inc()
+        log(logger, logging.DEBUG, "connected", peer=writer.get_extra_info("peername"))
+        client_id = self.register_client(writer.close)
+        state = ProtocolState()
+        pusher = None
+        try:
+            while True:
+                data = await reader.read(ProtocolParams.CHUNK_SIZE_BYTES)
+                if not data:
+                    break
+                chunks = self.handle_data(client_id, state, data)
                 while True:
-                    client_message = client_socket.recv(1024).decode()
-                    print(f"[Client]: {client_message}")
-                    print(f"[Client]: {client_id}")
-                    if client_message == "end_Rental":
-                        print("test")
-                        for car in self.cars:
-                            if car.user_id == client_id and car.paid == 1:
-                                confirmation_message = car.send_confirmation_message()
-                                if confirmation_message == "rental_success":
-                                    print("test2")
-                                    print(car.id)
-                                    print(car.paid)
-                                    car.user_id = None
-                                    car.availability = 1
-                                    car.paid = 0
-                                    print("[Server]: Confirmation successful.")
-                                    print("[Server]: Rental ended.")
-                                    server_message = "Rental ended."
-                                    client_socket.send(server_message.encode())
-                                    break
-                                else:
-                                    print("[Server]: Confirmation error.")
-                            else:
-                                server_message = "You have to pay the rental first."
-
-                    elif client_message == "register_Renter":
-                        server_message = "You are registered as a renter."
-                        self.clients_type[client_id] = "renter"
-
-                    elif client_message == "register_Owner":
-                        server_message = "Enter the Owner Id like this: 'owner_Id: id' "
-
-                    elif client_message.startswith("owner_Id"):
-                        owner_id = int(client_message.split(":")[1])
-                        server_message = "You are registered as an owner. Your cars are: \n"
-                        for car in self.cars:
-                            if car.owner_id == owner_id:
-                                server_message += f"{car.to_dict()}\n"
-                        if server_message == "You are registered as an owner. Your cars are: \n":
-                            server_message = "No cars found."
-                        else:
-                            self.clients_type[client_id] = "owner"
-
-                    elif client_message == "change_Price" and self.clients_type[client_id] == "owner":
-                        server_message = "Enter the Id of the car and the new price like this: 'owner_Id: car_Id: new_price'"
-
-                    elif client_message[0].isdigit() and self.clients_type[client_id] == "owner":
-                        owner_id, car_id, new_price = client_message.split(":")
-                        car_id = int(car_id)
-                        new_price = int(new_price)
-                        ok=0
-                        for car in self.cars:
-                            if car.id == car_id and car.owner_id == int(owner_id):
-                                car.price = new_price
-                                server_message = "Price changed."
-                                ok=1
-                        if ok == 0:
-                            server_message = "Car not found."
-
-                    elif client_message == "post_Car" and self.clients_type[client_id] is not None:
-                        server_message = ""
-                        for car in self.cars:
-                            if car.availability == 1:
-                                server_message += f"{car.to_dict()}\n"
-
-                    elif client_message == "request_Car" and self.clients_type[client_id] is not None :
-                        server_message = "Enter the Id of requested car like this: 'car_Id: id'"
-
-                    elif client_message == "start_Engine" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.start_engine = 1
-                        server_message = "Engine started."
-
-                    elif client_message == "unlock_Car" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.lock = 0
-                        server_message = "Car unlocked."
-
-                    elif client_message == "lock_Car" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.lock = 1
-                        server_message = "Car locked."
-
-                    elif client_message == "pay_Rental" and self.clients_type[client_id] is not None:
-                        for car in self.cars:
-                            if car.user_id == client_id:
-                                car.paid = 1
-                        server_message = "Rental paid."
-
-                    elif client_message.startswith("car_Id") and self.clients_type[client_id] is not None:
-                        car_id = int(client_message.split(":")[1])
-                        ok = 0
-                        for Car in self.cars:
-                            if Car.id == car_id:
-                                if Car.availability == 1:
-                                    Car.availability = 0
-                                    Car.user_id = client_id
-                                    ok = 1
-                                    server_message = "Rental started."
-                        if ok == 0:
-                            server_message = "Car not found or not available."
-                    elif self.clients_type[client_id] is None:
-                        server_message = "You have to register first."
-                    else:
-                        server_message = "Invalid command."
-
-                    client_socket.send(server_message.encode())
-
-            except Exception as e:
-                print(f"Error: {e}")
-
-            finally:
-                client_socket.close()
+                    # one chunk at a time, so listings still stream
+                    chunk = await self.run_store_call(next, chunks, None)
+                    if chunk is None:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                if pusher is None and self.subscribed_events(client_id) is not None:
+                    pusher = asyncio.create_task(
+                        self.push_events_async(self.subscribed_events(client_id), writer, state.codec))
+
+        except Exception:
+            self.connection_errors.inc()
+            log(logger, logging.WARNING, "connection failed", client_id=client_id, exc_info=True)
+
+        finally:
+            await self.run_store_call(self.close_client, client_id)
+            if pusher is not None:
+                pusher.cancel()
+            self.connection_count -= 1
+            writer.close()
+
+    def handle_data(self, client_id, state, data):
+        """
+        Execute every command contained in a chunk of received bytes.
+
+        In text mode the chunk is one command, as the original protocol assumes.
+        In framed mode the chunk may hold any number of pipelined frames, or
+        only part of one; each reply is framed with the id of its request and
+        encoded with the codec the client negotiated.
+
+        Listings are streamed: they are encoded a chunk of records at a time,
+        as the records are produced, and in framed mode every frame of a
+        listing but the last carries ProtocolParams.FLAG_MORE. Other replies
+        to pipelined commands are sent together.
+
+        Args:
+            client_id: The id assigned to the connection.
+            state: The ProtocolState of the connection.
+            data: The received bytes.
+
+        Returns:
+            An iterator of the byte chunks to send back, in order.
+        """
+        if not state.framed:
+            for handshake, (ack, codec) in HANDSHAKES.items():
+                if data.startswith(handshake):
+                    state.enable_framing(codec)
+                    if self.event_hub is not None:
+                        # only framed connections can tell pushed events from replies
+                        self.event_hub.open_client(client_id)
+                    yield ack
+                    yield from self.handle_data(client_id, state, data[len(handshake):])
+                    return
+            yield from self.reply_payloads(TEXT_CODEC, self.execute(client_id, *TEXT_CODEC.decode_command(data)))
+            return
+
+        codec = state.codec
+        pending = []
+        for request_id, flags, payload in state.decoder.feed(data):
+            reply = self.execute(client_id, *codec.decode_command(payload))
+            for frame in self.reply_frames(request_id, self.reply_payloads(codec, reply)):
+                pending.append(frame)
+                if isinstance(reply, CarListing):
+                    yield b"".join(pending)
+                    pending = []
+        if pending:
+            yield b"".join(pending)
+
+    @staticmethod
+    def reply_payloads(codec, reply):
+        """Encode a reply: a listing chunk by chunk, anything else as one payload."""
+        if not isinstance(reply, CarListing):
+            yield codec.encode_reply(reply)
+            return
+        for chunk in reply.split(ProtocolParams.LISTING_CHUNK_RECORDS):
+            yield codec.encode_reply(chunk)
+
+    @staticmethod
+    def reply_frames(request_id, payloads):
+        previous = None
+        for payload in payloads:
+            if previous is not None:
+                yield encode_frame(request_id, previous, ProtocolParams.FLAG_MORE)
+            previous = payload
+        yield encode_frame(request_id, previous)
+
+    def subscribed_events(self, client_id):
+        """The ClientEvents of a connection once it has a subscription, else None."""
+        events = self.event_hub.clients.get(client_id) if self.event_hub is not None else None
+        return events if events is not None and events.subscriptions else None
+
+    @staticmethod
+    def event_frames(codec, batches):
+        return b"".join(encode_frame(ProtocolParams.PUSH_REQUEST_ID,
+                                     codec.encode_reply(CarEvents(subscription_id, events, overflowed)))
+                        for subscription_id, (events, overflowed) in batches.items())
+
+    def push_events(self, events, client_socket, send_lock, codec):
+        """
+        Send a connection its subscribed events until it closes.
+
+        Events are sent at most once per coalescing window, and while a send
+        blocks on a slow reader, new events coalesce in `events` instead of
+        piling up in socket buffers.
+        """
+        ready = Event()
+        events.set_waker(ready.set)
+        while True:
+            ready.wait()
+            time.sleep(EventParams.COALESCE_WINDOW_S)
+            ready.clear()
+            if events.closed:
+                return
+            frames = self.event_frames(codec, events.drain())
+            try:
+                with send_lock:
+                    client_socket.sendall(frames)
+            except OSError:
+                return
+
+    async def push_events_async(self, events, writer, codec):
+        """Send a connection its subscribed events until it closes; see push_events."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        events.set_waker(lambda: loop.call_soon_threadsafe(ready.set))
+        while True:
+            await ready.wait()
+            await asyncio.sleep(EventParams.COALESCE_WINDOW_S)
+            ready.clear()
+            if events.closed:
+                return
+            writer.write(self.event_frames(codec, events.drain()))
+            await writer.drain()
+
+    def process_message(self, client_id, client_message):
+        """
+        Execute one text command and return the text reply.
+
+        Args:
+            client_id: The id assigned to the connection that sent the command.
+            client_message: The command text.
+
+        Returns:
+            The reply text.
+        """
+        return str(self.execute(client_id, *TEXT_CODEC.parse(client_message)))
+
+    def register_commands(self):
+        router = self.router
+        router.register("end_Rental", self.end_rental)
+        router.register("register_Renter", self.register_renter)
+        router.register("register_Owner", self.register_owner)
+        router.register("owner_Id", self.login_owner)
+        router.register("change_Price", self.change_price, OWNER)
+        router.register("set_Price", self.set_price, OWNER)
+        router.register("set_Prices", self.set_prices, OWNER)
+        router.register("lock_Cars", self.lock_cars, OWNER)
+        router.register("unlock_Cars", self.unlock_cars, OWNER)
+        router.register("post_Car", self.post_car, REGISTERED)
+        router.register("search_Cars", self.search_cars, REGISTERED)
+        router.register("nearby_Cars", self.nearby_cars, REGISTERED)
+        router.register("subscribe_Cars", self.subscribe_cars, REGISTERED)
+        router.register("unsubscribe_Cars", self.unsubscribe_cars, REGISTERED)
+        router.register("request_Car", self.request_car, REGISTERED)
+        router.register("start_Engine", self.start_engine, REGISTERED)
+        router.register("unlock_Car", self.unlock_car, REGISTERED)
+        router.register("lock_Car", self.lock_car, REGISTERED)
+        router.register("pay_Rental", self.pay_rental, REGISTERED)
+        router.register("car_Id", self.rent_car, REGISTERED)
+
+    def execute(self, client_id, command, args):
+        """
+        Execute one parsed command.
+
+        Args:
+            client_id: The id assigned to the connection that sent the command.
+            command: The command name, or None if the message was not a valid command.
+            args: The command arguments, already converted to ints.
+
+        Returns:
+            The reply: a string, or a CarListing for post_Car, search_Cars, nearby_Cars and owner_Id.
+        """
+        log(logger, logging.DEBUG, "command", client_id=client_id, command=command, args=args)
+        session = self.sessions.get(client_id)
+        if session is None:
+            return self.router.dispatch(client_id, None, command, args)
+        self.sessions.touch(session)
+        return self.router.dispatch(client_id, session.client_type, command, args)
+
+    def end_rental(self, client_id):
+        server_message = "You have to pay the rental first."
+        for car in self.cars.rented_by(client_id):
+            if car.paid == 1:
+                confirmation_message = car.send_confirmation_message()
+                if confirmation_message != "rental_success":
+                    log(logger, logging.WARNING, "rental confirmation failed", client_id=client_id, car_id=car.id)
+                elif self.cars.end_rental(car.id, client_id):
+                    log(logger, logging.INFO, "rental ended", client_id=client_id, car_id=car.id)
+                    server_message = "Rental ended."
+                    break
+                else:
+                    # the car changed since it was listed, e.g. its rental expired or was cancelled meanwhile
+                    current = self.cars.get(car.id)
+                    log(logger, logging.WARNING, "rental release failed", client_id=client_id, car_id=car.id,
+                        renter_id=None if current is None else current.user_id,
+                        availability=None if current is None else current.availability,
+                        paid=None if current is None else current.paid)
+        return server_message
+
+    def register_renter(self, client_id):
+        self.set_client_type(client_id, "renter")
+        return "You are registered as a renter."
+
+    def register_owner(self, client_id):
+        return "Enter the Owner Id like this: 'owner_Id: id' "
+
+    def login_owner(self, client_id, owner_id):
+        cars = self.cars.owned_by(owner_id)
+        if not cars:
+            return "No cars found."
+        self.set_client_type(client_id, "owner")
+        return CarListing("owner", [car.to_dict() for car in cars])
+
+    def change_price(self, client_id):
+        return "Enter the Id of the car and the new price like this: 'owner_Id: car_Id: new_price'"
+
+    def set_price(self, client_id, owner_id, car_id, new_price):
+        if self.cars.set_price(owner_id, car_id, new_price):
+            return "Price changed."
+        return "Car not found."
+
+    def set_prices(self, client_id, owner_id, prices):
+        changed = self.cars.set_prices(owner_id, prices)
+        if changed is None:
+            return "Car not found."
+        return f"Prices changed: {changed}."
+
+    def lock_cars(self, client_id, owner_id, car_ids):
+        changed = self.cars.set_locks(owner_id, car_ids, 1)
+        if changed is None:
+            return "Car not found."
+        return f"Cars locked: {changed}."
+
+    def unlock_cars(self, client_id, owner_id, car_ids):
+        changed = self.cars.set_locks(owner_id, car_ids, 0)
+        if changed is None:
+            return "Car not found."
+        return f"Cars unlocked: {changed}."
+
+    def post_car(self, client_id):
+        # an unfiltered search walks the fleet lazily, so the first chunk costs the same however large it is
+        return CarListing("available", (car.to_dict() for car in self.cars.search(CarQuery())))
+
+    def search_cars(self, client_id, query):
+        # read one car past the page to learn whether there is a next page
+        page = list(itertools.islice(self.cars.search(query), query.limit + 1))
+        next_cursor = page[query.limit - 1].id if len(page) > query.limit else None
+        return CarListing("available", (car.to_dict() for car in page[:query.limit]), next_cursor)
+
+    def nearby_cars(self, client_id, lat, lon, k):
+        k = min(k, GeoParams.MAX_NEARBY)
+        if self.geo_index is None:
+            cars = nearest_linear(self.cars.available(), lat, lon, k)
+        else:
+            # a car may be rented between the index lookup and here
+            cars = [car for car in map(self.cars.get, self.geo_index.nearest(lat, lon, k))
+                    if car is not None and car.availability == 1]
+        return CarListing("available", [car.to_dict() for car in cars])
+
+    def subscribe_cars(self, client_id, event_filter):
+        if self.event_hub is None:
+            return "Subscriptions are not available."
+        subscription_id = self.event_hub.subscribe(client_id, event_filter)
+        if subscription_id is None:
+            return "Subscriptions need the framed protocol."
+        return f"Subscribed: {subscription_id}."
+
+    def unsubscribe_cars(self, client_id, subscription_id):
+        if self.event_hub is not None and self.event_hub.unsubscribe(client_id, subscription_id):
+            return "Unsubscribed."
+        return "Subscription not found."
+
+    def request_car(self, client_id):
+        return "Enter the Id of requested car like this: 'car_Id: id'"
+
+    def start_engine(self, client_id):
+        self.cars.update_rented(client_id, start_engine=1)
+        self.picked_up(client_id)
+        return "Engine started."
+
+    def unlock_car(self, client_id):
+        self.cars.update_rented(client_id, lock=0)
+        self.picked_up(client_id)
+        return "Car unlocked."
+
+    def lock_car(self, client_id):
+        self.cars.update_rented(client_id, lock=1)
+        return "Car locked."
+
+    def pay_rental(self, client_id):
+        self.cars.update_rented(client_id, paid=1)
+        return "Rental paid."
+
+    def picked_up(self, client_id):
+        self.rentals.picked_up([car.id for car in self.cars.rented_by(client_id)], client_id)
+
+    def rent_car(self, client_id, car_id):
+        if self.cars.rent(car_id, client_id):
+            self.rentals.rented(car_id, client_id)
+            return "Rental started."
+        return "Car not found or not available."
 
     def stop(self):
         self.server_socket.close()
+        self.metrics.stop()
+        if self.journal is not None:
+            self.journal.close()
+        if isinstance(self.cars, SqliteCarStore):
+            self.cars.close()
 
 
 if __name__ == "__main__":
     SERVER_HOST = '127.0.0.1'
     SERVER_PORT = 12345
-    server = Server(SERVER_HOST, SERVER_PORT)
-    server.start()
-    server.stop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carsharing server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded")
+    parser.add_argument("--backlog", type=int, default=10)
+    parser.add_argument("--max-connections", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=600,
+                        help="seconds of inactivity after which a client session is closed")
+    parser.add_argument("--reservation-timeout", type=float, default=RentalParams.RESERVATION_TIMEOUT_S,
+                        help="seconds a renter has to unlock or start a rented car before it is released")
+    parser.add_argument("--rental-timeout", type=float, default=RentalParams.RENTAL_TIMEOUT_S,
+                        help="seconds a picked up car may stay rented before it is released")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port; the fleet is sharded across them")
+    parser.add_argument("--db",
+                        help="keep the fleet in this SQLite database instead of in memory")
+    parser.add_argument("--columnar", action="store_true",
+                        help="keep the fleet in compact typed-array columns, for very large simulated fleets")
+    parser.add_argument("--generated-cars", type=int, default=0,
+                        help="add this many generated cars at startup, for load tests")
+    parser.add_argument("--data-dir",
+                        help="directory for the fleet journal and snapshots; without it the fleet is not persisted")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="DEBUG logs every command")
+    parser.add_argument("--log-json", action="store_true", help="log one JSON object per line")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve metrics on this local port; with --workers, worker i uses this port + i")
+    args = parser.parse_args()
+    if args.db is not None and (args.data_dir is not None or args.workers > 1):
+        parser.error("--db cannot be combined with --data-dir or --workers")
+    if args.columnar and (args.db is not None or args.data_dir is not None or args.workers > 1):
+        parser.error("--columnar cannot be combined with --db, --data-dir or --workers")
+
+    if args.workers > 1:
+        from ShardedServer import run_sharded
+
+        run_sharded(args.host, args.port, args.workers, args.mode, args.backlog, args.max_connections,
+                    args.idle_timeout, args.data_dir, args.log_level, args.log_json, args.metrics_port,
+                    args.reservation_timeout, args.rental_timeout, args.generated_cars)
+        raise SystemExit
+
+    ServerLog.configure(args.log_level, args.log_json)
+
+    server = Server(args.host, args.port, backlog=args.backlog, max_connections=args.max_connections,
+                    idle_timeout_s=args.idle_timeout, data_dir=args.data_dir, db_path=args.db,
+                    columnar=args.columnar, reservation_timeout_s=args.reservation_timeout,
+                    rental_timeout_s=args.rental_timeout)
+    server.add_generated_cars(args.generated_cars)
+    if args.metrics_port is not None:
+        server.serve_metrics(args.metrics_port)
+    if args.mode == "async":
+        server.start_async()
+    else:
+        server.start()
+    server.stop()
@@ -0,0 +1,106 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+
+class LogParams:
+    """Parameters of the server log."""
+    ROOT = "carsharing"
+    """Name of the logger every server component logs under."""
+    DEFAULT_LEVEL = "INFO"
+    """Per-command records are DEBUG, so they cost nothing at this level."""
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats a record as 'time level component event key=value ...', or as one JSON object per line.
+
+    The key=value fields are the `fields` dict passed through `extra` by `log`.
+    """
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        exception = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        component = record.name[len(LogParams.ROOT) + 1:] or record.name
+        if self.json_lines:
+            entry = {"ts": round(record.created, 6), "level": record.levelname, "component": component,
+                     "event": record.getMessage(), **fields}
+            if exception:
+                entry["exception"] = exception
+            return json.dumps(entry, default=str)
+        text = f"{self.formatTime(record)} {record.levelname:<7} {component} {record.getMessage()}"
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if exception:
+            text += "\n" + exception
+        return text
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records with the message and traceback rendered, but the fields left for the formatter."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure(level=LogParams.DEFAULT_LEVEL, json_lines=False, stream=None):
+    """
+    Send the server log to a stream from a background thread.
+
+    Callers only put records on a queue, so a slow console or pipe never
+    blocks a request. Records below `level` are dropped before they are built.
+
+    Args:
+        level: The lowest level logged, such as "DEBUG", "INFO" or "WARNING".
+        json_lines: Write one JSON object per record instead of key=value text.
+        stream: Where to write; defaults to stderr.
+
+    Returns:
+        The QueueListener writing the records; it is stopped at exit.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(json_lines))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    root = logging.getLogger(LogParams.ROOT)
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(StructuredQueueHandler(records))
+    root.setLevel(level)
+    root.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def get_logger(component):
+    return logging.getLogger(f"{LogParams.ROOT}.{component}")
+
+
+def log(logger, level, event, exc_info=False, **fields):
+    """
+    Log an event with structured fields, if the level is enabled.
+
+    Args:
+        logger: A logger from get_logger.
+        level: A logging level such as logging.INFO.
+        event: A short description of what happened.
+        exc_info: Attach the exception being handled.
+        fields: Values to attach to the record.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
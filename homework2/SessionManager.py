@@ -0,0 +1,144 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ServerLog import get_logger, log
+
+logger = get_logger("sessions")
+
+
+class Session:
+    """The server-side state of one client connection."""
+    __slots__ = ("client_id", "client_type", "last_active", "on_expire")
+
+    def __init__(self, client_id, on_expire=None):
+        """
+        Initialize Session.
+
+        Args:
+            client_id: The id assigned to the connection.
+            on_expire: Called without arguments when the session is expired for idleness.
+        """
+        self.client_id = client_id
+        self.client_type = None
+        self.last_active = time.monotonic()
+        self.on_expire = on_expire
+
+
+class SessionManager:
+    """
+    Table of open client sessions.
+
+    Sessions are kept in least-recently-active order, so expiring idle ones
+    only visits the sessions that actually expire. A closed session is removed
+    right away, which keeps memory flat however many clients have come and gone.
+    """
+
+    def __init__(self, idle_timeout_s=600, first_id=1, id_step=1):
+        """
+        Initialize SessionManager.
+
+        Args:
+            idle_timeout_s: Sessions without activity for this long are expired; None disables expiry.
+            first_id: The first client id handed out.
+            id_step: The distance between consecutive client ids.
+        """
+        self.idle_timeout_s = idle_timeout_s
+        self.client_ids = itertools.count(first_id, id_step)
+        self.sessions = OrderedDict()
+        self.peak_sessions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def open(self, on_expire=None):
+        """
+        Create a session for a new connection.
+
+        Args:
+            on_expire: Called without arguments if the session is expired for idleness.
+
+        Returns:
+            The new Session.
+        """
+        session = Session(next(self.client_ids), on_expire)
+        with self.lock:
+            self.sessions[session.client_id] = session
+            if len(self.sessions) > self.peak_sessions:
+                self.peak_sessions = len(self.sessions)
+        return session
+
+    def get(self, client_id):
+        return self.sessions.get(client_id)
+
+    def touch(self, session):
+        """Record activity on a session."""
+        session.last_active = time.monotonic()
+        with self.lock:
+            if session.client_id in self.sessions:
+                self.sessions.move_to_end(session.client_id)
+
+    def close(self, client_id):
+        with self.lock:
+            session = self.sessions.pop(client_id, None)
+            self._compact()
+            return session
+
+    def expire_idle(self, now=None):
+        """
+        Remove every session idle for longer than the timeout and run its on_expire callback.
+
+        Args:
+            now: The current time.monotonic() value; defaults to the real clock.
+
+        Returns:
+            The expired sessions.
+        """
+        if self.idle_timeout_s is None:
+            return []
+        deadline = (time.monotonic() if now is None else now) - self.idle_timeout_s
+        expired = []
+        with self.lock:
+            while self.sessions:
+                session = next(iter(self.sessions.values()))
+                if session.last_active > deadline:
+                    break
+                self.sessions.popitem(last=False)
+                expired.append(session)
+            self._compact()
+        for session in expired:
+            if session.on_expire is not None:
+                try:
+                    session.on_expire()
+                except Exception:
+                    log(logger, logging.WARNING, "expiring session failed", client_id=session.client_id,
+                        exc_info=True)
+        return expired
+
+    def _compact(self):
+        # dicts never give memory back when entries are removed; rebuild the
+        # table once it has shrunk to a quarter of its peak size
+        if self.peak_sessions > 1024 and len(self.sessions) * 4 < self.peak_sessions:
+            self.sessions = OrderedDict(self.sessions)
+            self.peak_sessions = len(self.sessions)
+
+    @property
+    def expiry_interval_s(self):
+        """How often idle sessions should be checked: often enough to expire them within 1.5 timeouts."""
+        if self.idle_timeout_s is None:
+            return 60.0
+        return min(5.0, self.idle_timeout_s / 2)
+
+    def start_expiry(self, interval_s=None):
+        """Expire idle sessions periodically on a background thread."""
+        interval_s = interval_s or self.expiry_interval_s
+
+        def expiry_loop():
+            while True:
+                time.sleep(interval_s)
+                self.expire_idle()
+
+        threading.Thread(target=expiry_loop, daemon=True).start()
@@ -0,0 +1,353 @@
+import copy
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client as IpcClient, Listener as IpcListener
+
+import ServerLog
+from RentalExpiry import RentalParams
+from Server import Server
+from ServerLog import get_logger, log
+
+logger = get_logger("shards")
+
+
+class ShardParams:
+    """Parameters of the sharded server."""
+    CONNECT_TIMEOUT_S = 10
+    """How long a worker keeps retrying to reach a peer shard that is still starting."""
+    SHARD_METHODS = frozenset(["add", "remove", "get", "owned_by", "rented_by", "available", "rent",
+                               "end_rental", "cancel_rental", "release_id", "update_rented", "set_price", "set_prices", "set_locks",
+                               "all_cars", "count", "search"])
+    """Registry methods a peer may call over IPC."""
+
+
+class LocalShard:
+    """Adapter giving the local registry the same call interface as a ShardPeer."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def call(self, method, *args, **kwargs):
+        if method == "release_id":
+            return self.registry.release(self.registry.get(*args))
+        if method == "all_cars":
+            return list(self.registry)
+        if method == "count":
+            return len(self.registry)
+        if method == "search":
+            # one page and one lookahead car, enough for the caller to tell whether more follow
+            query, = args
+            return list(itertools.islice(self.registry.search(query), query.limit + 1))
+        return getattr(self.registry, method)(*args, **kwargs)
+
+
+class ShardService:
+    """Serves the local shard's registry to the other workers over a Unix socket."""
+
+    def __init__(self, registry, address, authkey):
+        """
+        Initialize ShardService.
+
+        Args:
+            registry: The CarRegistry holding this worker's shard.
+            address: Path of the Unix socket to listen on.
+            authkey: Shared secret peers must present.
+        """
+        self.shard = LocalShard(registry)
+        self.listener = IpcListener(address, family='AF_UNIX', authkey=authkey)
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _accept_loop(self):
+        while True:
+            conn = self.listener.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            while True:
+                method, args, kwargs = conn.recv()
+                try:
+                    if method not in ShardParams.SHARD_METHODS:
+                        raise AttributeError(f"{method} is not a shard method")
+                    conn.send((True, self.shard.call(method, *args, **kwargs)))
+                except Exception as e:
+                    conn.send((False, e))
+        except (EOFError, OSError):
+            conn.close()
+
+
+class ShardPeer:
+    """A pool of IPC connections to one peer shard."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.connections = queue.LifoQueue()
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a registry method on the peer shard.
+
+        Args:
+            method: One of ShardParams.SHARD_METHODS.
+
+        Returns:
+            The method's return value; Car objects come back as copies.
+        """
+        try:
+            conn = self.connections.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        replied = False
+        try:
+            conn.send((method, args, kwargs))
+            ok, result = conn.recv()
+            replied = True
+        finally:
+            if replied:
+                self.connections.put(conn)
+            else:
+                # a request may be half sent or its reply unread, so the connection is not reused
+                conn.close()
+        if not ok:
+            raise result
+        return result
+
+    def _connect(self):
+        deadline = time.monotonic() + ShardParams.CONNECT_TIMEOUT_S
+        while True:
+            try:
+                return IpcClient(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+
+class ShardedCarStore:
+    """
+    A CarRegistry look-alike whose cars are partitioned across worker processes by car id.
+
+    Commands on one car go straight to the shard that owns it (in-process when
+    that is the local shard). Owner and availability listings fan out to every
+    shard. The shards a renter has rented from are remembered, so renter
+    commands only visit those.
+    """
+
+    def __init__(self, shard_index, shards):
+        """
+        Initialize ShardedCarStore.
+
+        Args:
+            shard_index: The index of the local shard in `shards`.
+            shards: One LocalShard or ShardPeer per shard, in shard order.
+        """
+        self.shard_index = shard_index
+        self.shards = shards
+        self.renter_shards = {}
+        self.renter_shards_lock = threading.Lock()
+
+    def shard_for(self, car_id):
+        return self.shards[car_id % len(self.shards)]
+
+    def __len__(self):
+        return sum(shard.call("count") for shard in self.shards)
+
+    def __iter__(self):
+        # one shard's cars at a time rather than the whole fleet at once
+        return (car for shard in self.shards for car in shard.call("all_cars"))
+
+    def add(self, car):
+        self.shard_for(car.id).call("add", car)
+
+    def remove(self, car_id):
+        return self.shard_for(car_id).call("remove", car_id)
+
+    def get(self, car_id):
+        return self.shard_for(car_id).call("get", car_id)
+
+    def owned_by(self, owner_id):
+        return [car for shard in self.shards for car in shard.call("owned_by", owner_id)]
+
+    def available(self):
+        return [car for shard in self.shards for car in shard.call("available")]
+
+    def search(self, query):
+        """Yield the available cars matching a query in id order, merged from every shard as they are read."""
+        return heapq.merge(*(self._search_shard(shard, query) for shard in self.shards), key=lambda car: car.id)
+
+    @staticmethod
+    def _search_shard(shard, query):
+        """Yield the matching cars of one shard, fetching a page at a time only when the caller needs it."""
+        query = copy.copy(query)
+        while True:
+            page = shard.call("search", query)
+            yield from page
+            # a shard returns one car past the page when more follow
+            if len(page) <= query.limit:
+                return
+            query.after = page[-1].id
+
+    def rented_by(self, renter_id):
+        cars = []
+        for shard_number in self._renter_shards(renter_id):
+            shard_cars = self.shards[shard_number].call("rented_by", renter_id)
+            if not shard_cars:
+                self._forget_renter_shard(renter_id, shard_number)
+            cars.extend(shard_cars)
+        return cars
+
+    def rent(self, car_id, renter_id):
+        shard_number = car_id % len(self.shards)
+        with self.renter_shards_lock:
+            self.renter_shards.setdefault(renter_id, set()).add(shard_number)
+        return self.shards[shard_number].call("rent", car_id, renter_id)
+
+    def end_rental(self, car_id, renter_id):
+        return self.shard_for(car_id).call("end_rental", car_id, renter_id)
+
+    def cancel_rental(self, car_id, renter_id):
+        return self.shard_for(car_id).call("cancel_rental", car_id, renter_id)
+
+    def release(self, car):
+        self.shard_for(car.id).call("release_id", car.id)
+
+    def update_rented(self, renter_id, **fields):
+        for shard_number in self._renter_shards(renter_id):
+            self.shards[shard_number].call("update_rented", renter_id, **fields)
+
+    def set_price(self, owner_id, car_id, price):
+        return self.shard_for(car_id).call("set_price", owner_id, car_id, price)
+
+    def set_prices(self, owner_id, prices):
+        """Reprice cars with one batch per shard; each shard applies its batch all or nothing."""
+        batches = {}
+        for car_id, price in dict(prices).items():
+            batches.setdefault(car_id % len(self.shards), {})[car_id] = price
+        return self._sum_batches([self.shards[number].call("set_prices", owner_id, batch)
+                                  for number, batch in batches.items()])
+
+    def set_locks(self, owner_id, car_ids, lock):
+        """Lock or unlock cars with one batch per shard; each shard applies its batch all or nothing."""
+        batches = {}
+        for car_id in set(car_ids):
+            batches.setdefault(car_id % len(self.shards), []).append(car_id)
+        return self._sum_batches([self.shards[number].call("set_locks", owner_id, batch, lock)
+                                  for number, batch in batches.items()])
+
+    @staticmethod
+    def _sum_batches(counts):
+        # a shard that found a foreign car changed nothing, but the other shards may have
+        return None if None in counts else sum(counts)
+
+    def _renter_shards(self, renter_id):
+        with self.renter_shards_lock:
+            return sorted(self.renter_shards.get(renter_id, ()))
+
+    def _forget_renter_shard(self, renter_id, shard_number):
+        with self.renter_shards_lock:
+            shards = self.renter_shards.get(renter_id)
+            if shards is not None:
+                shards.discard(shard_number)
+                if not shards:
+                    del self.renter_shards[renter_id]
+
+
+def run_worker(shard_index, workers, addresses, authkey, host, port, mode, backlog, max_connections,
+               idle_timeout_s, data_dir=None, log_level=ServerLog.LogParams.DEFAULT_LEVEL, log_json=False,
+               metrics_port=None, reservation_timeout_s=RentalParams.RESERVATION_TIMEOUT_S,
+               rental_timeout_s=RentalParams.RENTAL_TIMEOUT_S, generated_cars=0):
+    # the log writer thread of the parent does not survive the fork
+    ServerLog.configure(log_level, log_json)
+    # each shard keeps its own journal, so workers never contend for a file
+    shard_dir = None if data_dir is None else os.path.join(data_dir, f"shard-{shard_index}")
+    local, journal = Server.open_fleet(shard_dir, lambda car: car.id % workers == shard_index)
+    add_generated_share(local, shard_index, workers, generated_cars)
+    ShardService(local, addresses[shard_index], authkey).start()
+    shards = [LocalShard(local) if index == shard_index else ShardPeer(address, authkey)
+              for index, address in enumerate(addresses)]
+    # a ShardedCarStore gets no geo index (nearby_Cars scans every shard instead) and no event hub (a
+    # subscriber would only hear about this shard); client ids stay unique across workers: worker i hands
+    # out i + 1, i + 1 + workers, ...
+    server = Server(host, port, backlog=backlog, max_connections=max_connections, reuse_port=True,
+                    idle_timeout_s=idle_timeout_s, reservation_timeout_s=reservation_timeout_s,
+                    rental_timeout_s=rental_timeout_s, cars=ShardedCarStore(shard_index, shards), journal=journal,
+                    first_client_id=shard_index + 1, client_id_step=workers, offload_commands=True)
+    log(logger, logging.INFO, "worker started", shard=shard_index, workers=workers, pid=os.getpid())
+    if metrics_port is not None:
+        server.serve_metrics(metrics_port + shard_index)
+    if mode == "async":
+        server.start_async()
+    else:
+        server.start()
+
+
+def add_generated_share(registry, shard_index, workers, count):
+    """
+    Add the generated cars that belong to a shard, for load tests.
+
+    Every worker numbers the generated fleet from after the default fleet, so
+    together the shards hold `count` generated cars, as one process given
+    the same count would. Cars a recovered shard already has are kept.
+    """
+    first_id = max(car.id for car in Server.default_fleet()) + 1
+    # start from the first generated id that falls on this shard
+    for car_id in range(first_id + (shard_index - first_id) % workers, first_id + count, workers):
+        if registry.get(car_id) is None:
+            registry.add(Server.generated_car(car_id))
+
+
+def run_sharded(host, port, workers, mode="async", backlog=10, max_connections=10000, idle_timeout_s=600,
+                data_dir=None, log_level=ServerLog.LogParams.DEFAULT_LEVEL, log_json=False, metrics_port=None,
+                reservation_timeout_s=RentalParams.RESERVATION_TIMEOUT_S,
+                rental_timeout_s=RentalParams.RENTAL_TIMEOUT_S, generated_cars=0):
+    """
+    Fork `workers` server processes that share one listening port through SO_REUSEPORT.
+
+    Args:
+        host: The address to listen on.
+        port: The port every worker binds.
+        workers: Number of worker processes, which is also the number of shards.
+        mode: "async" or "threaded", the serving mode of each worker.
+        backlog: Listen backlog of each worker.
+        max_connections: Connection cap of each worker.
+        idle_timeout_s: Idle session timeout of each worker.
+        data_dir: Directory under which every worker journals its shard, or None.
+        log_level: The lowest level each worker logs.
+        log_json: Log one JSON object per line.
+        metrics_port: Worker i serves its metrics on this port + i; None serves none.
+        reservation_timeout_s: Seconds a renter has to pick up a rented car.
+        rental_timeout_s: Seconds a picked up car may stay rented.
+        generated_cars: Number of generated cars for load tests, spread over the shards by car id.
+    """
+    context = multiprocessing.get_context("fork")
+    authkey = os.urandom(16)
+    with tempfile.TemporaryDirectory(prefix="carsharing-shards-") as directory:
+        addresses = [os.path.join(directory, f"shard-{index}.sock") for index in range(workers)]
+        processes = [context.Process(target=run_worker, daemon=True,
+                                     args=(index, workers, addresses, authkey, host, port, mode, backlog,
+                                           max_connections, idle_timeout_s, data_dir, log_level, log_json,
+                                           metrics_port, reservation_timeout_s, rental_timeout_s, generated_cars))
+                     for index in range(workers)]
+        for process in processes:
+            process.start()
+        # turn SIGTERM into SystemExit so the workers are terminated with the parent
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                process.terminate()
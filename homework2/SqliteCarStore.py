@@ -0,0 +1,311 @@
+import contextlib
+import queue
+import sqlite3
+import threading
+
+from Journal import car_from_state, car_state
+
+
+class SqliteParams:
+    """Schema and statements of the SQLite car store."""
+    COLUMNS = "id, brand, model, year, price, owner_id, availability, paid, user_id, lock, start_engine"
+    """Column order; the same as Journal.car_state, so rows convert with car_from_state."""
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS cars (id INTEGER PRIMARY KEY, brand TEXT, model TEXT, year INTEGER, "
+        "price INTEGER, owner_id, availability INTEGER, paid INTEGER, user_id, lock INTEGER, "
+        "start_engine INTEGER)",
+        "CREATE INDEX IF NOT EXISTS cars_by_owner ON cars (owner_id)",
+        "CREATE INDEX IF NOT EXISTS cars_by_renter ON cars (user_id) WHERE user_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS available_cars ON cars (availability, id)",
+    )
+    PRAGMAS = ("PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL")
+    """WAL lets readers run while one writer commits; NORMAL syncs only at WAL checkpoints."""
+    BUSY_TIMEOUT_S = 5.0
+    POOL_SIZE = 8
+    """Most connections open at once; a caller finding them all leased waits for one to be returned."""
+    PAGE_ROWS = 256
+    """Rows read per leased connection when iterating the fleet or a search."""
+    CACHED_STATEMENTS = 64
+    """Per-connection cache of prepared statements; every statement below stays prepared."""
+    UPDATABLE_FIELDS = frozenset(["paid", "lock", "start_engine"])
+    """Fields update_rented may set."""
+
+    INSERT = f"INSERT OR REPLACE INTO cars ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    DELETE = "DELETE FROM cars WHERE id = ?"
+    COUNT = "SELECT COUNT(*) FROM cars"
+    SELECT_PAGE = f"SELECT {COLUMNS} FROM cars WHERE id > ? ORDER BY id LIMIT ?"
+    SELECT_BY_ID = f"SELECT {COLUMNS} FROM cars WHERE id = ?"
+    SELECT_BY_OWNER = f"SELECT {COLUMNS} FROM cars WHERE owner_id = ? ORDER BY id"
+    SELECT_BY_RENTER = f"SELECT {COLUMNS} FROM cars WHERE user_id = ? ORDER BY id"
+    SELECT_RENTED = f"SELECT {COLUMNS} FROM cars WHERE user_id IS NOT NULL ORDER BY id"
+    SELECT_AVAILABLE = f"SELECT {COLUMNS} FROM cars WHERE availability = 1 ORDER BY id"
+    RENT = "UPDATE cars SET availability = 0, user_id = ? WHERE id = ? AND availability = 1"
+    END_RENTAL = "UPDATE cars SET availability = 1, paid = 0, user_id = NULL WHERE id = ? AND user_id = ? AND paid = 1"
+    CANCEL_RENTAL = "UPDATE cars SET availability = 1, paid = 0, user_id = NULL WHERE id = ? AND user_id = ?"
+    RELEASE = "UPDATE cars SET availability = 1, paid = 0, user_id = NULL WHERE id = ?"
+    UPDATE_RENTED = {field: f"UPDATE cars SET {field} = ? WHERE user_id = ?" for field in UPDATABLE_FIELDS}
+    SET_PRICE = "UPDATE cars SET price = ? WHERE id = ? AND owner_id = ?"
+    SELECT_OWNER = "SELECT owner_id FROM cars WHERE id = ?"
+    SET_LOCK = "UPDATE cars SET lock = ? WHERE id = ? AND availability = 1"
+    SEARCH = f"SELECT {COLUMNS} FROM cars WHERE availability = 1 AND id > ?"
+    """Start of a search; filter conditions are appended, followed by SEARCH_ORDER."""
+    SEARCH_FILTERS = (("brand", "brand = ?"), ("max_price", "price <= ?"), ("min_year", "year >= ?"),
+                      ("max_year", "year <= ?"))
+    SEARCH_ORDER = " ORDER BY id LIMIT ?"
+
+
+class SqliteCarStore:
+    """
+    A CarRegistry look-alike that keeps the fleet in an SQLite database.
+
+    The fleet no longer has to fit in memory and survives restarts.
+    Connections come from a bounded pool and are leased for one call, so
+    however many threads use the store, at most pool_size connections are
+    open. They run in autocommit mode, so each transition is one atomic
+    UPDATE whose WHERE clause is the compare-and-set condition. Car objects
+    returned are snapshots of a row: change cars through the store, not by
+    setting attributes on them.
+    """
+
+    def __init__(self, path, cars=(), pool_size=SqliteParams.POOL_SIZE):
+        """
+        Initialize SqliteCarStore.
+
+        Args:
+            path: The database file; created with the schema if missing.
+            cars: Cars to register up front.
+            pool_size: Most connections open at once.
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.opened_lock = threading.Lock()
+        with self.connection() as connection:
+            for statement in SqliteParams.SCHEMA:
+                connection.execute(statement)
+        self.add_many(cars)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Lease a connection for the duration of a with block, opening one if the pool is not full yet."""
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self.opened_lock:
+                if self.opened < self.pool_size:
+                    self.opened += 1
+                    connection = self._open()
+            if connection is None:
+                connection = self.idle.get()
+        try:
+            yield connection
+        finally:
+            self.idle.put(connection)
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=SqliteParams.BUSY_TIMEOUT_S, isolation_level=None,
+                                     cached_statements=SqliteParams.CACHED_STATEMENTS, check_same_thread=False)
+        # synchronous is a setting of the connection, not of the database
+        for statement in SqliteParams.PRAGMAS:
+            connection.execute(statement)
+        return connection
+
+    def close(self):
+        """Close the idle connections; call it once nothing uses the store any more."""
+        with self.opened_lock:
+            while True:
+                try:
+                    self.idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self.opened -= 1
+
+    def __len__(self):
+        with self.connection() as connection:
+            return connection.execute(SqliteParams.COUNT).fetchone()[0]
+
+    def __iter__(self):
+        return self._pages(SqliteParams.SELECT_PAGE, [-1])
+
+    def add(self, car):
+        """Register a car, replacing any car that already has the same id."""
+        with self.connection() as connection:
+            connection.execute(SqliteParams.INSERT, car_state(car))
+
+    def add_many(self, cars):
+        """Register many cars in one transaction."""
+        with self.connection() as connection:
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(SqliteParams.INSERT, map(car_state, cars))
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def remove(self, car_id):
+        car = self.get(car_id)
+        if car is not None:
+            with self.connection() as connection:
+                connection.execute(SqliteParams.DELETE, (car_id,))
+        return car
+
+    def get(self, car_id):
+        with self.connection() as connection:
+            row = connection.execute(SqliteParams.SELECT_BY_ID, (car_id,)).fetchone()
+        return None if row is None else car_from_state(row)
+
+    def owned_by(self, owner_id):
+        return self._select(SqliteParams.SELECT_BY_OWNER, (owner_id,))
+
+    def rented_by(self, renter_id):
+        return self._select(SqliteParams.SELECT_BY_RENTER, (renter_id,))
+
+    def rented(self):
+        return self._select(SqliteParams.SELECT_RENTED)
+
+    def available(self):
+        return self._select(SqliteParams.SELECT_AVAILABLE)
+
+    def search(self, query):
+        """
+        Yield the available cars matching a query, in id order, starting after its cursor.
+
+        Rows are read lazily, PAGE_ROWS at a time, so a page only reads about
+        as many rows as it needs and no connection stays leased while the
+        caller works through them. The near-location filter runs on the rows
+        SQLite returns, because locations are not stored in the database.
+
+        Args:
+            query: A CarQuery.
+        """
+        statement = SqliteParams.SEARCH
+        parameters = [-1 if query.after is None else query.after]
+        for field, condition in SqliteParams.SEARCH_FILTERS:
+            value = getattr(query, field)
+            if value is not None:
+                statement += " AND " + condition
+                parameters.append(value)
+        for car in self._pages(statement + SqliteParams.SEARCH_ORDER, parameters):
+            if query.near is None or query.matches(car):
+                yield car
+
+    def rent(self, car_id, renter_id):
+        """
+        Hand an available car to a renter.
+
+        Args:
+            car_id: The id of the requested car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the rental started, False if the car does not exist or is taken.
+        """
+        return self._update(SqliteParams.RENT, (renter_id, car_id))
+
+    def end_rental(self, car_id, renter_id):
+        """
+        Return a paid car, if it is still rented by the given renter.
+
+        Args:
+            car_id: The id of the rented car.
+            renter_id: The client id of the renter.
+
+        Returns:
+            True if the car was released, False if it is not rented by this renter or not paid.
+        """
+        return self._update(SqliteParams.END_RENTAL, (car_id, renter_id))
+
+    def cancel_rental(self, car_id, renter_id):
+        """Release a car, paid or not, if it is still rented by the given renter; returns whether it was."""
+        return self._update(SqliteParams.CANCEL_RENTAL, (car_id, renter_id))
+
+    def release(self, car):
+        """End the rental of a car and make it available again."""
+        self._update(SqliteParams.RELEASE, (car.id,))
+
+    def update_rented(self, renter_id, **fields):
+        """Set the given attributes on every car currently rented by a renter."""
+        for name, value in fields.items():
+            if name not in SqliteParams.UPDATABLE_FIELDS:
+                raise AttributeError(f"{name} cannot be updated")
+            self._update(SqliteParams.UPDATE_RENTED[name], (value, renter_id))
+
+    def set_price(self, owner_id, car_id, price):
+        return self._update(SqliteParams.SET_PRICE, (price, car_id, owner_id))
+
+    def set_prices(self, owner_id, prices):
+        """
+        Change the prices of many cars of one owner in one transaction.
+
+        Args:
+            owner_id: The owner; every car must be theirs.
+            prices: A dict or (car_id, price) pairs; the last price given for a car wins.
+
+        Returns:
+            The number of cars repriced, or None, with nothing changed, if a car does
+            not exist or belongs to someone else.
+        """
+        prices = dict(prices)
+        return self._owner_batch(owner_id, prices, SqliteParams.SET_PRICE,
+                                 [(price, car_id, owner_id) for car_id, price in prices.items()])
+
+    def set_locks(self, owner_id, car_ids, lock):
+        """
+        Lock or unlock many cars of one owner in one transaction; rented cars are left to their renters.
+
+        Returns:
+            The number of available cars changed, or None, with nothing changed, if a
+            car does not exist or belongs to someone else.
+        """
+        car_ids = set(car_ids)
+        return self._owner_batch(owner_id, car_ids, SqliteParams.SET_LOCK,
+                                 [(lock, car_id) for car_id in car_ids])
+
+    def _owner_batch(self, owner_id, car_ids, statement, parameters):
+        with self.connection() as connection:
+            # IMMEDIATE takes the write lock up front, so no car changes owner between the check and the update
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for car_id in car_ids:
+                    row = connection.execute(SqliteParams.SELECT_OWNER, (car_id,)).fetchone()
+                    if row is None or row[0] != owner_id:
+                        connection.execute("ROLLBACK")
+                        return None
+                changes = connection.total_changes
+                connection.executemany(statement, parameters)
+                changes = connection.total_changes - changes
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return changes
+
+    def _pages(self, statement, parameters):
+        """
+        Yield the cars of a statement page by page, leasing a connection for each page.
+
+        Args:
+            statement: A statement whose first parameter is the id to start after and whose last
+                is the page size, ordered by id.
+            parameters: Its parameters without the page size.
+        """
+        parameters = list(parameters) + [SqliteParams.PAGE_ROWS]
+        while True:
+            with self.connection() as connection:
+                rows = connection.execute(statement, parameters).fetchall()
+            for row in rows:
+                yield car_from_state(row)
+            if len(rows) < SqliteParams.PAGE_ROWS:
+                return
+            parameters[0] = rows[-1][0]
+
+    def _select(self, statement, parameters=()):
+        with self.connection() as connection:
+            return [car_from_state(row) for row in connection.execute(statement, parameters)]
+
+    def _update(self, statement, parameters):
+        with self.connection() as connection:
+            return connection.execute(statement, parameters).rowcount > 0
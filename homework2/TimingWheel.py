@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+class WheelParams:
+    """Parameters of the timing wheel."""
+    TICK_S = 1.0
+    """Resolution of the wheel: timers fire on the first tick at or after their deadline."""
+    SLOT_BITS = 8
+    """Every level has 2 ** SLOT_BITS slots."""
+    LEVELS = 4
+    """Number of levels; together they cover 2 ** (SLOT_BITS * LEVELS) ticks ahead."""
+
+
+class Timer:
+    """A scheduled payload; cancelling it only marks it, the wheel drops it when its slot comes up."""
+    __slots__ = ("tick", "payload", "cancelled")
+
+    def __init__(self, tick, payload):
+        self.tick = tick
+        self.payload = payload
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel.
+
+    Level 0 has one slot per tick; every slot of level n spans all of level
+    n - 1. A timer goes into the lowest level whose span reaches its deadline,
+    and is moved one level down each time the wheel reaches the slot it waits
+    in. Scheduling and cancelling are O(1), and each timer is moved at most
+    LEVELS - 1 times before it expires, so however many timers are pending,
+    a tick only costs the timers that are due or cascade in it.
+    """
+
+    def __init__(self, tick_s=WheelParams.TICK_S, slot_bits=WheelParams.SLOT_BITS, levels=WheelParams.LEVELS,
+                 now=None):
+        """
+        Initialize TimingWheel.
+
+        Args:
+            tick_s: Resolution of the wheel in seconds.
+            slot_bits: Every level has 2 ** slot_bits slots.
+            levels: Number of levels.
+            now: The time.monotonic() value of tick 0; defaults to the real clock.
+        """
+        self.tick_s = tick_s
+        self.slot_bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.levels = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.max_ticks = (1 << (slot_bits * levels)) - 1
+        self.origin = time.monotonic() if now is None else now
+        self.tick = 0  # the next tick to run; every earlier tick has run
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Timers scheduled and not yet expired, cancelled ones included until their slot is reached."""
+        return self.pending
+
+    def schedule(self, delay_s, payload, now=None):
+        """
+        Schedule a payload.
+
+        Args:
+            delay_s: Seconds from now until the payload is due.
+            payload: Returned by advance() once due.
+            now: The current time.monotonic() value; defaults to the real clock.
+
+        Returns:
+            The Timer, which can be cancelled.
+        """
+        if now is None:
+            now = time.monotonic()
+        # round up, so a timer never fires before its deadline
+        tick = -int((self.origin - now - delay_s) // self.tick_s)
+        with self.lock:
+            timer = Timer(max(tick, self.tick), payload)
+            self._insert(timer)
+            self.pending += 1
+        return timer
+
+    def advance(self, now=None):
+        """
+        Run every tick up to now.
+
+        Args:
+            now: The current time.monotonic() value; defaults to the real clock.
+
+        Returns:
+            The payloads of the timers that came due and were not cancelled, in deadline order.
+        """
+        now = time.monotonic() if now is None else now
+        last_tick = int((now - self.origin) // self.tick_s)
+        due = []
+        with self.lock:
+            while self.tick <= last_tick:
+                if not self.pending:
+                    # nothing can be due: skip the empty ticks instead of visiting them
+                    self.tick = last_tick + 1
+                    break
+                self._cascade()
+                slot = self.levels[0][self.tick & self.mask]
+                if slot:
+                    self.levels[0][self.tick & self.mask] = []
+                    self.pending -= len(slot)
+                    due.extend(timer.payload for timer in slot if not timer.cancelled)
+                self.tick += 1
+        return due
+
+    def _cascade(self):
+        # at the start of every lap of level n - 1, move the timers of the level n slot it begins down
+        tick = self.tick
+        for level in range(1, len(self.levels)):
+            if tick & self.mask:
+                return
+            tick >>= self.slot_bits
+            index = tick & self.mask
+            slot = self.levels[level][index]
+            self.levels[level][index] = []
+            for timer in slot:
+                if not timer.cancelled:
+                    self._insert(timer)
+                else:
+                    self.pending -= 1
+
+    def _insert(self, timer):
+        tick = timer.tick
+        delta = tick - self.tick
+        if delta > self.max_ticks:
+            # a timer past the last level waits in its farthest slot and is placed again from there
+            delta = self.max_ticks
+            tick = self.tick + delta
+        level = (delta.bit_length() - 1) // self.slot_bits if delta else 0
+        shift = self.slot_bits * level
+        self.levels[level][(tick >> shift) & self.mask].append(timer)
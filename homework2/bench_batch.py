@@ -0,0 +1,64 @@
+import argparse
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from bench_server import SERVER_HOST
+from Car import Car
+from CarsharingClient import CarsharingClient
+from Server import Server
+
+OWNER_ID = 7
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprice a large owner fleet car by car and in one batch")
+    parser.add_argument("--cars", type=int, default=10000, help="cars of the owner")
+    parser.add_argument("--port", type=int, default=12350)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-batch-") as data_dir:
+        server = Server(SERVER_HOST, args.port, data_dir=data_dir)
+        first_id = max(car.id for car in server.cars) + 1
+        car_ids = list(range(first_id, first_id + args.cars))
+        for car_id in car_ids:
+            server.cars.add(Car("Dacia", "Logan", 2020, 50, OWNER_ID, car_id))
+        threading.Thread(target=server.start_async, daemon=True).start()
+        while True:
+            try:
+                socket.create_connection((SERVER_HOST, args.port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        rng = random.Random(1)
+
+        with CarsharingClient(SERVER_HOST, args.port) as client:
+            client.login_owner(OWNER_ID)
+
+            seq = server.journal.seq
+            started = time.perf_counter()
+            for car_id in car_ids:
+                client.request_many([("change_Price", ())])
+                client.set_price(OWNER_ID, car_id, rng.randrange(40, 240))
+            elapsed = time.perf_counter() - started
+            print(f"car by car: {2 * args.cars} round trips, {server.journal.seq - seq} journal entries, "
+                  f"{elapsed:.2f} s")
+
+            seq = server.journal.seq
+            started = time.perf_counter()
+            changed = client.set_prices(OWNER_ID, {car_id: rng.randrange(40, 240) for car_id in car_ids})
+            elapsed = time.perf_counter() - started
+            print(f"set_Prices: 1 round trip, {server.journal.seq - seq} journal entry, {changed} cars, "
+                  f"{elapsed * 1000:.1f} ms")
+
+            started = time.perf_counter()
+            changed = client.lock_cars(OWNER_ID, car_ids)
+            elapsed = time.perf_counter() - started
+            print(f"lock_Cars: {changed} cars in {elapsed * 1000:.1f} ms")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
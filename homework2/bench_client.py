@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import random
+import time
+
+from bench_server import SERVER_HOST, raise_file_limit, start_server
+from CarsharingClient import AsyncClientPool, CarsharingClient
+
+
+async def rent_once(pool, rng, fleet, page_size):
+    """Lease a renter, find a free car near a random cursor, rent it, pay and return it."""
+    async with pool.session() as client:
+        if client.login is None:
+            await client.register_renter()
+        for _ in range(5):
+            page = await client.search_cars(after=rng.randrange(fleet), limit=page_size)
+            if page.cars and await client.rent(rng.choice(page.cars).id):
+                break
+        else:
+            return False
+        await client.unlock()
+        await client.pay()
+        return await client.end_rental()
+
+
+async def run(args):
+    pool = AsyncClientPool(args.host, args.port, size=args.connections, timeout_s=args.timeout)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(rent_once(pool, rng, args.fleet, args.page_size)
+                                     for _ in range(args.rentals)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await pool.close()
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent rentals through the asyncio client pool")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--rentals", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=2000, help="size of the client pool")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--fleet", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--spawn", choices=["threaded", "async"],
+                        help="start a server in this mode on --port for the run, with --fleet generated cars")
+    args = parser.parse_args()
+    raise_file_limit()
+
+    process = None
+    if args.spawn:
+        process = start_server(args.spawn, args.port, args.connections + 100,
+                               ["--generated-cars", str(args.fleet), "--idle-timeout", "3600"])
+    try:
+        with CarsharingClient(args.host, args.port) as client:
+            with client.pipeline() as batch:
+                batch.register_renter()
+                batch.search_cars(limit=1)
+            print(f"pipelined check: first car {batch.results[1].cars[0]}")
+        results, elapsed = asyncio.run(run(args))
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+
+    completed = sum(result is True for result in results)
+    failures = {}
+    for result in results:
+        if result is not True:
+            kind = "no free car" if result is False else type(result).__name__
+            failures[kind] = failures.get(kind, 0) + 1
+    print(f"{completed} of {args.rentals} rentals over {args.connections} connections in {elapsed:.2f} s: "
+          f"{completed / elapsed:.0f} rentals/s")
+    for kind, count in failures.items():
+        print(f"  {count} x {kind}")
+
+
+if __name__ == "__main__":
+    main()
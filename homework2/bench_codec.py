@@ -0,0 +1,44 @@
+import argparse
+import timeit
+
+from Codec import CarListing
+from Protocol import BINARY_CODEC, TEXT_CODEC
+
+
+COMMANDS = ["register_Renter", "register_Owner", "owner_Id: 11", "change_Price", "11:1:90", "post_Car",
+            "request_Car", "car_Id: 3", "start_Engine", "unlock_Car", "lock_Car", "pay_Rental", "end_Rental"]
+REPLIES = ["You are registered as a renter.", "Rental started.", "Engine started.", "Car not found or not available."]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare wire size and parse time of the text and binary codecs")
+    parser.add_argument("--cars", type=int, default=1000, help="records in the listing sample")
+    parser.add_argument("--number", type=int, default=100000, help="decode repetitions per command")
+    args = parser.parse_args()
+
+    print(f"{'command':>16} {'text B':>7} {'bin B':>6} {'text us':>8} {'bin us':>7}")
+    for message in COMMANDS:
+        command, command_args = TEXT_CODEC.parse(message)
+        text_payload = TEXT_CODEC.encode_command(command, command_args)
+        binary_payload = BINARY_CODEC.encode_command(command, command_args)
+        assert BINARY_CODEC.decode_command(binary_payload) == (command, command_args)
+        text_us = timeit.timeit(lambda: TEXT_CODEC.decode_command(text_payload), number=args.number) / args.number * 1e6
+        binary_us = timeit.timeit(lambda: BINARY_CODEC.decode_command(binary_payload), number=args.number) / args.number * 1e6
+        print(f"{message:>16} {len(text_payload):7} {len(binary_payload):6} {text_us:8.3f} {binary_us:7.3f}")
+
+    print()
+    for reply in REPLIES:
+        print(f"{reply:>40}: text {len(TEXT_CODEC.encode_reply(reply)):3} B, binary {len(BINARY_CODEC.encode_reply(reply))} B")
+
+    listing = CarListing("available", [{"id": car_id, "brand": "Dacia", "model": "Logan", "year": 2015 + car_id % 10,
+                                        "price": 50 + car_id % 100, "location": "45.7489,21.2087"}
+                                       for car_id in range(args.cars)])
+    text_listing = TEXT_CODEC.encode_reply(listing)
+    binary_listing = BINARY_CODEC.encode_reply(listing)
+    assert BINARY_CODEC.decode_reply(binary_listing).cars == listing.cars
+    print(f"\nlisting of {args.cars} cars: text {len(text_listing)} B, binary {len(binary_listing)} B "
+          f"({len(binary_listing) / len(text_listing):.0%})")
+
+
+if __name__ == "__main__":
+    main()
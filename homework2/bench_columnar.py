@@ -0,0 +1,65 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from Car import Car, CompactCar
+from CarRegistry import CarRegistry
+from ColumnarFleet import ColumnarFleet
+
+BRANDS = ("Dacia", "Audi", "BMW", "Renault", "Skoda")
+
+
+def fleet(car_class, size):
+    return (car_class(BRANDS[car_id % 5], "Model", 2010 + car_id % 15, 30 + car_id % 300, 100 + car_id % 5000,
+                      car_id)
+            for car_id in range(1, size + 1))
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    built = build()
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, size, elapsed
+
+
+def time_query(query, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = query()
+    return (time.perf_counter() - started) / repeat, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory and bulk-query speed of the fleet representations")
+    parser.add_argument("--cars", type=int, default=1000000)
+    parser.add_argument("--max-price", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, build in (("list of Car", lambda: list(fleet(Car, args.cars))),
+                        ("list of CompactCar", lambda: list(fleet(CompactCar, args.cars))),
+                        ("CarRegistry", lambda: CarRegistry(fleet(Car, args.cars))),
+                        ("ColumnarFleet", lambda: ColumnarFleet(fleet(CompactCar, args.cars)))):
+        built, size, elapsed = measure_memory(build)
+        print(f"{name:>18}: {size / args.cars:7.1f} B per car, built in {elapsed:.2f} s")
+        if isinstance(built, CarRegistry):
+            for car_id in range(1, args.cars + 1, 2):
+                built.rent(car_id, 7)
+            seconds, found = time_query(
+                lambda: [car.id for car in built.available() if car.price <= args.max_price], args.repeat)
+            print(f"{'':>18}  available under {args.max_price}: {found} cars in {seconds * 1000:.1f} ms")
+        elif isinstance(built, ColumnarFleet):
+            for car_id in range(1, args.cars + 1, 2):
+                built.rent(car_id, 7)
+            seconds, found = time_query(lambda: built.available_ids(args.max_price), args.repeat)
+            print(f"{'':>18}  available under {args.max_price}: {found} cars in {seconds * 1000:.1f} ms")
+        del built
+
+
+if __name__ == "__main__":
+    main()
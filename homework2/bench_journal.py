@@ -0,0 +1,63 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+from Car import Car
+from CarRegistry import CarRegistry
+from Journal import Journal
+
+
+def build_registry(fleet_size):
+    return CarRegistry(Car("Dacia", "Logan", 2015 + car_id % 10, 50 + car_id % 100, 100 + car_id % 50, car_id)
+                       for car_id in range(1, fleet_size + 1))
+
+
+def run_transitions(registry, transitions, fleet_size, sync_each=None):
+    started = time.perf_counter()
+    for number in range(transitions):
+        car_id = number % fleet_size + 1
+        renter_id = 1000000 + number
+        registry.rent(car_id, renter_id)
+        registry.update_rented(renter_id, paid=1)
+        registry.end_rental(car_id, renter_id)
+        if sync_each is not None:
+            sync_each()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure journaling overhead, snapshot size and recovery time")
+    parser.add_argument("--cars", type=int, default=1000000)
+    parser.add_argument("--rentals", type=int, default=20000, help="rent/pay/return cycles to journal")
+    parser.add_argument("--fsync-each-sample", type=int, default=500,
+                        help="cycles timed with one fsync per operation, to compare with group commit")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="carsharing-journal-")
+    try:
+        registry = build_registry(args.cars)
+        journal = Journal(directory, snapshot_every=10 ** 9)
+        journal.attach(registry)
+        started = time.perf_counter()
+        journal.snapshot()
+        print(f"snapshot of {args.cars} cars: {time.perf_counter() - started:.2f} s")
+
+        baseline = run_transitions(build_registry(1000), args.rentals, 1000)
+        print(f"no journal:        {args.rentals * 3 / baseline:10.0f} transitions/s")
+        elapsed = run_transitions(registry, args.rentals, args.cars)
+        journal.sync()
+        print(f"group commit:      {args.rentals * 3 / elapsed:10.0f} transitions/s")
+        elapsed = run_transitions(registry, args.fsync_each_sample, args.cars, sync_each=journal.sync)
+        print(f"fsync per cycle:   {args.fsync_each_sample * 3 / elapsed:10.0f} transitions/s")
+        journal.close()
+
+        started = time.perf_counter()
+        recovered = Journal(directory).recover()
+        print(f"recovered {len(recovered)} cars in {time.perf_counter() - started:.2f} s")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
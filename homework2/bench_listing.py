@@ -0,0 +1,68 @@
+import argparse
+import time
+
+from Car import Car
+from LocationProvider import CachedLocationProvider, StaticLocationProvider
+from Server import Server
+
+
+class SlowLocationProvider(StaticLocationProvider):
+    """A stub provider that simulates the latency of one HTTP round-trip per lookup."""
+
+    def __init__(self, latency_s):
+        super().__init__()
+        self.latency_s = latency_s
+
+    def lookup(self, car_ids):
+        time.sleep(self.latency_s)
+        return super().lookup(car_ids)
+
+
+def build_server(fleet_size):
+    server = Server('127.0.0.1', 0)
+    for car_id in range(4, fleet_size + 1):
+        server.cars.add(Car("Dacia", "Logan", 2015 + car_id % 10, 50 + car_id % 100, 100 + car_id % 50, car_id))
+    client_id = server.register_client()
+    server.set_client_type(client_id, "renter")
+    return server, client_id
+
+
+def time_listing(server, client_id, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        server.process_message(client_id, "post_Car")
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time post_Car listings with and without the location cache")
+    parser.add_argument("--cars", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated HTTP round-trip per lookup")
+    parser.add_argument("--uncached-sample", type=int, default=20,
+                        help="cars located one by one to extrapolate the uncached listing time")
+    args = parser.parse_args()
+
+    server, client_id = build_server(args.cars)
+    provider = SlowLocationProvider(args.latency_ms / 1000)
+
+    started = time.perf_counter()
+    for car_id in range(1, args.uncached_sample + 1):
+        provider.lookup([car_id])
+    uncached = (time.perf_counter() - started) / args.uncached_sample * args.cars
+    print(f"uncached listing of {args.cars} cars: {uncached:8.3f} s (extrapolated, one lookup per car)")
+
+    Car.location_provider = CachedLocationProvider(provider)
+    started = time.perf_counter()
+    Car.location_provider.refresh(car.id for car in server.cars)
+    print(f"cache warm-up:                  {time.perf_counter() - started:8.3f} s "
+          f"({provider.lookup_calls - args.uncached_sample} batched lookups)")
+
+    calls_before = provider.lookup_calls
+    cached = time_listing(server, client_id, args.repeat)
+    print(f"cached listing of {args.cars} cars:   {cached:8.3f} s "
+          f"({provider.lookup_calls - calls_before} lookups on the hot path)")
+
+
+if __name__ == "__main__":
+    main()
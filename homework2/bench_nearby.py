@@ -0,0 +1,64 @@
+import argparse
+import random
+import time
+
+from Car import Car
+from CarRegistry import CarRegistry
+from GeoIndex import GeoIndex, nearest_linear
+from LocationProvider import CachedLocationProvider, StaticLocationProvider
+
+CENTER = (45.7489, 21.2087)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time nearest-available-car queries: grid index against a linear scan")
+    parser.add_argument("--cars", type=int, default=1000000)
+    parser.add_argument("--spread-deg", type=float, default=0.5, help="side of the square the cars are spread over")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--linear-queries", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    half = args.spread_deg / 2
+
+    def random_point():
+        return CENTER[0] + rng.uniform(-half, half), CENTER[1] + rng.uniform(-half, half)
+
+    locations = {car_id: "{:.6f},{:.6f}".format(*random_point()) for car_id in range(1, args.cars + 1)}
+    provider = CachedLocationProvider(StaticLocationProvider(locations))
+    Car.location_provider = provider
+    registry = CarRegistry(Car("Dacia", "Logan", 2020, 50, 100 + car_id % 50, car_id)
+                           for car_id in range(1, args.cars + 1))
+    for car_id in range(1, args.cars + 1, 2):
+        registry.rent(car_id, 1000000 + car_id)
+    provider.refresh(range(1, args.cars + 1))
+
+    started = time.perf_counter()
+    index = GeoIndex()
+    index.attach(registry, provider)
+    print(f"indexed {len(index)} available cars of {args.cars} in {time.perf_counter() - started:.2f} s")
+
+    points = [random_point() for _ in range(args.queries)]
+    started = time.perf_counter()
+    for lat, lon in points:
+        index.nearest(lat, lon, args.k)
+    indexed_s = (time.perf_counter() - started) / args.queries
+
+    started = time.perf_counter()
+    for lat, lon in points[:args.linear_queries]:
+        assert [car.id for car in nearest_linear(registry.available(), lat, lon, args.k)] == \
+            index.nearest(lat, lon, args.k)
+    linear_s = (time.perf_counter() - started) / args.linear_queries
+    print(f"k={args.k}: index {indexed_s * 1e6:8.1f} us/query, linear scan {linear_s * 1e3:8.1f} ms/query "
+          f"({linear_s / indexed_s:.0f}x)")
+
+    started = time.perf_counter()
+    for lat, lon in points:
+        registry.rent(index.nearest(lat, lon, 1)[0], 2000000)
+    print(f"rent the nearest car, index kept up to date: {(time.perf_counter() - started) / args.queries * 1e6:.1f} "
+          f"us/rental")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+from bench_server import SERVER_HOST, start_server
+from Client import Client
+
+
+def run(port, commands, depth):
+    """
+    Send `commands` start_Engine commands over one framed connection.
+
+    Args:
+        port: The server port.
+        commands: Total number of commands to send.
+        depth: Commands in flight per round-trip; 1 disables pipelining.
+
+    Returns:
+        Commands per second.
+    """
+    client = Client(SERVER_HOST, port)
+    client.client_socket.connect((SERVER_HOST, port))
+    client.enable_framing()
+    client.request("register_Renter")
+    started = time.perf_counter()
+    sent = 0
+    while sent < commands:
+        batch = min(depth, commands - sent)
+        replies = client.pipeline(["start_Engine"] * batch)
+        assert replies == ["Engine started."] * batch
+        sent += batch
+    elapsed = time.perf_counter() - started
+    client.disconnect()
+    return commands / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare framed commands per second with and without pipelining")
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--mode", choices=["threaded", "async"], default="async")
+    parser.add_argument("--port", type=int, default=12410)
+    args = parser.parse_args()
+
+    process = start_server(args.mode, args.port, 100)
+    try:
+        for depth in args.depths:
+            label = "pipelining off" if depth == 1 else f"pipeline depth {depth}"
+            print(f"{label:>20}: {run(args.port, args.commands, depth):10.0f} commands/s")
+    finally:
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import contextlib
+import io
+import time
+
+from Car import Car
+from CarQuery import CarQuery
+from LocationProvider import CachedLocationProvider, StaticLocationProvider
+from Protocol import TEXT_CODEC
+from Server import Server
+
+
+def build_server(fleet_size):
+    server = Server('127.0.0.1', 0)
+    for car_id in range(4, fleet_size + 1):
+        server.cars.add(Car("Dacia" if car_id % 3 else "Audi", "Logan", 2010 + car_id % 15, 50 + car_id % 100,
+                            100 + car_id % 50, car_id))
+    client_id = server.register_client()
+    server.set_client_type(client_id, "renter")
+    return server, client_id
+
+
+def first_chunk_and_total(server, client_id, command, args):
+    started = time.perf_counter()
+    chunks = server.reply_payloads(TEXT_CODEC, server.execute(client_id, command, args))
+    first = next(chunks)
+    first_s = time.perf_counter() - started
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    return first_s, time.perf_counter() - started, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time filtered, paginated listings against the full post_Car listing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    Car.location_provider = CachedLocationProvider(StaticLocationProvider())
+    query = CarQuery(brand="Audi", max_price=120, min_year=2015, max_year=2020, limit=args.page)
+    for size in args.sizes:
+        server, client_id = build_server(size)
+        Car.location_provider.prefetch(car.id for car in server.cars)
+        Car.location_provider.refresh()
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = first_chunk_and_total(server, client_id, "post_Car", ())
+            page = first_chunk_and_total(server, client_id, "search_Cars", (query,))
+        print(f"{size:>8} cars: post_Car first chunk {full[0] * 1000:7.2f} ms, all {full[1] * 1000:8.1f} ms "
+              f"({full[2] / 2 ** 20:6.1f} MiB); filtered page of {args.page}: {page[1] * 1000:5.2f} ms "
+              f"({page[2]} bytes)")
+
+
+if __name__ == "__main__":
+    main()
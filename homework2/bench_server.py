@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 12400
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def start_server(mode, port, max_connections, extra_args=()):
+    """
+    Start Server.py in a child process and wait until it accepts connections.
+
+    Args:
+        mode: "threaded" or "async".
+        port: The port the server listens on.
+        max_connections: The connection cap passed to the server.
+        extra_args: More Server.py command-line arguments.
+
+    Returns:
+        The server process.
+    """
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Server.py")
+    process = subprocess.Popen([sys.executable, server_path, "--mode", mode, "--port", str(port),
+                                "--backlog", "4096", "--max-connections", str(max_connections), *extra_args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(server_path), preexec_fn=raise_file_limit)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((SERVER_HOST, port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+async def open_idle_connections(port, count):
+    connections = []
+    for _ in range(count):
+        _, writer = await asyncio.open_connection(SERVER_HOST, port)
+        connections.append(writer)
+    return connections
+
+
+async def active_client(port, commands):
+    reader, writer = await asyncio.open_connection(SERVER_HOST, port)
+    writer.write(b"register_Renter")
+    await writer.drain()
+    await reader.read(1024)
+    for _ in range(commands):
+        writer.write(b"start_Engine")
+        await writer.drain()
+        await reader.read(1024)
+    writer.close()
+
+
+async def run_load(port, idle, clients, commands):
+    idle_connections = await open_idle_connections(port, idle)
+    started = time.perf_counter()
+    await asyncio.gather(*(active_client(port, commands) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    for writer in idle_connections:
+        writer.close()
+    return clients * (commands + 1) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare threaded and asyncio server throughput")
+    parser.add_argument("--idle", type=int, default=1000, help="idle connections held open during the run")
+    parser.add_argument("--clients", type=int, default=100, help="concurrently active clients")
+    parser.add_argument("--commands", type=int, default=200, help="commands sent by each active client")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "async"])
+    args = parser.parse_args()
+    raise_file_limit()
+
+    for offset, mode in enumerate(args.modes):
+        port = SERVER_PORT + offset
+        process = start_server(mode, port, args.idle + args.clients + 10)
+        try:
+            throughput = asyncio.run(run_load(port, args.idle, args.clients, args.commands))
+            print(f"{mode:>8}: {throughput:10.0f} commands/s "
+                  f"({args.clients} active clients, {args.idle} idle connections)")
+        except OSError as e:
+            print(f"{mode:>8}: failed with {e}")
+        finally:
+            process.kill()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from SessionManager import SessionManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure session table memory and expiry cost")
+    parser.add_argument("--sessions", type=int, default=1000000)
+    parser.add_argument("--cycles", type=int, default=3, help="open/close cycles, to check memory stays flat")
+    args = parser.parse_args()
+
+    manager = SessionManager(idle_timeout_s=60)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for cycle in range(args.cycles):
+        sessions = [manager.open() for _ in range(args.sessions)]
+        for session in sessions:
+            session.client_type = "renter"
+        held = tracemalloc.get_traced_memory()[0] - baseline
+        del sessions
+
+        started = time.perf_counter()
+        expired = manager.expire_idle(now=time.monotonic() + 120)
+        elapsed = time.perf_counter() - started
+        expired_count = len(expired)
+        del expired
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0] - baseline
+        print(f"cycle {cycle + 1}: {held / args.sessions:6.0f} B per open session, "
+              f"expired {expired_count} in {elapsed:.2f} s, {after} B left after expiry")
+
+
+if __name__ == "__main__":
+    main()
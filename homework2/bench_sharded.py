@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from bench_server import SERVER_HOST, raise_file_limit
+
+
+async def renter(port, rounds, fleet_size):
+    reader, writer = await asyncio.open_connection(SERVER_HOST, port)
+
+    async def request(message):
+        writer.write(message.encode())
+        await writer.drain()
+        return (await reader.read(1024)).decode()
+
+    commands = 1
+    await request("register_Renter")
+    for _ in range(rounds):
+        commands += 1
+        if await request(f"car_Id: {random.randint(1, fleet_size)}") == "Rental started.":
+            for message in ("unlock_Car", "start_Engine", "pay_Rental", "end_Rental"):
+                await request(message)
+            commands += 4
+    writer.close()
+    return commands
+
+
+def drive(port, clients, rounds, fleet_size):
+    async def run():
+        return sum(await asyncio.gather(*(renter(port, rounds, fleet_size) for _ in range(clients))))
+
+    return asyncio.run(run())
+
+
+def start_sharded(workers, port, fleet):
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Server.py")
+    process = subprocess.Popen([sys.executable, server_path, "--mode", "async", "--port", str(port),
+                                "--backlog", "4096", "--workers", str(workers),
+                                "--generated-cars", str(fleet)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(server_path), preexec_fn=raise_file_limit)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((SERVER_HOST, port), timeout=1).close()
+            time.sleep(0.5)  # let every worker bind before measuring
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"sharded server with {workers} workers did not start")
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Sweep the worker count of the sharded server")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, cpus} & set(range(1, cpus + 1))) or [1])
+    parser.add_argument("--drivers", type=int, default=cpus, help="load generator processes")
+    parser.add_argument("--clients", type=int, default=50, help="connections per driver process")
+    parser.add_argument("--rounds", type=int, default=100, help="rental attempts per connection")
+    parser.add_argument("--fleet", type=int, default=100000, help="generated cars the server starts with")
+    parser.add_argument("--port", type=int, default=12420)
+    args = parser.parse_args()
+    raise_file_limit()
+
+    for workers in args.workers:
+        process = start_sharded(workers, args.port, args.fleet)
+        try:
+            started = time.perf_counter()
+            with multiprocessing.Pool(args.drivers) as pool:
+                # ids 1 to 3 are the default fleet and the generated cars follow them
+                fleet_size = 3 + args.fleet
+                commands = sum(pool.starmap(drive, [(args.port, args.clients, args.rounds, fleet_size)] * args.drivers))
+            elapsed = time.perf_counter() - started
+            print(f"{workers:3} workers: {commands / elapsed:10.0f} commands/s")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
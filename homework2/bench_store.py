@@ -0,0 +1,71 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from Car import Car
+from CarRegistry import CarRegistry
+from SqliteCarStore import SqliteCarStore
+
+
+def fleet(size):
+    return (Car("Dacia", "Logan", 2015 + car_id % 10, 50 + car_id % 100, 100 + car_id % 5000, car_id)
+            for car_id in range(1, size + 1))
+
+
+def per_second(count, operation):
+    started = time.perf_counter()
+    for number in range(count):
+        operation(number)
+    return count / (time.perf_counter() - started)
+
+
+def measure(name, build, size, operations):
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = build()
+    build_s = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    lookups = per_second(operations, lambda number: store.get(number * 7919 % size + 1))
+
+    def rental(number):
+        car_id, renter_id = number * 7919 % size + 1, 1000000 + number
+        store.rent(car_id, renter_id)
+        store.update_rented(renter_id, paid=1)
+        store.end_rental(car_id, renter_id)
+
+    rentals = per_second(operations, rental)
+    owners = per_second(operations, lambda number: store.owned_by(100 + number % 5000))
+    started = time.perf_counter()
+    available = len(store.available())
+    listing_s = time.perf_counter() - started
+    print(f"{name:>7} {size:>8}: build {build_s:6.2f} s, {memory / 2 ** 20:7.1f} MiB on the Python heap, "
+          f"{lookups:8.0f} gets/s, {rentals:7.0f} rentals/s, {owners:7.0f} owner queries/s, "
+          f"{available} available listed in {listing_s:.2f} s")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the in-memory registry with the SQLite store")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--operations", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="carsharing-store-")
+    try:
+        for size in args.sizes:
+            measure("memory", lambda: CarRegistry(fleet(size)), size, args.operations)
+            path = os.path.join(directory, f"fleet-{size}.db")
+            store = measure("sqlite", lambda: SqliteCarStore(path, fleet(size)), size, args.operations)
+            store.close()
+            print(f"{'':>17} database file {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import heapq
+import random
+import time
+
+from TimingWheel import TimingWheel
+
+
+def bench_wheel(delays, cancel_every):
+    wheel = TimingWheel(tick_s=1.0, now=0.0)
+    started = time.perf_counter()
+    timers = [wheel.schedule(delay, index, now=0.0) for index, delay in enumerate(delays)]
+    scheduled = time.perf_counter() - started
+    for timer in timers[::cancel_every]:
+        timer.cancel()
+    started = time.perf_counter()
+    expired = 0
+    for second in range(1, int(max(delays)) + 2):
+        expired += len(wheel.advance(float(second)))
+    return scheduled, time.perf_counter() - started, expired
+
+
+def bench_heap(delays, cancel_every):
+    heap = []
+    cancelled = set()
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        heapq.heappush(heap, (delay, index))
+    scheduled = time.perf_counter() - started
+    cancelled.update(range(0, len(delays), cancel_every))
+    started = time.perf_counter()
+    expired = 0
+    for second in range(1, int(max(delays)) + 2):
+        while heap and heap[0][0] <= second:
+            if heapq.heappop(heap)[1] not in cancelled:
+                expired += 1
+    return scheduled, time.perf_counter() - started, expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule and expire many timers in the timing wheel and a heap")
+    parser.add_argument("--timers", type=int, default=1000000)
+    parser.add_argument("--horizon", type=float, default=86400, help="timers are due within this many seconds")
+    parser.add_argument("--cancel-every", type=int, default=4, help="cancel every n-th timer")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    delays = [rng.uniform(0, args.horizon) for _ in range(args.timers)]
+    for name, bench in (("timing wheel", bench_wheel), ("heap", bench_heap)):
+        scheduled, expired_s, expired = bench(delays, args.cancel_every)
+        print(f"{name}: schedule {args.timers / scheduled / 1e6:.2f} M/s, "
+              f"expire {expired} in {expired_s:.2f} s over {int(args.horizon)} ticks "
+              f"({expired_s / max(expired, 1) * 1e9:.0f} ns per timer)")
+
+
+if __name__ == "__main__":
+    main()
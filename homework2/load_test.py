@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+
+from bench_server import SERVER_HOST, raise_file_limit, start_server
+from Codec import CarListing
+from Protocol import BINARY_CODEC, HANDSHAKES, TEXT_CODEC, FrameDecoder, ProtocolParams, encode_frame
+
+CAR_ID = re.compile(r"'id': (\d+)")
+PERCENTILES = (("p50", 0.50), ("p99", 0.99), ("p999", 0.999))
+
+
+class LoadConnection:
+    """One simulated client: a framed connection that sends commands one at a time and times them."""
+
+    def __init__(self, codec, stats, timeout_s):
+        """
+        Initialize LoadConnection.
+
+        Args:
+            codec: TEXT_CODEC or BINARY_CODEC, the payload encoding to negotiate.
+            stats: The LoadStats the latencies are recorded in.
+            timeout_s: How long to wait for one reply.
+        """
+        self.codec = codec
+        self.stats = stats
+        self.timeout_s = timeout_s
+        self.reader = None
+        self.writer = None
+        self.decoder = FrameDecoder()
+        self.next_request_id = 1
+
+    async def open(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        handshake, ack = next((handshake, ack) for handshake, (ack, codec) in HANDSHAKES.items()
+                              if codec is self.codec)
+        self.writer.write(handshake)
+        await asyncio.wait_for(self.reader.readexactly(len(ack)), self.timeout_s)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    async def request(self, message):
+        """
+        Send one command, wait for its reply and record the latency under the command name.
+
+        Returns:
+            The reply text, or None if the command failed.
+        """
+        command, args = TEXT_CODEC.parse(message)
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        started = time.perf_counter()
+        try:
+            self.writer.write(encode_frame(request_id, self.codec.encode_command(command, args)))
+            payloads = await asyncio.wait_for(self._receive(request_id), self.timeout_s)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            self.stats.error(command, type(e).__name__)
+            return None
+        self.stats.record(command, time.perf_counter() - started)
+        reply = self.codec.decode_reply(payloads[0])
+        for payload in payloads[1:]:
+            chunk = self.codec.decode_reply(payload)
+            if isinstance(reply, str):
+                reply += chunk
+            else:
+                reply.extend(chunk)
+        return str(reply) if isinstance(reply, CarListing) else reply
+
+    async def _receive(self, request_id):
+        payloads = []
+        while True:
+            data = await self.reader.read(ProtocolParams.CHUNK_SIZE_BYTES)
+            if not data:
+                raise asyncio.IncompleteReadError(b"", None)
+            for reply_id, flags, payload in self.decoder.feed(data):
+                if reply_id == request_id:
+                    payloads.append(payload)
+                    if not flags & ProtocolParams.FLAG_MORE:
+                        return payloads
+
+
+class LoadStats:
+    """Latency samples and error counts per command."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.unexpected = {}
+
+    def record(self, command, elapsed_s):
+        self.latencies.setdefault(command, []).append(elapsed_s)
+
+    def error(self, command, kind):
+        key = f"{command}: {kind}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def unexpected_reply(self, command, reply):
+        key = f"{command}: {reply[:60]!r}"
+        self.unexpected[key] = self.unexpected.get(key, 0) + 1
+
+    def summary(self, elapsed_s):
+        """
+        Summarize the run.
+
+        Args:
+            elapsed_s: Wall-clock duration of the run.
+
+        Returns:
+            A JSON-serializable dict with overall and per-command throughput and latency percentiles.
+        """
+        commands = {}
+        for command, samples in sorted(self.latencies.items()):
+            samples.sort()
+            entry = {"count": len(samples), "per_s": len(samples) / elapsed_s,
+                     "mean_ms": sum(samples) / len(samples) * 1000, "max_ms": samples[-1] * 1000}
+            for name, fraction in PERCENTILES:
+                entry[f"{name}_ms"] = samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+            commands[command] = entry
+        total = sum(entry["count"] for entry in commands.values())
+        return {"elapsed_s": elapsed_s, "commands": total, "commands_per_s": total / elapsed_s,
+                "per_command": commands, "errors": self.errors, "unexpected_replies": self.unexpected}
+
+
+async def renter_flow(connection, stats, rng, rentals, page_size, fleet):
+    """Register as a renter, then repeatedly list cars, rent one, pay and return it."""
+    if await connection.request("register_Renter") is None:
+        return
+    for _ in range(rentals):
+        listing = await connection.request(f"post_Car: limit={page_size}; after={rng.randrange(fleet)}")
+        if listing is None:
+            return
+        if not CAR_ID.search(listing):
+            listing = await connection.request(f"post_Car: limit={page_size}")
+        car_ids = CAR_ID.findall(listing or "")
+        if not car_ids:
+            stats.unexpected_reply("post_Car", listing or "")
+            continue
+        reply = await connection.request(f"car_Id: {rng.choice(car_ids)}")
+        if reply != "Rental started.":
+            if reply is not None:
+                stats.unexpected_reply("car_Id", reply)  # lost the race for the car
+            continue
+        for message, expected in (("unlock_Car", "Car unlocked."), ("pay_Rental", "Rental paid."),
+                                  ("end_Rental", "Rental ended.")):
+            reply = await connection.request(message)
+            if reply is None:
+                return
+            if reply != expected:
+                stats.unexpected_reply(message, reply)
+
+
+async def owner_flow(connection, stats, rng, changes, page_size):
+    """Log in as an owner, then repeatedly change the price of an owned car and look at the listing."""
+    owner_id = rng.randrange(1000, 2000)
+    listing = await connection.request(f"owner_Id: {owner_id}")
+    if listing is None:
+        return
+    car_ids = CAR_ID.findall(listing)
+    if not car_ids:
+        stats.unexpected_reply("owner_Id", listing)
+        return
+    for _ in range(changes):
+        reply = await connection.request(f"{owner_id}: {rng.choice(car_ids)}: {rng.randrange(40, 240)}")
+        if reply is None:
+            return
+        if reply != "Price changed.":
+            stats.unexpected_reply("set_Price", reply)
+        if await connection.request(f"post_Car: limit={page_size}") is None:
+            return
+
+
+async def simulated_client(number, args, codec, stats, start_gate):
+    rng = random.Random(args.seed * 1000003 + number)
+    connection = LoadConnection(codec, stats, args.timeout)
+    try:
+        await connection.open(args.host, args.port)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+        stats.error("connect", type(e).__name__)
+        return
+    try:
+        await start_gate.wait()
+        if rng.random() < args.owner_share:
+            await owner_flow(connection, stats, rng, args.iterations, args.page_size)
+        else:
+            await renter_flow(connection, stats, rng, args.iterations, args.page_size, args.fleet)
+    finally:
+        connection.close()
+
+
+async def run(args, codec):
+    stats = LoadStats()
+    start_gate = asyncio.Event()
+    clients = []
+    # connect in waves so the listen backlog is not overrun
+    for first in range(0, args.clients, args.connect_batch):
+        batch = [asyncio.create_task(simulated_client(number, args, codec, stats, start_gate))
+                 for number in range(first, min(first + args.connect_batch, args.clients))]
+        clients.extend(batch)
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    start_gate.set()
+    await asyncio.gather(*clients)
+    return stats.summary(time.perf_counter() - started)
+
+
+def print_summary(summary, baseline=None):
+    print(f"{summary['commands']} commands in {summary['elapsed_s']:.2f} s: {summary['commands_per_s']:.0f} commands/s")
+    print(f"{'command':>12} {'count':>8} {'per s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'max ms':>8}")
+    for command, entry in summary["per_command"].items():
+        line = (f"{command:>12} {entry['count']:>8} {entry['per_s']:>9.0f} {entry['p50_ms']:>8.2f} "
+                f"{entry['p99_ms']:>8.2f} {entry['p999_ms']:>8.2f} {entry['max_ms']:>8.2f}")
+        previous = (baseline or {}).get("per_command", {}).get(command)
+        if previous is not None:
+            line += f"   p99 {entry['p99_ms'] / previous['p99_ms'] - 1:+.0%} vs baseline"
+        print(line)
+    for title, counts in (("errors", summary["errors"]), ("unexpected replies", summary["unexpected_replies"])):
+        for key, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"{title}: {count} x {key}")
+
+
+def regressions(summary, baseline, tolerance):
+    """
+    Compare a run with a baseline run.
+
+    Returns:
+        A description of every command whose p99 latency grew by more than `tolerance`,
+        and of a throughput drop of more than `tolerance`.
+    """
+    found = []
+    if summary["commands_per_s"] < baseline["commands_per_s"] * (1 - tolerance):
+        found.append(f"throughput {summary['commands_per_s']:.0f}/s vs {baseline['commands_per_s']:.0f}/s")
+    for command, entry in summary["per_command"].items():
+        previous = baseline["per_command"].get(command)
+        if previous is not None and entry["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            found.append(f"{command} p99 {entry['p99_ms']:.2f} ms vs {previous['p99_ms']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the carsharing server with simulated renters and owners")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--clients", type=int, default=1000, help="concurrent simulated clients")
+    parser.add_argument("--iterations", type=int, default=5, help="rentals (renters) or price changes (owners) each")
+    parser.add_argument("--owner-share", type=float, default=0.1, help="fraction of clients that are owners")
+    parser.add_argument("--page-size", type=int, default=20, help="cars per post_Car page")
+    parser.add_argument("--codec", choices=["text", "binary"], default="binary")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for one reply")
+    parser.add_argument("--connect-batch", type=int, default=200, help="connections opened at a time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--spawn", choices=["threaded", "async"],
+                        help="start a server in this mode on --port for the run, with --fleet generated cars")
+    parser.add_argument("--fleet", type=int, default=10000,
+                        help="cars the server has; renters start their listings at a random car id below it")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p99 latency growth and throughput drop against the baseline")
+    args = parser.parse_args()
+    raise_file_limit()
+
+    codec = BINARY_CODEC if args.codec == "binary" else TEXT_CODEC
+    process = None
+    if args.spawn:
+        process = start_server(args.spawn, args.port, args.clients + 100,
+                               ["--generated-cars", str(args.fleet), "--idle-timeout", "3600"])
+    try:
+        summary = asyncio.run(run(args, codec))
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    print_summary(summary, baseline)
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump({"config": vars(args), "results": summary}, results_file, indent=2)
+    if baseline is not None:
+        found = regressions(summary, baseline, args.tolerance)
+        for regression in found:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
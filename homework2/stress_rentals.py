@@ -0,0 +1,80 @@
+import argparse
+import random
+import sys
+import threading
+
+from Car import Car
+from Server import Server
+
+
+def check_registry(registry):
+    """Return a list of inconsistencies between the Car objects and the registry indexes."""
+    problems = []
+    for car in registry:
+        if (car.availability == 1) != (car.id in registry.available_cars):
+            problems.append(f"car {car.id}: availability {car.availability} disagrees with the available set")
+        if car.availability == 1 and car.user_id is not None:
+            problems.append(f"car {car.id}: available but rented by {car.user_id}")
+        if car.user_id is not None and car not in registry.rented_by(car.user_id):
+            problems.append(f"car {car.id}: missing from the index of renter {car.user_id}")
+    for renter_id, cars in registry.cars_by_renter.items():
+        for car in cars.values():
+            if car.user_id != renter_id:
+                problems.append(f"car {car.id}: indexed under renter {renter_id} but rented by {car.user_id}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer rentals from many threads and check no car is rented twice")
+    parser.add_argument("--threads", type=int, default=500)
+    parser.add_argument("--cars", type=int, default=50, help="a small fleet maximises contention")
+    parser.add_argument("--rounds", type=int, default=200, help="rental attempts per thread")
+    args = parser.parse_args()
+    sys.setswitchinterval(1e-6)
+
+    server = Server('127.0.0.1', 0)
+    for car_id in range(4, args.cars + 1):
+        server.cars.add(Car("Dacia", "Logan", 2020, 50, 100, car_id))
+    holders = {}
+    holders_lock = threading.Lock()
+    violations = []
+    rentals = [0]
+    start = threading.Barrier(args.threads)
+
+    def renter():
+        client_id = server.register_client()
+        dispatch = server.router.dispatch
+        dispatch(client_id, server.client_type(client_id), "register_Renter", ())
+        start.wait()
+        for _ in range(args.rounds):
+            dispatch(client_id, "renter", "request_Car", ())
+            car_id = random.randint(1, args.cars)
+            if dispatch(client_id, "renter", "car_Id", (car_id,)) != "Rental started.":
+                continue
+            with holders_lock:
+                if car_id in holders:
+                    violations.append(f"car {car_id} rented by {client_id} while held by {holders[car_id]}")
+                holders[car_id] = client_id
+                rentals[0] += 1
+            dispatch(client_id, "renter", "pay_Rental", ())
+            with holders_lock:
+                del holders[car_id]
+            reply = dispatch(client_id, "renter", "end_Rental", ())
+            if reply != "Rental ended.":
+                violations.append(f"client {client_id} could not end the rental of car {car_id}: {reply}")
+
+    threads = [threading.Thread(target=renter) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    problems = violations + check_registry(server.cars)
+    print(f"{args.threads} threads, {rentals[0]} rentals of {args.cars} cars, {len(problems)} problems")
+    for problem in problems[:20]:
+        print(f"  {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import pytest
+
+from Car import Car
+from CarRegistry import CarRegistry
+from EventHub import EventFilter, EventHub
+from LocationProvider import CachedLocationProvider, StaticLocationProvider
+
+
+@pytest.fixture(autouse=True)
+def provider():
+    """A stub location provider, so publishing an event makes no network lookups."""
+    previous = Car.location_provider
+    Car.location_provider = CachedLocationProvider(StaticLocationProvider())
+    yield
+    Car.location_provider = previous
+
+
+@pytest.fixture
+def hub():
+    registry = CarRegistry([Car("Audi", "A4", 2018, 50, 11, 1), Car("Dacia", "Logan", 2015, 20, 12, 2)])
+    hub = EventHub()
+    hub.attach(registry)
+    events = hub.open_client(1)
+    subscription_id = hub.subscribe(1, EventFilter())
+    return registry, events, subscription_id
+
+
+def test_a_reprice_does_not_hide_a_rental(hub):
+    registry, events, subscription_id = hub
+    assert registry.rent(1, 7)
+    assert registry.set_price(11, 1, 60)
+
+    sent, overflowed = events.drain()[subscription_id]
+
+    assert not overflowed
+    assert [(kind, record["id"]) for kind, record in sent] == [("rented", 1), ("price", 1)]
+    assert sent[1][1]["price"] == 60
+
+
+def test_events_of_a_group_are_coalesced_to_the_latest(hub):
+    registry, events, subscription_id = hub
+    assert registry.set_price(11, 1, 60)
+    assert registry.rent(1, 7)
+    assert registry.set_price(11, 1, 70)
+    assert registry.cancel_rental(1, 7)
+
+    sent, _ = events.drain()[subscription_id]
+
+    assert [(kind, record["id"]) for kind, record in sent] == [("price", 1), ("available", 1)]
+    assert sent[0][1]["price"] == 70
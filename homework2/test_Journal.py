@@ -0,0 +1,33 @@
+import os
+
+from CarRegistry import CarRegistry
+from Journal import Journal, JournalParams
+from Server import Server
+
+
+def open_journal(directory):
+    journal = Journal(directory)
+    cars = journal.recover() or Server.default_fleet()
+    registry = CarRegistry(cars)
+    journal.attach(registry)
+    return journal, registry
+
+
+def test_recovery_survives_a_torn_first_entry(tmp_path):
+    directory = str(tmp_path)
+    journal, registry = open_journal(directory)
+    journal.snapshot()
+    journal.close()
+    # a crash in the middle of writing the first entry of the new segment
+    segment = os.path.join(directory, f"{JournalParams.SEGMENT_PREFIX}{1:012d}")
+    with open(segment, "a") as torn:
+        torn.write('[1, "rent", [[1, "Audi"')
+
+    journal, registry = open_journal(directory)
+    assert registry.rent(2, 7)
+    journal.close()
+
+    journal = Journal(directory)
+    cars = {car.id: car for car in journal.recover()}
+    assert cars[1].availability == 1
+    assert cars[2].availability == 0 and cars[2].user_id == 7
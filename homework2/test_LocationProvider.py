@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from Car import Car
+from LocationProvider import CachedLocationProvider, StaticLocationProvider
+from Server import Server
+
+
+@pytest.fixture
+def provider():
+    """A stub provider behind a fresh cache, installed as the provider of every Car for the test."""
+    stub = StaticLocationProvider({1: "45.0,21.0", 2: "46.0,22.0"})
+    cache = CachedLocationProvider(stub, ttl_s=60)
+    previous = Car.location_provider
+    Car.location_provider = cache
+    yield stub, cache
+    Car.location_provider = previous
+
+
+def test_listing_makes_no_provider_calls(provider):
+    stub, cache = provider
+    server = Server('127.0.0.1', 0)
+    try:
+        cache.refresh(car.id for car in server.cars)
+        client_id = server.register_client()
+        server.register_renter(client_id)
+        calls = stub.lookup_calls
+
+        listing = server.process_message(client_id, "post_Car")
+
+        assert stub.lookup_calls == calls
+        assert "45.0,21.0" in listing
+    finally:
+        server.stop()
+
+
+def test_expired_entries_are_refreshed_in_one_batch(provider):
+    stub, cache = provider
+    stale = time.monotonic() - 2 * cache.ttl_s
+    for car_id in (1, 2, 3):
+        cache.locations[car_id] = ("0,0", stale)
+
+    # stale entries are still served, and queued instead of looked up
+    assert [cache.get(car_id) for car_id in (1, 2, 3)] == ["0,0", "0,0", "0,0"]
+    assert stub.lookup_calls == 0
+    assert cache.pending == {1, 2, 3}
+
+    assert cache.refresh() == 3
+    assert stub.lookup_calls == 1
+    assert cache.pending == set()
+    assert [cache.get(car_id) for car_id in (1, 2, 3)] == ["45.0,21.0", "46.0,22.0", stub.default]
+    assert cache.pending == set()
+
+
+def test_refresh_async_fills_the_cache(provider):
+    stub, cache = provider
+
+    refreshed = asyncio.run(cache.refresh_async([1, 2]))
+
+    assert refreshed == 2
+    assert stub.lookup_calls == 1
+    assert cache.peek(1) == "45.0,21.0"
+    assert cache.peek(2) == "46.0,22.0"
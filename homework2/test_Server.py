@@ -0,0 +1,64 @@
+from Server import Server
+
+
+def start_renter(server):
+    client_id = server.register_client()
+    server.process_message(client_id, "register_Renter")
+    return client_id
+
+
+def test_restart_does_not_hand_rentals_to_new_clients(tmp_path):
+    server = Server('127.0.0.1', 0, data_dir=str(tmp_path))
+    renter = start_renter(server)
+    assert server.process_message(renter, "car_Id: 1") == "Rental started."
+    server.stop()
+
+    server = Server('127.0.0.1', 0, data_dir=str(tmp_path))
+    try:
+        # the first client after the restart gets the id the old renter had
+        stranger = start_renter(server)
+        assert stranger == renter
+        assert server.process_message(stranger, "pay_Rental") == "Rental paid."
+        assert server.process_message(stranger, "end_Rental") == "You have to pay the rental first."
+        car = server.cars.get(1)
+        assert car.availability == 1 and car.user_id is None and car.paid == 0
+        assert server.cars.rented_by(stranger) == []
+    finally:
+        server.stop()
+
+    # the release was journaled like any other transition
+    server = Server('127.0.0.1', 0, data_dir=str(tmp_path))
+    try:
+        assert server.cars.get(1).availability == 1
+    finally:
+        server.stop()
+
+
+def test_a_renter_cannot_end_another_renters_rental():
+    server = Server('127.0.0.1', 0)
+    try:
+        renter, other = start_renter(server), start_renter(server)
+        assert server.process_message(renter, "car_Id: 2") == "Rental started."
+        assert server.process_message(other, "pay_Rental") == "Rental paid."
+        assert server.process_message(other, "end_Rental") == "You have to pay the rental first."
+        assert server.cars.get(2).user_id == renter
+    finally:
+        server.stop()
+
+
+def test_rentals_left_in_a_database_are_released_on_restart(tmp_path):
+    db_path = str(tmp_path / "cars.db")
+    server = Server('127.0.0.1', 0, db_path=db_path)
+    renter = start_renter(server)
+    assert server.process_message(renter, "car_Id: 3") == "Rental started."
+    server.stop()
+
+    server = Server('127.0.0.1', 0, db_path=db_path)
+    try:
+        # no expiry deadline survived the restart, so nothing would ever release the car
+        assert server.cars.rented() == []
+        stranger = start_renter(server)
+        assert server.cars.rented_by(stranger) == []
+        assert server.cars.get(3).availability == 1
+    finally:
+        server.stop()
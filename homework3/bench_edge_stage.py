@@ -0,0 +1,73 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from bench_lane_detection import read_frames, synthetic_frames
+from lane_detector import LaneDetector, LaneDetectorParams
+
+
+SOBEL_VERTICAL = np.float32([[-1, -2, -1],
+                             [0, 0, 0],
+                             [1, 2, 1]])
+SOBEL_HORIZONTAL = np.transpose(SOBEL_VERTICAL)
+
+
+def filter2d_edges(blur):
+    """The edge stage before find_edges: two generic filters in float32, the root, rounding to 8 bits, threshold."""
+    sobel_vertical = cv2.filter2D(np.float32(blur), -1, SOBEL_VERTICAL)
+    sobel_horizontal = cv2.filter2D(np.float32(blur), -1, SOBEL_HORIZONTAL)
+    sobel = np.sqrt(sobel_vertical * sobel_vertical + sobel_horizontal * sobel_horizontal)
+    sobel = cv2.convertScaleAbs(sobel)
+    _, threshold = cv2.threshold(sobel, LaneDetectorParams.THRESHOLD, 255, cv2.THRESH_BINARY)
+    return threshold
+
+
+def measure(edges, blurs, rounds):
+    """Microseconds per image of an edge stage, best of `rounds` passes over the images."""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for blur in blurs:
+            edges(blur)
+        best = min(best, time.perf_counter() - started)
+    return best / len(blurs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time of the Sobel edge stage with filter2D and with "
+                                                 "LaneDetector.find_edges")
+    parser.add_argument("--video", help="read frames from this video instead of generating them")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1920, help="width of generated frames")
+    parser.add_argument("--height", type=int, default=1080, help="height of generated frames")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.video:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    detector = LaneDetector()
+    blurs = []
+    for frame in frames:
+        stages = {}
+        detector.find_lanes(frame, stages)
+        blurs.append(stages['6.Blur'])
+    print(f"{len(blurs)} blurred top-down views of {blurs[0].shape[1]}x{blurs[0].shape[0]}, best of {args.rounds}")
+
+    reusing = LaneDetector(reuse_buffers=True)
+    reusing.find_lanes(frames[0])
+    before = measure(filter2d_edges, blurs, args.rounds)
+    print(f"filter2D:                {before:7.1f} us")
+    for name, edge_detector in (("find_edges", detector), ("find_edges, buffers", reusing)):
+        after = measure(edge_detector.find_edges, blurs, args.rounds)
+        print(f"{name + ':':24} {after:7.1f} us ({before / after:.2f}x)")
+
+    differing = sum(np.count_nonzero(filter2d_edges(blur) != detector.find_edges(blur)[1]) for blur in blurs)
+    print(f"edge pixels that differ: {differing} of {sum(blur.size for blur in blurs)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from bench_lane_detection import read_frames, synthetic_frames
+from lane_detector import LaneDetector
+
+
+def allocations(detector, frames):
+    """
+    Trace the memory a detector allocates per frame, after a first frame has set it up.
+
+    Returns:
+        The mean and the largest peak of traced memory above what was held before the frame, in bytes,
+        and the number of garbage collections run meanwhile.
+    """
+    detector.process(frames[0])
+    collections = [0]
+
+    def count(phase, _):
+        if phase == "start":
+            collections[0] += 1
+
+    gc.callbacks.append(count)
+    tracemalloc.start()
+    peaks = []
+    try:
+        for frame in frames:
+            held, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            detector.process(frame)
+            peaks.append(tracemalloc.get_traced_memory()[1] - held)
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(count)
+    return sum(peaks) / len(peaks), max(peaks), collections[0]
+
+
+def fps(detector, frames, rounds):
+    detector.process(frames[0])
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            detector.process(frame)
+    return rounds * len(frames) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory allocated per frame by LaneDetector with and without "
+                                                 "reused buffers")
+    parser.add_argument("--video", help="read frames from this video instead of generating them")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1920, help="width of generated frames")
+    parser.add_argument("--height", type=int, default=1080, help="height of generated frames")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.video:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, {args.rounds} rounds")
+
+    for name, reuse_buffers in (("new arrays", False), ("reused buffers", True)):
+        mean, largest, collections = allocations(LaneDetector(reuse_buffers=reuse_buffers), frames)
+        speed = fps(LaneDetector(reuse_buffers=reuse_buffers), frames, args.rounds)
+        print(f"{name:>14}: {mean / 1024:8.1f} KiB per frame on average, {largest / 1024:8.1f} KiB at most, "
+              f"{collections} collections, {speed:.0f} fps")
+
+    plain, reusing = LaneDetector(), LaneDetector(reuse_buffers=True)
+    # the reused final frame is overwritten by the next one, so each pair is compared right away
+    same = all(np.array_equal(plain.process(frame), reusing.process(frame)) for frame in frames)
+    print(f"outputs identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from lane_detector import LaneDetector
+
+
+def synthetic_frames(count, width=1920, height=1080, seed=1):
+    """
+    Make road frames with two lane markings that drift a little from frame to frame.
+
+    Args:
+        count: Number of frames.
+        width: Frame width.
+        height: Frame height.
+        seed: Seed of the noise added to the road.
+
+    Returns:
+        A list of BGR frames.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for index in range(count):
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        frame[:height // 2] = (200, 160, 120)
+        drift = int(40 * np.sin(index / 15))
+        # the markings end on the top edge of the road trapezoid and come out slanted in the top-down view,
+        # as on a real road: a vertical line cannot be fitted as y = b + a * x
+        for bottom_x, top_x in ((int(width * 0.15), int(width * 0.488)), (int(width * 0.85), int(width * 0.512))):
+            cv2.line(frame, (bottom_x + drift, height), (top_x, int(height * 0.75)), (255, 255, 255),
+                     max(2, width // 150))
+        noise = rng.integers(0, 20, size=(height, width, 1), dtype=np.uint8)
+        frames.append(cv2.add(frame, np.repeat(noise, 3, axis=2)))
+    return frames
+
+
+def read_frames(path, count):
+    cam = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cam.read()
+        if ret is False:
+            break
+        frames.append(frame)
+    cam.release()
+    return frames
+
+
+class LegacyLaneDetection:
+    """The per-frame loop of main_lane_detection.py before LaneDetector, without the windows."""
+
+    def __init__(self):
+        self.left_top_point = self.left_bottom_point = (0, 0)
+        self.right_top_point = self.right_bottom_point = (0, 0)
+        self.left_top_x = self.left_bottom_x = self.right_top_x = self.right_bottom_x = 0
+
+    def process(self, frame):
+        height = int(frame.shape[0] / 4)
+        width = int(frame.shape[1] / 4)
+        frame = cv2.resize(frame, (width, height))
+        grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        upper_left = (int(width * 0.46), int(height * 0.75))
+        upper_right = (int(width * 0.54), int(height * 0.75))
+        lower_left = (width * 0, height * 1)
+        lower_right = (width * 1, height * 1)
+        points_of_the_trapezoid = np.array([upper_right, upper_left, lower_left, lower_right], dtype=np.int32)
+        trapezoid = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillConvexPoly(trapezoid, points_of_the_trapezoid, 1)
+        road = trapezoid * grayscale
+
+        points_for_stretch = np.float32(
+            np.array([(width * 1, height * 0), (width * 0, height * 0), lower_left, lower_right], dtype=np.int32))
+        points_of_the_trapezoid = np.float32(points_of_the_trapezoid)
+        magic_matrix = cv2.getPerspectiveTransform(points_of_the_trapezoid, points_for_stretch)
+        top_down = cv2.warpPerspective(road, magic_matrix, (width, height))
+        blur = cv2.blur(top_down, ksize=(7, 7))
+
+        sobel_vertical = np.float32([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
+        sobel_horizontal = np.transpose(sobel_vertical)
+        sobel_vertical = cv2.filter2D(np.float32(blur), -1, sobel_vertical)
+        sobel_horizontal = cv2.filter2D(np.float32(blur), -1, sobel_horizontal)
+        sobel = np.sqrt(sobel_vertical * sobel_vertical + sobel_horizontal * sobel_horizontal)
+        sobel = cv2.convertScaleAbs(sobel)
+        _, threshold = cv2.threshold(sobel, int(255 / 5), 255, cv2.THRESH_BINARY)
+
+        frame_copy = threshold.copy()
+        nr_of_col = int(0.05 * frame_copy.shape[1])
+        frame_copy[:, :nr_of_col] = 0
+        frame_copy[:, -nr_of_col:] = 0
+        indexes = np.argwhere(frame_copy > 1)
+        midpoint = int(frame_copy.shape[1] / 2)
+        left_indexes = indexes[indexes[:, 1] < midpoint]
+        right_indexes = indexes[indexes[:, 1] >= midpoint]
+        left_line = np.polynomial.polynomial.polyfit(left_indexes[:, 1], left_indexes[:, 0], deg=1)
+        right_line = np.polynomial.polynomial.polyfit(right_indexes[:, 1] - midpoint, right_indexes[:, 0], deg=1)
+
+        b, a = left_line
+        if a != 0 and -1e8 <= (height - b) / a <= 1e8:
+            self.left_top_x = (height - b) / a
+        if a != 0 and -1e8 <= -b / a <= 1e8:
+            self.left_bottom_x = -b / a
+        d, c = right_line
+        if c != 0 and -1e8 <= (height - d) / c <= 1e8:
+            self.right_top_x = (height - d) / c + int(width / 2)
+        if c != 0 and -1e8 <= -d / c <= 1e8:
+            self.right_bottom_x = -d / c + int(width / 2)
+        if int(width / 2) >= self.left_top_x >= 0 and int(width / 2) >= self.left_bottom_x >= 0:
+            self.left_top_point = int(self.left_top_x), height
+            self.left_bottom_point = int(self.left_bottom_x), 0
+        if width >= self.right_top_x >= int(width / 2) and width >= self.right_bottom_x >= int(width / 2):
+            self.right_top_point = int(self.right_top_x), height
+            self.right_bottom_point = int(self.right_bottom_x), 0
+
+        lines = cv2.line(frame_copy, self.left_bottom_point, self.left_top_point, (200, 0, 0), 5)
+        cv2.line(lines, self.right_bottom_point, self.right_top_point, (100, 0, 0), 5)
+
+        blank = np.zeros((height, width), dtype=np.uint8)
+        cv2.line(blank, self.left_top_point, self.left_bottom_point, (255, 0, 0), 3)
+        magic_matrix = cv2.getPerspectiveTransform(points_for_stretch, points_of_the_trapezoid)
+        final_left = cv2.warpPerspective(blank, magic_matrix, (width, height))
+        blank = np.zeros((height, width), dtype=np.uint8)
+        cv2.line(blank, self.right_top_point, self.right_bottom_point, (255, 0, 0), 3)
+        magic_matrix = cv2.getPerspectiveTransform(points_for_stretch, points_of_the_trapezoid)
+        final_right = cv2.warpPerspective(blank, magic_matrix, (width, height))
+
+        final = frame.copy()
+        final[final_left > 0] = (50, 50, 250)
+        final[final_right > 0] = (50, 250, 50)
+        return final
+
+
+def measure(detector, frames, rounds):
+    """Run every frame through a detector `rounds` times; returns frames per second and the last outputs."""
+    outputs = [detector.process(frame) for frame in frames]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            detector.process(frame)
+    return rounds * len(frames) / (time.perf_counter() - started), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames per second of the lane detection loop before and "
+                                                 "after LaneDetector")
+    parser.add_argument("--video", help="read frames from this video instead of generating them")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1920, help="width of generated frames")
+    parser.add_argument("--height", type=int, default=1080, help="height of generated frames")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.video:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height}, {args.rounds} rounds")
+
+    legacy_fps, legacy_outputs = measure(LegacyLaneDetection(), frames, args.rounds)
+    print(f"per-frame setup: {legacy_fps:.0f} fps")
+    fps, outputs = measure(LaneDetector(), frames, args.rounds)
+    print(f"LaneDetector:    {fps:.0f} fps ({fps / legacy_fps:.2f}x)")
+    same = all(np.array_equal(old, new) for old, new in zip(legacy_outputs, outputs))
+    print(f"outputs identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
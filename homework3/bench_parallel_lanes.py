@@ -0,0 +1,47 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from bench_lane_detection import read_frames, synthetic_frames
+from lane_detector import LaneDetector
+from parallel_lanes import detect_lanes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames per second of pipelined lane detection by worker count")
+    parser.add_argument("--video", help="read frames from this video instead of generating them")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920, help="width of generated frames")
+    parser.add_argument("--height", type=int, default=1080, help="height of generated frames")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="worker counts to try; default 1, 2, 4, ... up to the usable cores")
+    args = parser.parse_args()
+
+    if args.video:
+        frames = read_frames(args.video, args.frames)
+    else:
+        # a few distinct frames repeated, so generating them does not dominate the run
+        distinct = synthetic_frames(min(args.frames, 60), args.width, args.height)
+        frames = [distinct[index % len(distinct)] for index in range(args.frames)]
+    cores = len(os.sched_getaffinity(0))
+    worker_counts = args.workers or sorted({min(2 ** power, cores) for power in range(cores.bit_length() + 1)})
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, {cores} usable cores")
+
+    detector = LaneDetector()
+    started = time.perf_counter()
+    expected = [detector.process(frame) for frame in frames]
+    sequential_fps = len(frames) / (time.perf_counter() - started)
+    print(f"sequential:  {sequential_fps:.0f} fps")
+
+    for workers in worker_counts:
+        started = time.perf_counter()
+        outputs = [result.frame for result in detect_lanes(iter(frames), workers)]
+        fps = len(frames) / (time.perf_counter() - started)
+        same = len(outputs) == len(expected) and all(np.array_equal(a, b) for a, b in zip(outputs, expected))
+        print(f"{workers:2d} workers: {fps:.0f} fps ({fps / sequential_fps:.2f}x), same output in order: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from typing import *
+
+import cv2
+import numpy as np
+
+from lane_detector import LaneDetector, LaneResult
+from parallel_lanes import detect_lanes, read_video
+
+
+class LaneCliParams:
+    """A class containing parameters for the batch lane detection CLI."""
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+    """Files of a frame directory that are read as frames, in name order."""
+    DEFAULT_FPS = 30.0
+    """Frame rate of the annotated video of a frame directory, or of a video that does not report one."""
+    VIDEO_CODEC = "mp4v"
+    """FourCC of the annotated videos."""
+    CSV_COLUMNS = ["frame", "left_found", "left_b", "left_a", "left_top_x", "left_bottom_x",
+                   "right_found", "right_b", "right_a", "right_top_x", "right_bottom_x"]
+    """Columns of the lane CSV; b and a are the line y = b + a * x in the top-down view."""
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """
+    Expand glob patterns into the videos and frame directories they match, in order and without repeats.
+
+    Raises:
+        FileNotFoundError: If a pattern matches nothing.
+    """
+    inputs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        matches = [match for match in matches if os.path.exists(match)]
+        if not matches:
+            raise FileNotFoundError(f"No input matches {pattern}")
+        inputs.extend(match for match in matches if match not in inputs)
+    return inputs
+
+
+def read_frame_directory(path: str) -> Iterator[np.ndarray]:
+    """Yield the images of a directory in name order."""
+    names = sorted(name for name in os.listdir(path) if name.lower().endswith(LaneCliParams.IMAGE_EXTENSIONS))
+    for name in names:
+        frame = cv2.imread(os.path.join(path, name))
+        if frame is not None:
+            yield frame
+
+
+def source_fps(path: str) -> float:
+    if os.path.isdir(path):
+        return LaneCliParams.DEFAULT_FPS
+    cam = cv2.VideoCapture(path)
+    fps = cam.get(cv2.CAP_PROP_FPS)
+    cam.release()
+    return fps if fps and fps > 0 else LaneCliParams.DEFAULT_FPS
+
+
+def output_stem(path: str, used: Set[str]) -> str:
+    """Name the outputs of an input after it, numbering inputs that share a name."""
+    stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    candidate, number = stem, 2
+    while candidate in used:
+        candidate, number = f"{stem}-{number}", number + 1
+    used.add(candidate)
+    return candidate
+
+
+def lane_row(index: int, result: LaneResult) -> list:
+    row = [index]
+    for lane, found in ((result.left_lane, result.left_found), (result.right_lane, result.right_found)):
+        b, a = lane.coefficients if lane.coefficients is not None else ("", "")
+        row += [int(found), b, a, lane.top_point[0], lane.bottom_point[0]]
+    return row
+
+
+def detect_sequential(frames: Iterable[np.ndarray], timings: Dict[str, float],
+                      show_stages: bool) -> Iterator[LaneResult]:
+    """Run LaneDetector over the frames in this process, timing reading and detection apart."""
+    # every result is written out before the next frame overwrites its buffers
+    detector = LaneDetector(reuse_buffers=True)
+    stages = {} if show_stages else None
+    frames = iter(frames)
+    while True:
+        started = time.perf_counter()
+        frame = next(frames, None)
+        timings["read_s"] += time.perf_counter() - started
+        if frame is None:
+            return
+        started = time.perf_counter()
+        result = detector.detect(frame, stages)
+        timings["detect_s"] += time.perf_counter() - started
+        if stages is not None:
+            for title, image in stages.items():
+                cv2.imshow(title, image)
+        yield result
+
+
+def process_input(path: str, stem: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run lane detection over one video or frame directory and write its outputs.
+
+    Returns:
+        The timing report of the input.
+    """
+    frames = read_frame_directory(path) if os.path.isdir(path) else read_video(path)
+    timings = {"read_s": 0.0, "detect_s": 0.0, "write_s": 0.0}
+    if args.workers > 1:
+        results = detect_lanes(frames, args.workers)
+    else:
+        results = detect_sequential(frames, timings, args.show_stages)
+
+    writer = None
+    rows = []
+    started = time.perf_counter()
+    count = 0
+    for count, result in enumerate(results, 1):
+        write_started = time.perf_counter()
+        if args.video:
+            if writer is None:
+                height, width = result.frame.shape[:2]
+                writer = cv2.VideoWriter(os.path.join(args.output_dir, f"{stem}_lanes.mp4"),
+                                         cv2.VideoWriter_fourcc(*LaneCliParams.VIDEO_CODEC), source_fps(path),
+                                         (width, height))
+            writer.write(result.frame)
+        if args.lanes != "none":
+            rows.append(lane_row(count - 1, result))
+        timings["write_s"] += time.perf_counter() - write_started
+        if args.show or args.show_stages:
+            if args.show:
+                cv2.imshow("Lane Detection", result.frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        writer.release()
+    if hasattr(results, "close"):
+        results.close()
+
+    write_started = time.perf_counter()
+    if args.lanes == "csv":
+        with open(os.path.join(args.output_dir, f"{stem}_lanes.csv"), "w", newline="") as file:
+            lane_writer = csv.writer(file)
+            lane_writer.writerow(LaneCliParams.CSV_COLUMNS)
+            lane_writer.writerows(rows)
+    elif args.lanes == "npz":
+        columns = np.array([[np.nan if value == "" else value for value in row] for row in rows],
+                           dtype=np.float64).reshape(-1, len(LaneCliParams.CSV_COLUMNS))
+        np.savez_compressed(os.path.join(args.output_dir, f"{stem}_lanes.npz"),
+                            **{name: columns[:, index] for index, name in enumerate(LaneCliParams.CSV_COLUMNS)})
+    timings["write_s"] += time.perf_counter() - write_started
+
+    report = {"input": path, "frames": count, "seconds": round(elapsed, 3),
+              "fps": round(count / elapsed, 1) if elapsed > 0 else None, "workers": args.workers}
+    if args.workers == 1:
+        report.update({name: round(value, 3) for name, value in timings.items()})
+    else:
+        # reading and detection overlap in the pipelined mode; only writing is timed apart
+        report["write_s"] = round(timings["write_s"], 3)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Detect lanes in videos or frame directories without a display")
+    parser.add_argument("inputs", nargs="+", help="video files, frame directories or glob patterns of them")
+    parser.add_argument("--output-dir", default="lane_output", help="where the outputs and the report are written")
+    parser.add_argument("--no-video", dest="video", action="store_false", help="do not write annotated videos")
+    parser.add_argument("--lanes", choices=["csv", "npz", "none"], default="csv",
+                        help="format of the per-frame lane coefficients")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; more than 1 runs the pipelined mode")
+    parser.add_argument("--show", action="store_true", help="show the annotated frames in a window")
+    parser.add_argument("--show-stages", action="store_true",
+                        help="show every step of the pipeline in its own window (needs --workers 1)")
+    args = parser.parse_args(argv)
+    if args.show_stages and args.workers > 1:
+        parser.error("--show-stages needs --workers 1")
+
+    try:
+        inputs = expand_inputs(args.inputs)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    reports = []
+    used_stems = set()
+    for path in inputs:
+        report = process_input(path, output_stem(path, used_stems), args)
+        reports.append(report)
+        print(f"{path}: {report['frames']} frames in {report['seconds']} s ({report['fps']} fps)")
+    if args.show or args.show_stages:
+        cv2.destroyAllWindows()
+
+    total_frames = sum(report["frames"] for report in reports)
+    total_seconds = sum(report["seconds"] for report in reports)
+    summary = {"inputs": reports, "frames": total_frames, "seconds": round(total_seconds, 3),
+               "fps": round(total_frames / total_seconds, 1) if total_seconds > 0 else None}
+    with open(os.path.join(args.output_dir, "report.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+    print(f"total: {total_frames} frames in {summary['seconds']} s ({summary['fps']} fps), "
+          f"report in {os.path.join(args.output_dir, 'report.json')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
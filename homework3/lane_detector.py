@@ -0,0 +1,357 @@
+from typing import *
+
+import cv2
+import numpy as np
+
+
+class LaneDetectorParams:
+    """A class containing parameters for LaneDetector."""
+    SCALE_DOWN = 4
+    """Frames are shrunk by this factor in both directions before processing."""
+    TRAPEZOID_TOP_Y = 0.75
+    """Height of the top edge of the road trapezoid, as a fraction of the frame height (0 is the top)."""
+    TRAPEZOID_TOP_LEFT_X = 0.46
+    """Left end of the top edge of the road trapezoid, as a fraction of the frame width."""
+    TRAPEZOID_TOP_RIGHT_X = 0.54
+    """Right end of the top edge of the road trapezoid, as a fraction of the frame width."""
+    BLUR_KSIZE = (7, 7)
+    """Size of the blur kernel applied to the top-down view."""
+    THRESHOLD = int(255 / 5)
+    """Edge strength above which a pixel counts as part of a lane marking."""
+    EDGE_MARGIN = 0.05
+    """Fraction of the frame width ignored at the left and the right edge."""
+    LEFT_LANE_COLOR = (50, 50, 250)
+    """BGR color the left lane is painted with."""
+    RIGHT_LANE_COLOR = (50, 250, 50)
+    """BGR color the right lane is painted with."""
+
+
+class Lane(NamedTuple):
+    """A lane line of the top-down view."""
+    top_point: Tuple[int, int]
+    """Where the line crosses the last row of the frame."""
+    bottom_point: Tuple[int, int]
+    """Where the line crosses row 0."""
+    coefficients: Optional[Tuple[float, float]] = None
+    """(b, a) of the fitted line y = b + a * x, in pixels of the top-down view; None for no line yet."""
+
+
+NO_LANE = Lane((0, 0), (0, 0))
+"""The lane used until a line has been found."""
+
+
+class LaneResult(NamedTuple):
+    """The outcome of lane detection on one frame."""
+    frame: np.ndarray
+    """The shrunk frame with both lanes painted over it."""
+    left_lane: Lane
+    """The left lane painted, found in this frame or carried over from an earlier one."""
+    right_lane: Lane
+    """The right lane painted, found in this frame or carried over from an earlier one."""
+    left_found: bool
+    """Whether the left lane was found in this frame."""
+    right_found: bool
+    """Whether the right lane was found in this frame."""
+
+
+class LaneDetector:
+    """
+    Lane detection pipeline for a stream of frames.
+
+    Everything that only depends on the frame size (the road mask, both
+    perspective matrices, the column ranges) is computed once and rebuilt
+    only when a frame of another size comes in. The lane lines found in the
+    last frame are kept, so a frame where a line cannot be fitted reuses it.
+
+    process() runs the whole pipeline. It is also split in three, so frames
+    can be handled out of order: find_lanes() only depends on its frame,
+    update_lanes() must see the frames in order, and draw_lanes() only
+    depends on its arguments.
+
+    With reuse_buffers, every intermediate image and the painted frame are
+    written into arrays allocated once per frame size, so a frame allocates
+    almost nothing. The images returned are then overwritten by the next
+    frame: copy them to keep them.
+    """
+    EDGE_LIMIT = (LaneDetectorParams.THRESHOLD + 0.5) ** 2
+    """
+    Squared Sobel magnitude above which a pixel is an edge.
+
+    Rounding the magnitude m to 8 bits and thresholding keeps the pixels with
+    round(m) > THRESHOLD, that is m > THRESHOLD + 0.5: m is the square root of
+    an integer, so it never equals THRESHOLD + 0.5 and rounding ties do not
+    matter. Comparing the squares skips the square root.
+    """
+
+    frame_size: Optional[Tuple[int, int]]
+    width: int
+    height: int
+    buffers: Optional[Dict[str, np.ndarray]]
+
+    def __init__(self, scale_down: int = LaneDetectorParams.SCALE_DOWN, reuse_buffers: bool = False):
+        """
+        Initialize LaneDetector.
+
+        Args:
+            scale_down: Frames are shrunk by this factor before processing. Default value is
+                LaneDetectorParams.SCALE_DOWN.
+            reuse_buffers: Write every image into buffers kept from frame to frame instead of new arrays.
+                Default value is False.
+        """
+        self.scale_down = scale_down
+        self.reuse_buffers = reuse_buffers
+        self.frame_size = None
+        self.height = self.width = 0
+        self.buffers = None
+        self.left_lane = self.right_lane = NO_LANE
+
+    def process(self, frame: np.ndarray, stages: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Find the lanes in one frame.
+
+        Args:
+            frame: A BGR frame, as read from cv2.VideoCapture.
+            stages: If given, every intermediate image is stored in it under its window title.
+
+        Returns:
+            The shrunk frame with the left and right lane painted over it.
+        """
+        return self.detect(frame, stages).frame
+
+    def detect(self, frame: np.ndarray, stages: Optional[Dict[str, np.ndarray]] = None) -> LaneResult:
+        """
+        Find the lanes in one frame, like process(), and tell which lanes were painted.
+
+        Args:
+            frame: A BGR frame, as read from cv2.VideoCapture.
+            stages: If given, every intermediate image is stored in it under its window title.
+
+        Returns:
+            The LaneResult of the frame.
+        """
+        small_frame, left_lane, right_lane = self.find_lanes(frame, stages)
+        self.update_lanes(left_lane, right_lane)
+        final = self.draw_lanes(small_frame, self.left_lane, self.right_lane, stages)
+        return LaneResult(final, self.left_lane, self.right_lane, left_lane is not None, right_lane is not None)
+
+    def find_lanes(self, frame: np.ndarray, stages: Optional[Dict[str, np.ndarray]] = None) \
+            -> Tuple[np.ndarray, Optional[Lane], Optional[Lane]]:
+        """
+        Fit the lane lines of one frame, without looking at earlier frames.
+
+        Args:
+            frame: A BGR frame, as read from cv2.VideoCapture.
+            stages: If given, the intermediate images up to '9.Lines' are stored in it.
+
+        Returns:
+            The shrunk frame, and the left and the right lane, each None if no line was found within
+            its half of the frame.
+        """
+        # with reuse_buffers every step writes into its buffer; otherwise _buffer gives None and it allocates
+        if frame.shape[:2] != self.frame_size:
+            self._prepare(frame.shape[0], frame.shape[1])
+            # lines found at another size would be meaningless here
+            self.left_lane = self.right_lane = NO_LANE
+        width, height = self.width, self.height
+
+        frame = cv2.resize(frame, (width, height), dst=self._buffer('small_frame'))
+        grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._buffer('grayscale'))
+        road = np.multiply(self.trapezoid, grayscale, out=self._buffer('road'))
+        top_down = cv2.warpPerspective(road, self.stretch_matrix, (width, height), dst=self._buffer('top_down'))
+        blur = cv2.blur(top_down, ksize=LaneDetectorParams.BLUR_KSIZE, dst=self._buffer('blur'))
+
+        squared, threshold = self.find_edges(blur)
+
+        # the lines are drawn over the edges for the '9.Lines' window, which must not show on '8.Threshold'
+        edges = threshold if stages is None else threshold.copy()
+        edges[:, :self.margin] = 0
+        edges[:, width - self.margin:] = 0
+        left_lane, right_lane = self._fit_lines(edges)
+
+        if stages is not None:
+            sobel = cv2.convertScaleAbs(cv2.sqrt(squared))
+            stages.update({'1.Original': frame, '2.Grayscale': grayscale, '3.Trapezoid': self.trapezoid * 255,
+                           '4.Road': road, '5.Top-Down': top_down, '6.Blur': blur, '7.Sobel': sobel,
+                           '8.Threshold': threshold, '9.Lines': edges})
+        return frame, left_lane, right_lane
+
+    def find_edges(self, blur: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Threshold the Sobel gradient magnitude of the blurred top-down view.
+
+        Args:
+            blur: The blurred top-down view, 8 bits.
+
+        Returns:
+            The squared gradient magnitude (float32), and the edges: 255 where it is above EDGE_LIMIT, else 0.
+        """
+        # the derivatives of 8-bit pixels and their squares (at most 2 * 1020 ** 2) are integers that float32
+        # holds exactly, so the edges are the same as with the rounded magnitude (see EDGE_LIMIT)
+        sobel_x = cv2.Sobel(blur, cv2.CV_32F, 1, 0, ksize=3, dst=self._buffer('sobel_x'))
+        sobel_y = cv2.Sobel(blur, cv2.CV_32F, 0, 1, ksize=3, dst=self._buffer('sobel_y'))
+        squared = cv2.multiply(sobel_x, sobel_x, dst=sobel_x)
+        cv2.add(squared, cv2.multiply(sobel_y, sobel_y, dst=sobel_y), dst=squared)
+        threshold = cv2.compare(squared, self.EDGE_LIMIT, cv2.CMP_GT, dst=self._buffer('threshold'))
+        return squared, threshold
+
+    def update_lanes(self, left_lane: Optional[Lane], right_lane: Optional[Lane]):
+        """
+        Take the lanes found in the next frame; a lane that was not found keeps its previous position.
+
+        Args:
+            left_lane: The left lane returned by find_lanes.
+            right_lane: The right lane returned by find_lanes.
+        """
+        if left_lane is not None:
+            self.left_lane = left_lane
+        if right_lane is not None:
+            self.right_lane = right_lane
+
+    def draw_lanes(self, small_frame: np.ndarray, left_lane: Lane, right_lane: Lane,
+                   stages: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Paint two lanes of the top-down view onto the road of a shrunk frame.
+
+        Args:
+            small_frame: A frame returned by find_lanes.
+            left_lane: The left lane.
+            right_lane: The right lane.
+            stages: If given, the images from '9.Lines' on are stored in it.
+
+        Returns:
+            A copy of small_frame with the lanes painted over it.
+        """
+        if small_frame.shape[:2] != (self.height, self.width):
+            self._prepare(small_frame.shape[0] * self.scale_down, small_frame.shape[1] * self.scale_down)
+        final_left = self._unwarp_line(left_lane, self._buffer('final_left'))
+        final_right = self._unwarp_line(right_lane, self._buffer('final_right'))
+        final = self._buffer('final')
+        if final is None:
+            final = small_frame.copy()
+        else:
+            np.copyto(final, small_frame)
+        cv2.copyTo(self.left_paint, final_left, final)
+        cv2.copyTo(self.right_paint, final_right, final)
+
+        if stages is not None:
+            lines = stages['9.Lines']
+            cv2.line(lines, left_lane.bottom_point, left_lane.top_point, (200, 0, 0), 5)
+            cv2.line(lines, right_lane.bottom_point, right_lane.top_point, (100, 0, 0), 5)
+            stages.update({'10.Final Left': final_left, '11.Final Right': final_right, '12.Final': final})
+        return final
+
+    def _prepare(self, original_height: int, original_width: int):
+        """
+        Build the state that only depends on the frame size.
+
+        Args:
+            original_height: Height of the incoming frames.
+            original_width: Width of the incoming frames.
+        """
+        self.frame_size = (original_height, original_width)
+        height = self.height = int(original_height / self.scale_down)
+        width = self.width = int(original_width / self.scale_down)
+
+        upper_left = (int(width * LaneDetectorParams.TRAPEZOID_TOP_LEFT_X),
+                      int(height * LaneDetectorParams.TRAPEZOID_TOP_Y))
+        upper_right = (int(width * LaneDetectorParams.TRAPEZOID_TOP_RIGHT_X),
+                       int(height * LaneDetectorParams.TRAPEZOID_TOP_Y))
+        lower_left = (0, height)
+        lower_right = (width, height)
+        points_of_the_trapezoid = np.array([upper_right, upper_left, lower_left, lower_right], dtype=np.int32)
+        self.trapezoid = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillConvexPoly(self.trapezoid, points_of_the_trapezoid, 1)
+
+        points_for_stretch = np.float32([(width, 0), (0, 0), lower_left, lower_right])
+        points_of_the_trapezoid = np.float32(points_of_the_trapezoid)
+        self.stretch_matrix = cv2.getPerspectiveTransform(points_of_the_trapezoid, points_for_stretch)
+        self.unstretch_matrix = cv2.getPerspectiveTransform(points_for_stretch, points_of_the_trapezoid)
+
+        self.margin = int(LaneDetectorParams.EDGE_MARGIN * width)
+        self.midpoint = int(width / 2)
+        # frames of the lane colors, copied onto the final frame where the unwarped lines are
+        self.left_paint = np.full((height, width, 3), LaneDetectorParams.LEFT_LANE_COLOR, dtype=np.uint8)
+        self.right_paint = np.full((height, width, 3), LaneDetectorParams.RIGHT_LANE_COLOR, dtype=np.uint8)
+
+        if self.reuse_buffers:
+            gray = {'grayscale', 'road', 'top_down', 'blur', 'threshold', 'blank', 'final_left', 'final_right'}
+            self.buffers = {name: np.empty((height, width), dtype=np.uint8) for name in gray}
+            self.buffers.update({name: np.empty((height, width, 3), dtype=np.uint8)
+                                 for name in ('small_frame', 'final')})
+            self.buffers.update({name: np.empty((height, width), dtype=np.float32)
+                                 for name in ('sobel_x', 'sobel_y')})
+
+    def _buffer(self, name: str) -> Optional[np.ndarray]:
+        """Return the buffer a step writes into, or None if the step should allocate its output."""
+        return self.buffers[name] if self.buffers is not None else None
+
+    def _fit_lines(self, edges: np.ndarray) -> Tuple[Optional[Lane], Optional[Lane]]:
+        """
+        Fit a line to the edge pixels of each half of the top-down view.
+
+        Args:
+            edges: The thresholded top-down view, with the side margins cleared.
+
+        Returns:
+            The left and the right lane, each None unless its line lies within its half of the frame.
+        """
+        height, midpoint = self.height, self.midpoint
+        left_lane = right_lane = None
+        left = self._line_ends(edges[:, :midpoint])
+        if left is not None and all(midpoint >= x >= 0 for x in left[:2]):
+            top_x, bottom_x, b, a = left
+            left_lane = Lane((int(top_x), height), (int(bottom_x), 0), (b, a))
+        # the right half is fitted with its columns counted from the midpoint
+        right = self._line_ends(edges[:, midpoint:])
+        if right is not None and all(self.width >= x + midpoint >= midpoint for x in right[:2]):
+            top_x, bottom_x, b, a = right
+            right_lane = Lane((int(top_x + midpoint), height), (int(bottom_x + midpoint), 0), (b - a * midpoint, a))
+        return left_lane, right_lane
+
+    def _line_ends(self, edges: np.ndarray) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Fit y = b + a * x to the edge pixels and find where the line crosses the bottom and the top of the frame.
+
+        The least squares line only needs the sums of x, y, x * x and x * y over
+        the pixels, which are the raw moments of the image, so no array of
+        pixel coordinates is built.
+
+        Args:
+            edges: Part of the thresholded top-down view; x counts from its first column.
+
+        Returns:
+            The x at the last row, the x at row 0, b and a, or None if no usable line fits.
+        """
+        moments = cv2.moments(edges, binaryImage=True)
+        count = moments['m00']
+        # the sums are integers below 2 ** 53, so they and the differences below are exact
+        spread = count * moments['m20'] - moments['m10'] * moments['m10']
+        if count < 2 or spread == 0:
+            return None
+        a = (count * moments['m11'] - moments['m10'] * moments['m01']) / spread
+        b = (moments['m01'] - a * moments['m10']) / count
+        if a == 0:
+            return None
+        top_x, bottom_x = (self.height - b) / a, -b / a
+        if not (-1e8 <= top_x <= 1e8 and -1e8 <= bottom_x <= 1e8):
+            return None
+        return top_x, bottom_x, float(b), float(a)
+
+    def _unwarp_line(self, lane: Lane, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Draw a line of the top-down view and map it back onto the road trapezoid.
+
+        Args:
+            lane: The lane to draw.
+            dst: Where the result is written. Default value is a new array.
+
+        Returns:
+            A frame that is 255 on the line and 0 elsewhere (up to interpolation at its border).
+        """
+        blank = self._buffer('blank')
+        if blank is None:
+            blank = np.zeros((self.height, self.width), dtype=np.uint8)
+        else:
+            blank.fill(0)
+        cv2.line(blank, lane.top_point, lane.bottom_point, (255, 0, 0), 3)
+        return cv2.warpPerspective(blank, self.unstretch_matrix, (self.width, self.height), dst=dst)
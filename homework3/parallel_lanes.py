@@ -0,0 +1,199 @@
+import collections
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import *
+
+import cv2
+import numpy as np
+
+from lane_detector import NO_LANE, LaneDetector, LaneResult
+
+
+class ParallelLanesParams:
+    """A class containing parameters for the pipelined lane detection."""
+    CAPTURE_QUEUE_SIZE = 8
+    """Frames the capture stage may read ahead of the processing stage."""
+    FRAMES_IN_FLIGHT_PER_WORKER = 2
+    """Frames handed to each worker process before the oldest result is collected."""
+
+
+_worker_detector = None
+_worker_ring = None
+
+
+def read_video(path: str) -> Iterator[np.ndarray]:
+    """
+    Yield the frames of a video file (or of a camera, given its index as a string).
+
+    Args:
+        path: The video path, as accepted by cv2.VideoCapture.
+    """
+    cam = cv2.VideoCapture(int(path) if path.isdigit() else path)
+    try:
+        while True:
+            ret, frame = cam.read()
+            if ret is False:
+                return
+            yield frame
+    finally:
+        cam.release()
+
+
+class FrameRing:
+    """
+    Fixed slots of shared memory that carry frames to the worker processes.
+
+    A frame is copied into a slot once and read by the worker in place, so it
+    is never pickled through a pipe. Slots are used round robin, and a slot is
+    only written again after the result of the frame in it was collected,
+    which the ordered collection in detect_lanes guarantees.
+    """
+    shm: shared_memory.SharedMemory
+    slot_bytes: int
+    slots: int
+
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        """
+        Initialize FrameRing.
+
+        Args:
+            slots: Number of frames the ring holds.
+            slot_bytes: Size of every slot.
+            name: Name of an existing ring to attach to; None creates a new one.
+        """
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=slots * slot_bytes)
+
+    def view(self, slot: int, shape: Tuple[int, ...]) -> np.ndarray:
+        """Return the frame of the given shape in a slot, without copying it."""
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _init_worker(ring_name: str, slots: int, slot_bytes: int, scale_down: int):
+    global _worker_detector, _worker_ring
+    # the workers only compute; one OpenCV thread each keeps them from fighting over the cores
+    cv2.setNumThreads(1)
+    _worker_detector = LaneDetector(scale_down)
+    _worker_ring = FrameRing(slots, slot_bytes, ring_name)
+
+
+def _process_frame(frame: Union[np.ndarray, Tuple[int, Tuple[int, ...]]]):
+    """
+    Find the lanes of one frame in a worker, and draw them if the frame found both.
+
+    Args:
+        frame: The frame itself, or the (slot, shape) of the frame in the worker's FrameRing.
+
+    Returns:
+        (final, small frame, left lane, right lane). final is None, and the small frame is sent back
+        instead, when a lane is missing and the collector has to draw the lane of an earlier frame.
+    """
+    if isinstance(frame, tuple):
+        frame = _worker_ring.view(*frame)
+    small_frame, left_lane, right_lane = _worker_detector.find_lanes(frame)
+    if left_lane is None or right_lane is None:
+        return None, small_frame, left_lane, right_lane
+    return _worker_detector.draw_lanes(small_frame, left_lane, right_lane), None, left_lane, right_lane
+
+
+def _capture(frames: Iterable[np.ndarray], captured: queue.Queue, stop: threading.Event):
+    try:
+        for frame in frames:
+            while not stop.is_set():
+                try:
+                    captured.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    finally:
+        captured.put(None)
+
+
+def detect_lanes(frames: Iterable[np.ndarray], workers: Optional[int] = None,
+                 scale_down: Optional[int] = None) -> Iterator[LaneResult]:
+    """
+    Run lane detection over a stream of frames with capture, processing and output in separate stages.
+
+    A thread reads the frames into a bounded queue; a pool of processes finds
+    the lanes, up to a fixed number of frames at once; the caller gets the
+    results in input order. They are the same as running LaneDetector.detect
+    over the frames one by one.
+
+    Args:
+        frames: The input frames, read lazily by the capture thread.
+        workers: Number of worker processes. Default value is the number of usable cores.
+        scale_down: Frames are shrunk by this factor before processing. Default value is
+            LaneDetectorParams.SCALE_DOWN.
+
+    Returns:
+        An iterator over the LaneResult of every frame, in input order.
+    """
+    workers = workers or len(os.sched_getaffinity(0))
+    detector = LaneDetector() if scale_down is None else LaneDetector(scale_down)
+    captured = queue.Queue(maxsize=ParallelLanesParams.CAPTURE_QUEUE_SIZE)
+    stop = threading.Event()
+    capture = threading.Thread(target=_capture, args=(frames, captured, stop), daemon=True)
+    capture.start()
+
+    first = captured.get()
+    if first is None:
+        capture.join()
+        return
+    in_flight = workers * ParallelLanesParams.FRAMES_IN_FLIGHT_PER_WORKER
+    ring = FrameRing(in_flight, first.nbytes)
+    pending = collections.deque()
+    shape = None
+    try:
+        # spawn, not fork: the capture thread is already running
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+                                 initargs=(ring.shm.name, in_flight, first.nbytes, detector.scale_down)) as pool:
+            try:
+                frame, index = first, 0
+                while frame is not None or pending:
+                    while frame is not None and len(pending) < in_flight:
+                        slot = index % in_flight
+                        if frame.nbytes <= ring.slot_bytes and frame.dtype == np.uint8:
+                            np.copyto(ring.view(slot, frame.shape), frame)
+                            future = pool.submit(_process_frame, (slot, frame.shape))
+                        else:
+                            # a frame larger than the slots goes through the pipe instead
+                            future = pool.submit(_process_frame, frame)
+                        pending.append((future, frame.shape))
+                        index += 1
+                        frame = captured.get()
+                    future, frame_shape = pending.popleft()
+                    final, small_frame, left_lane, right_lane = future.result()
+                    if frame_shape != shape:
+                        # as in LaneDetector.find_lanes, lanes of another size are forgotten
+                        shape = frame_shape
+                        detector.left_lane = detector.right_lane = NO_LANE
+                    detector.update_lanes(left_lane, right_lane)
+                    if final is None:
+                        final = detector.draw_lanes(small_frame, detector.left_lane, detector.right_lane)
+                    yield LaneResult(final, detector.left_lane, detector.right_lane,
+                                     left_lane is not None, right_lane is not None)
+            finally:
+                stop.set()
+                for future, _ in pending:
+                    future.cancel()
+    finally:
+        # let the capture thread see the stop flag if it is blocked on a full queue
+        while capture.is_alive():
+            try:
+                captured.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        ring.close()